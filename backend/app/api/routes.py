@@ -1,26 +1,132 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import json
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, model_validator
+from typing import Dict, List, Literal, Optional, Tuple
+from app.core.config import REQUEST_MEMORY_LIMIT_BYTES
 from app.services.book_service import BookService
-from app.services.llm_service import LLMService
-
-
-MAX_CHARS_PER_PAGE = 3000
+from app.services.job_queue import JobQueueFullError, get_job_queue
+from app.services.leases import get_lease_store
+from app.services.metadata_cache import get_metadata_cache
+from app.services.prefetch import get_prefetcher, run_foreground
+from app.services.search_index import find_phrase, get_search_index
+from app.services.summary_cache import get_summary_cache
+from app.services.summary_pipeline import ChapterRangeError, NoPlainTextError, SummaryPipeline
+from app.services.text_cache import get_text_cache
 
 
 router = APIRouter(prefix="/api")
 
 class SummarizeRequest(BaseModel):
     book_id: int
-    page_number: int
+    # Either a page to summarize up to, or a range of chapters (see GET /books/{id}/chapters)
+    page_number: Optional[int] = None
+    chapter_start: Optional[int] = None
+    chapter_end: Optional[int] = None
     text_url: Optional[str] = None
+    # "incremental" extends stored rolling summaries instead of re-reading the whole prefix;
+    # "map_reduce" summarizes chunks concurrently and combines them, for long page ranges.
+    # "retrieval" answers question from the pages up to page_number most relevant to it.
+    # Chapter ranges are always summarized chapter by chapter.
+    mode: Literal["full", "incremental", "map_reduce", "retrieval"] = "full"
+    question: Optional[str] = None
+    # The summarized text is left out of responses unless asked for; original_text_url serves it
+    include_original_text: bool = False
+
+    @model_validator(mode="after")
+    def check_range(self) -> "SummarizeRequest":
+        if (self.mode == "retrieval") != bool(self.question and self.question.strip()):
+            raise ValueError("question is required with, and only allowed in, retrieval mode")
+        if self.mode == "retrieval" and self.chapter_start is not None:
+            raise ValueError("retrieval mode takes a page_number, not chapters")
+        if self.chapter_start is None:
+            if self.chapter_end is not None:
+                raise ValueError("chapter_end requires chapter_start")
+            if self.page_number is None:
+                raise ValueError("Either page_number or chapter_start is required")
+            return self
+        if self.page_number is not None:
+            raise ValueError("page_number and chapter_start are mutually exclusive")
+        if self.chapter_end is None:
+            self.chapter_end = self.chapter_start
+        if not 1 <= self.chapter_start <= self.chapter_end:
+            raise ValueError("Chapters must satisfy 1 <= chapter_start <= chapter_end")
+        return self
+
+    @property
+    def chapters(self) -> Optional[Tuple[int, int]]:
+        if self.chapter_start is None:
+            return None
+        return self.chapter_start, self.chapter_end
 
 class SummaryResponse(BaseModel):
     summary: str
     book_title: str
     author: str
     page_number: int
-    original_text: str
+    # First page summarized (after the front matter, or the first page of the chapters)
+    start_page: int
+    # Set for chapter-range summaries; page_number is then the chapters' last page
+    chapter_start: Optional[int] = None
+    chapter_end: Optional[int] = None
+    # Only with include_original_text; cut to its last REQUEST_MEMORY_LIMIT_BYTES
+    # characters when original_text_truncated is set
+    original_text: Optional[str] = None
+    original_text_truncated: bool = False
+    # GET URL of the summarized pages (see /books/{id}/pages)
+    original_text_url: str
+    cached: bool = False
+    # Per-stage timing and token counts, reported by map_reduce, chapter and retrieval summaries
+    stages: Optional[List[Dict]] = None
+
+class PhraseMatch(BaseModel):
+    page: int
+    # Character offset of the match in the book text
+    offset: int
+    snippet: str
+
+class PhraseSearchResponse(BaseModel):
+    book_id: int
+    phrase: str
+    # Pages in the book, numbered like page_number in summary requests
+    total_pages: int
+    matches: List[PhraseMatch]
+
+class Chapter(BaseModel):
+    number: int
+    title: str
+    # Character offset of the heading, and the pages the chapter spans
+    offset: int
+    start_page: int
+    end_page: int
+
+class ChapterListResponse(BaseModel):
+    book_id: int
+    total_pages: int
+    chapters: List[Chapter]
+
+class SummaryJobResponse(BaseModel):
+    job_id: str
+    # "queued", "running", "done" or "failed"
+    status: str
+    book_id: int
+    page_number: Optional[int] = None
+    chapter_start: Optional[int] = None
+    chapter_end: Optional[int] = None
+    text_url: Optional[str] = None
+    mode: str
+    question: Optional[str] = None
+    model: str
+    # Last completed pipeline stage, and every completed stage with its details
+    stage: Optional[str] = None
+    progress: List[Dict]
+    result: Optional[SummaryResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
 
 @router.get("/books")
 async def get_books(
@@ -42,61 +148,267 @@ async def get_book(book_id: int):
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Book not found: {str(e)}")
 
+@router.get("/books/{book_id}/search", response_model=PhraseSearchResponse)
+async def find_phrase_in_book(
+    book_id: int,
+    phrase: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    text_url: Optional[str] = None,
+):
+    """Find the pages of a book containing a phrase (ignoring case and line breaks)"""
+    try:
+        pipeline = SummaryPipeline(book_id, 1, text_url)
+        try:
+            await pipeline.load_text(*await pipeline.load_book())
+            matches = await asyncio.to_thread(find_phrase, pipeline.book_text, pipeline.page_index, phrase, limit)
+        finally:
+            pipeline.close()
+    except NoPlainTextError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching book: {str(e)}")
+    return {"book_id": book_id, "phrase": phrase, "total_pages": len(pipeline.page_index), "matches": matches}
+
+@router.get("/books/{book_id}/chapters", response_model=ChapterListResponse)
+async def get_chapters(book_id: int, text_url: Optional[str] = None):
+    """List the chapters of a book, with the pages each one spans"""
+    try:
+        pipeline = SummaryPipeline(book_id, 1, text_url)
+        try:
+            await pipeline.load_text(*await pipeline.load_book())
+        finally:
+            # Only the page index is needed from here on
+            pipeline.close()
+    except NoPlainTextError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error indexing chapters: {str(e)}")
+    page_index = pipeline.page_index
+    chapters = []
+    for number, (offset, title) in enumerate(page_index.chapters, start=1):
+        start_page, end_page = page_index.chapter_page_range(number, number)
+        chapters.append({"number": number, "title": title, "offset": offset, "start_page": start_page, "end_page": end_page})
+    return {"book_id": book_id, "total_pages": len(page_index), "chapters": chapters}
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+def _byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range ("bytes=0-499", "bytes=500-", "bytes=-500")
+
+    Args:
+        range_header: Value of the Range header
+        size: Length of the full body in bytes
+
+    Returns:
+        (start, end) byte offsets, end exclusive, or None for ranges that are
+        ignored (other units, several ranges, malformed) so the full body is sent
+
+    Raises:
+        ValueError: If the range lies outside the body
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) + 1 if last else size
+        else:
+            start, end = max(size - int(last), 0), size
+    except ValueError:
+        return None
+    end = min(end, size)
+    if start >= end:
+        raise ValueError(f"Range {spec} is outside the {size} bytes")
+    return start, end
+
+@router.get("/books/{book_id}/pages")
+async def get_pages(
+    book_id: int,
+    request: Request,
+    first_page: int = Query(1, alias="from", ge=1),
+    last_page: Optional[int] = Query(None, alias="to", ge=1),
+    text_url: Optional[str] = None,
+):
+    """
+    Get the text of pages from..to (only page from when to is omitted) as plain text
+
+    Responses carry an ETag and support conditional requests (If-None-Match)
+    and single byte ranges (Range, If-Range) of the UTF-8 text.
+    """
+    last_page = last_page or first_page
+    pipeline = SummaryPipeline(book_id, last_page, text_url)
+    try:
+        try:
+            await pipeline.load_text(*await pipeline.load_book())
+        except NoPlainTextError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error loading pages: {str(e)}")
+        return _pages_response(pipeline, request, first_page, last_page)
+    finally:
+        pipeline.close()
+
+def _pages_response(pipeline: SummaryPipeline, request: Request, first_page: int, last_page: int) -> Response:
+    page_index = pipeline.page_index
+    if first_page > last_page or first_page > len(page_index):
+        raise HTTPException(status_code=400, detail=f"Pages {first_page}-{last_page} are not in this book ({len(page_index)} pages)")
+    last_page = min(last_page, len(page_index))
+    start, end = page_index.page_span(first_page, last_page)
+    if end - start > REQUEST_MEMORY_LIMIT_BYTES:
+        raise HTTPException(status_code=413, detail=f"Pages {first_page}-{last_page} are too long; request fewer pages")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=3600",
+        "X-Total-Pages": str(len(page_index)),
+    }
+    body = None
+    if pipeline.text_digest is not None:
+        # Cached texts are content-addressed, so the ETag is known without reading the pages
+        headers["ETag"] = f'"{pipeline.text_digest[:16]}-{start}-{end}"'
+    else:
+        body = pipeline.book_text[start:end].encode("utf-8")
+        headers["ETag"] = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    if _etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if body is None:
+        body = pipeline.book_text[start:end].encode("utf-8")
+
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", headers["ETag"]) == headers["ETag"]:
+        try:
+            byte_range = _byte_range(range_header, len(body))
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(body)}"})
+        if byte_range is not None:
+            byte_start, byte_end = byte_range
+            # Byte ranges refer to the uncompressed text, so partial responses are never gzipped
+            headers.update({"Content-Range": f"bytes {byte_start}-{byte_end - 1}/{len(body)}", "Content-Encoding": "identity"})
+            return Response(body[byte_start:byte_end], status_code=206, media_type="text/plain; charset=utf-8", headers=headers)
+    return Response(body, media_type="text/plain; charset=utf-8", headers=headers)
+
+def cache_stats() -> Dict[str, Optional[Dict[str, int]]]:
+    """Counters of the server-side caches, the job queue and prefetching (None when disabled)"""
+    text_cache = get_text_cache()
+    summary_cache = get_summary_cache()
+    search_index = get_search_index()
+    lease_store = get_lease_store()
+    prefetcher = get_prefetcher()
+    return {
+        "text": dict(text_cache.stats) if text_cache is not None else None,
+        "metadata": dict(get_metadata_cache().stats),
+        "summaries": dict(summary_cache.stats) if summary_cache is not None else None,
+        "search_index": dict(search_index.stats) if search_index is not None else None,
+        "leases": dict(lease_store.stats) if lease_store is not None else None,
+        "jobs": get_job_queue().snapshot(),
+        "prefetch": prefetcher.snapshot() if prefetcher is not None else None,
+    }
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss counters for the server-side caches"""
+    return cache_stats()
+
+@router.delete("/summaries")
+async def invalidate_summaries(book_id: Optional[int] = None):
+    """Invalidate cached summaries for one book, or for every book when book_id is omitted"""
+    summary_cache = get_summary_cache()
+    if summary_cache is None:
+        return {"deleted": 0}
+    deleted = await asyncio.to_thread(summary_cache.invalidate, book_id)
+    return {"deleted": deleted}
+
 @router.post("/summarize", response_model=SummaryResponse)
 async def summarize_book(request: SummarizeRequest):
-    """Summarize a book up to a specified page"""
+    """Summarize a book up to a specified page, or a range of chapters"""
     try:
-        # Get book details
-        book_data = await BookService.get_book_by_id(request.book_id)
-        
-        # Find text URL if not provided
-        text_url = request.text_url
-        if not text_url:
-            # Try to find a text/plain format in the book formats
-            formats = book_data.get("formats", {})
-            for format_type, url in formats.items():
-                if "text/plain" in format_type:
-                    text_url = url
-                    break
-            
-            if not text_url:
-                raise HTTPException(status_code=400, detail="No plain text format available for this book")
-        
-        # Download book text
-        book_text = BookService.download_book_text(text_url)
-
-        # Add page numbers to book_text
-        pagified_book_text = BookService.paginate_text(book_text, max_chars_per_page=MAX_CHARS_PER_PAGE)
-        
-        # Extract text up to the specified page and generate summary for that text using LLM
-        llm_service = LLMService()
-
-        # Get page number of first important text
-        page_number_response = llm_service.get_page_number(pagified_book_text)
-        
-        # Parse the page number from the LLM response
-        import re
-        page_match = re.search(r'Page\s*(\d+)', page_number_response)
-        if page_match:
-            first_page_of_important_text = int(page_match.group(1))
-        else:
-            # Default to page 1 if we can't parse the page number
-            first_page_of_important_text = 1
-
-        # Extract only the important text
-        text_to_summarize = BookService.extract_text_to_page(pagified_book_text, first_page_of_important_text, MAX_CHARS_PER_PAGE, request.page_number)
-
-        # Generate summary
-        summary = llm_service.summarize_text(text_to_summarize)
-        
-        return SummaryResponse(
-            summary=summary,
-            book_title=book_data.get("title", "Unknown"),
-            author=book_data.get("authors", [{"name": "Unknown"}])[0].get("name", "Unknown"),
-            page_number=request.page_number,
-            original_text=text_to_summarize
+        pipeline = SummaryPipeline(
+            request.book_id, request.page_number, request.text_url, request.mode,
+            chapters=request.chapters, question=request.question,
         )
+        return SummaryResponse(**await run_foreground(pipeline, include_original_text=request.include_original_text))
+    except (NoPlainTextError, ChapterRangeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
+
+def _sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/summarize/stream")
+async def stream_summary(request: SummarizeRequest):
+    """
+    Summarize a book up to a specified page, streaming Server-Sent Events
+    
+    Emits "progress" events as pipeline stages complete, "token" events as the
+    summary is generated, then a final "done" event with the SummaryResponse
+    fields (or an "error" event).
+    """
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def on_progress(stage: str, details: Dict) -> None:
+        await events.put(_sse_event("progress", {"stage": stage, **details}))
+
+    async def on_token(text: str) -> None:
+        await events.put(_sse_event("token", {"text": text}))
+
+    async def run_pipeline() -> None:
+        try:
+            pipeline = SummaryPipeline(
+                request.book_id, request.page_number, request.text_url, request.mode, on_progress, request.chapters,
+                request.question,
+            )
+            result = await run_foreground(pipeline, on_token=on_token, include_original_text=request.include_original_text)
+            await events.put(_sse_event("done", SummaryResponse(**result).model_dump()))
+        except Exception as e:
+            await events.put(_sse_event("error", {"detail": f"Error generating summary: {str(e)}"}))
+        finally:
+            await events.put(None)
+
+    async def event_stream():
+        task = asyncio.create_task(run_pipeline())
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+        finally:
+            # The client went away; stop generating
+            task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/summarize/jobs", response_model=SummaryJobResponse, status_code=202)
+async def submit_summary_job(request: SummarizeRequest):
+    """
+    Queue a summary to be generated in the background
+    
+    Returns right away with a job ID to poll. An identical request that is
+    still queued or running returns the existing job.
+    """
+    try:
+        job, _ = get_job_queue().submit(
+            request.book_id, request.page_number, request.text_url, request.mode,
+            chapters=request.chapters, include_original_text=request.include_original_text,
+            question=request.question,
+        )
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return job.to_dict()
+
+@router.get("/summarize/jobs/{job_id}", response_model=SummaryJobResponse)
+async def get_summary_job(job_id: str):
+    """Get the status, progress and (once done) result of a summary job"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Summary job not found: {job_id}")
+    return job.to_dict()
@@ -0,0 +1,287 @@
+"""
+Warm the caches for a corpus of Gutenberg books ahead of traffic.
+
+Run from the backend directory:
+    python -m app.batch --ids 1342 84 2701
+    python -m app.batch --search "dickens" --top 50 --checkpoints 10 50 100
+    python -m app.batch --top 100 --workers 8 --concurrency 16
+
+For every book this downloads the text into the text cache, paginates it and
+stores the page index (with token estimates), detects where the content starts
+and, with --checkpoints, generates summaries up to those pages. Everything is
+written to the same caches the API reads (CACHE_DIR). Downloads and LLM calls
+run on an async pool of --concurrency books; pagination and front-matter
+detection run on a pool of --workers processes.
+
+Finished books are appended to a state file, so an interrupted run resumes
+where it stopped when started again with the same arguments.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.core.config import CACHE_DIR, FRONT_MATTER_MIN_CONFIDENCE, MAX_CHARS_PER_PAGE
+from app.services.book_service import BookService
+from app.services.front_matter import ContentStart, detect_content_start, index_chapters
+from app.services.http_clients import close_clients
+from app.services.llm_backends import get_llm_backend
+from app.services.llm_service import PROMPT_VERSION
+from app.services.metadata_cache import get_metadata_cache
+from app.services.page_index import PageIndex
+from app.services.summary_cache import get_summary_cache
+from app.services.summary_pipeline import SummaryPipeline
+from app.services.text_cache import get_text_cache
+from app.services.tokens import count_page_tokens, get_tokenizer
+
+
+def prepare_text(text: str, max_chars_per_page: int) -> Tuple[bytes, ContentStart]:
+    """
+    Run the CPU-bound stages for one book (in a worker process)
+
+    Args:
+        text: The raw book text
+        max_chars_per_page: Page size
+
+    Returns:
+        Tuple of the serialised page index (with token estimates and chapters) and the detected content start
+    """
+    page_index = BookService.build_page_index(text, max_chars_per_page)
+    tokenizer = get_tokenizer()
+    page_index.set_page_tokens(count_page_tokens(text, page_index, tokenizer), tokenizer.name)
+    page_index.set_chapters(*index_chapters(text))
+    return page_index.to_bytes(), detect_content_start(text)
+
+
+class BatchState:
+    """
+    Append-only record of finished books, so an interrupted run can resume
+
+    Each line is a JSON object with the book ID and the run fingerprint;
+    a book only counts as done for runs with the same fingerprint.
+    """
+
+    def __init__(self, path: str, fingerprint: str):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.done: Set[int] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interruption
+                        continue
+                    if record.get("fingerprint") == fingerprint and record.get("status") == "done":
+                        self.done.add(record["book_id"])
+
+    def record(self, book_id: int, status: str, **details: Any) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"book_id": book_id, "status": status, "fingerprint": self.fingerprint, **details}) + "\n")
+        if status == "done":
+            self.done.add(book_id)
+
+
+class BatchProcessor:
+    """Runs the cache-warming pipeline over a list of books"""
+
+    def __init__(
+        self,
+        executor: Executor,
+        checkpoints: Optional[List[int]] = None,
+        mode: str = "incremental",
+        concurrency: int = 8,
+        state: Optional[BatchState] = None,
+    ):
+        self.executor = executor
+        self.checkpoints = sorted(set(checkpoints or []))
+        self.mode = mode
+        self.concurrency = concurrency
+        self.state = state
+        self.stats: Dict[str, float] = {"books": 0, "skipped": 0, "failed": 0, "pages": 0, "summaries": 0}
+        self.started = time.perf_counter()
+
+    async def process_book(self, book_id: int) -> Dict[str, Any]:
+        """
+        Warm every cache for one book
+
+        Args:
+            book_id: ID of the book
+
+        Returns:
+            Dict with the page count, start page and summarized checkpoints
+        """
+        pipeline = SummaryPipeline(book_id, 1, mode=self.mode)
+        text_url, text_format = await pipeline.load_book()
+        book_text, digest = await BookService.fetch_book_text(text_url, book_id, text_format)
+        pipeline.book_text, pipeline.text_digest, pipeline.source_url = book_text, digest, text_url
+        try:
+            loop = asyncio.get_running_loop()
+            index_bytes, content_start = await loop.run_in_executor(self.executor, prepare_text, book_text, MAX_CHARS_PER_PAGE)
+            page_index = PageIndex.from_bytes(index_bytes)
+            text_cache = get_text_cache()
+            if text_cache is not None and digest is not None:
+                await asyncio.to_thread(text_cache.store_page_index, digest, page_index)
+            pipeline.page_index = page_index
+            # Compacted once here, so summary requests for the book start from the stored text
+            await pipeline.compact_text()
+
+            # Confident detections are stored right away; uncertain ones need the LLM
+            # fallback, which only runs when summaries are requested
+            summary_cache = get_summary_cache()
+            start_page = page_index.page_for_offset(content_start.offset)
+            if content_start.confidence >= FRONT_MATTER_MIN_CONFIDENCE and summary_cache is not None:
+                await asyncio.to_thread(
+                    summary_cache.set_content_start, book_id, pipeline.llm_service.model, PROMPT_VERSION,
+                    MAX_CHARS_PER_PAGE, pipeline.text_key(), start_page, content_start.offset, content_start.method
+                )
+            if self.checkpoints:
+                start_page = await pipeline.resolve_start()
+
+            summarized = []
+            for checkpoint in self.checkpoints:
+                if checkpoint > len(page_index):
+                    break
+                pipeline.page_number, pipeline.mode = checkpoint, self.mode
+                await pipeline.summarize()
+                summarized.append(checkpoint)
+            return {"pages": len(page_index), "start_page": start_page, "checkpoints": summarized}
+        finally:
+            pipeline.close()
+
+    async def run(self, book_ids: List[int]) -> Dict[str, float]:
+        """
+        Process books with at most `concurrency` in flight, skipping finished ones
+
+        Args:
+            book_ids: IDs of the books to process
+
+        Returns:
+            Final throughput stats
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(book_id: int) -> None:
+            if self.state is not None and book_id in self.state.done:
+                self.stats["skipped"] += 1
+                return
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await self.process_book(book_id)
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    print(f"Book {book_id} failed: {str(e)}")
+                    if self.state is not None:
+                        self.state.record(book_id, "failed", error=str(e))
+                    return
+                self.stats["books"] += 1
+                self.stats["pages"] += result["pages"]
+                self.stats["summaries"] += len(result["checkpoints"])
+                if self.state is not None:
+                    self.state.record(book_id, "done", seconds=round(time.perf_counter() - start, 3), **result)
+                print(f"Book {book_id}: {result['pages']} pages, starts on page {result['start_page']}  {self.report()}")
+
+        await asyncio.gather(*(run_one(book_id) for book_id in book_ids))
+        return self.throughput()
+
+    def throughput(self) -> Dict[str, float]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            **self.stats,
+            "seconds": round(elapsed, 3),
+            "books_per_minute": round(self.stats["books"] * 60 / elapsed, 2),
+            "pages_per_second": round(self.stats["pages"] / elapsed, 1),
+        }
+
+    def report(self) -> str:
+        stats = self.throughput()
+        return (
+            f"[{int(stats['books'])} done, {int(stats['skipped'])} skipped, {int(stats['failed'])} failed; "
+            f"{stats['books_per_minute']} books/min, {stats['pages_per_second']} pages/s]"
+        )
+
+
+async def find_books(search: Optional[str], top: int) -> List[int]:
+    """
+    List book IDs from gutendex (most downloaded first)
+
+    The search results already carry each book's formats, so they are put in
+    the metadata cache to save a lookup per book.
+
+    Args:
+        search: Optional search term
+        top: Number of books to return
+
+    Returns:
+        Up to top book IDs
+    """
+    book_ids: List[int] = []
+    page = 1
+    while len(book_ids) < top:
+        results = await BookService.get_books(search_query=search, page=page)
+        for book in results.get("results", []):
+            get_metadata_cache().set(("book", book["id"]), book)
+            book_ids.append(book["id"])
+        if not results.get("next"):
+            break
+        page += 1
+    return book_ids[:top]
+
+
+def run_fingerprint(checkpoints: List[int], mode: str, model: str) -> str:
+    """Identify the outputs of a run, so resuming only skips books done with the same settings"""
+    settings = json.dumps([sorted(set(checkpoints)), mode, model, PROMPT_VERSION, MAX_CHARS_PER_PAGE])
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:12]
+
+
+async def run_batch(args: argparse.Namespace) -> Dict[str, float]:
+    book_ids = list(args.ids or [])
+    if args.search is not None or args.top:
+        book_ids.extend(await find_books(args.search, args.top or 20))
+    book_ids = list(dict.fromkeys(book_ids))
+
+    state = None
+    if not args.no_resume:
+        state = BatchState(args.state, run_fingerprint(args.checkpoints or [], args.mode, get_llm_backend().model))
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 0 else ThreadPoolExecutor(1)
+    try:
+        processor = BatchProcessor(executor, args.checkpoints, args.mode, args.concurrency, state)
+        print(f"Processing {len(book_ids)} books")
+        stats = await processor.run(book_ids)
+    finally:
+        executor.shutdown()
+        await close_clients()
+    print(f"Finished: {processor.report()}")
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, float]:
+    parser = argparse.ArgumentParser(
+        prog="python -m app.batch", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--ids", type=int, nargs="+", help="Book IDs to process")
+    parser.add_argument("--search", help="Process books matching this gutendex search")
+    parser.add_argument("--top", type=int, default=0, help="Number of books to take from gutendex (most downloaded first)")
+    parser.add_argument("--checkpoints", type=int, nargs="+", help="Also summarize up to these pages")
+    parser.add_argument(
+        "--mode", choices=["full", "incremental", "map_reduce"], default="incremental",
+        help="Summarization mode for checkpoints (incremental reuses earlier checkpoints)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for pagination and detection (0 = one thread)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Books downloading or summarizing at once")
+    parser.add_argument("--state", default=os.path.join(CACHE_DIR, "batch-state.jsonl"), help="File recording finished books")
+    parser.add_argument("--no-resume", action="store_true", help="Process every book even if a previous run finished it")
+    args = parser.parse_args(argv)
+    if not args.ids and args.search is None and not args.top:
+        parser.error("give --ids, --search or --top")
+    return asyncio.run(run_batch(args))
+
+
+if __name__ == "__main__":
+    main()
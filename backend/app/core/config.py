@@ -1,19 +1,199 @@
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
+from dataclasses import dataclass, field, fields
+from typing import Any, List, Mapping, Optional
 
 # API settings
 API_PREFIX = "/api"
 
-# Book source settings
-GUTENBERG_API_URL = "https://gutendex.com/books/"
-
-# LLM settings
-# Ollama settings (local deployment)
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-LLM_MODEL = os.getenv("LLM_MODEL", "llama2")
+# Pagination settings
+MAX_CHARS_PER_PAGE = 3000
 
 # Project directories
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_TRUE = ("1", "true", "yes")
+
+
+def _split(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Settings read from the environment (and a .env file) once per process
+
+    Every field is set by the environment variable of the same name in upper
+    case. The settings are also importable as module constants of that name,
+    e.g. `from app.core.config import LLM_MODEL`.
+    """
+
+    # Book source settings
+    gutenberg_api_url: str = "https://gutendex.com/books/"
+
+    # LLM settings
+    # "ollama", "openai" (any OpenAI-compatible server such as llama.cpp or vLLM) or "fake"
+    llm_backend: str = field(default="ollama", metadata={"lower": True})
+    # Ollama settings (local deployment). OLLAMA_HOST and LLM_MODEL may list several
+    # comma-separated replicas; one model is used on every host, otherwise they pair up
+    ollama_host: str = "http://localhost:11434"
+    llm_model: str = "llama2"
+    # OpenAI-compatible server settings (comma-separated replicas, like OLLAMA_HOST)
+    openai_api_base: str = "http://localhost:8080"
+    openai_api_key: Optional[str] = None
+    # Retries of connection errors and 429/502/503/504 responses, with jittered exponential backoff
+    llm_max_retries: int = 3
+    llm_retry_base_delay: float = 0.5
+    llm_retry_max_delay: float = 8.0
+    # Adaptive (AIMD) concurrency limit per replica
+    llm_concurrency_initial: int = 4
+    llm_concurrency_min: int = 1
+    llm_concurrency_max: int = 32
+    llm_latency_target_seconds: float = 45.0
+    # Token budgeting: context window for every model (0 uses the built-in per-model table)
+    # and the token counter ("heuristic", or "tiktoken" when that package is installed)
+    llm_context_tokens: int = 0
+    llm_tokenizer: str = field(default="heuristic", metadata={"lower": True})
+    # Batching of small prompts, for backends with a batch API (1 disables it)
+    llm_batch_size: int = 8
+    llm_batch_window_seconds: float = 0.01
+    llm_batch_max_prompt_tokens: int = 2048
+
+    # Cache settings
+    cache_dir: str = field(default_factory=lambda: os.path.join(ROOT_DIR, ".cache"))
+    text_cache_enabled: bool = True
+    text_cache_max_bytes: int = 2 * 1024 ** 3
+    text_cache_revalidate_seconds: int = 24 * 60 * 60
+    metadata_cache_ttl_seconds: int = 60 * 60
+    metadata_cache_max_entries: int = 2048
+    summary_cache_enabled: bool = True
+    summary_cache_max_entries: int = 10000
+    summary_cache_ttl_seconds: int = 0
+    # Local full-text index answering book searches before gutendex; page texts are
+    # only indexed (as books are downloaded) when SEARCH_INDEX_FULL_TEXT is on
+    search_index_enabled: bool = True
+    search_index_full_text: bool = False
+    # Cross-process single-flight: workers sharing CACHE_DIR take a lease before downloading a
+    # text or generating a summary, and the others wait for the result. A lease is renewed
+    # while its holder works and expires SINGLE_FLIGHT_LEASE_SECONDS after a holder dies
+    single_flight_enabled: bool = True
+    single_flight_lease_seconds: float = 60.0
+    single_flight_poll_seconds: float = 0.2
+
+    # Summarization settings
+    incremental_segment_pages: int = 10
+    map_reduce_chunk_tokens: int = 2000
+    map_reduce_max_concurrency: int = 4
+    # Retrieval mode: page embeddings from EMBEDDING_BACKEND ("ollama" or "fake"), computed
+    # EMBEDDING_BATCH_SIZE pages per call, and up to RETRIEVAL_TOP_K pages per prompt
+    embedding_backend: str = field(default="ollama", metadata={"lower": True})
+    embedding_model: str = "nomic-embed-text"
+    embedding_batch_size: int = 32
+    retrieval_top_k: int = 8
+    # Prompt compaction: summarization prompts get the book text with hard line wraps, illustration
+    # tags, footnote markers, decoration lines and repeated whitespace removed (compacted once per book)
+    prompt_compaction_enabled: bool = True
+    front_matter_min_confidence: float = 0.6
+    front_matter_llm_pages: int = 20
+    # Most book text a request holds in memory at once. Larger texts are read through
+    # a memory map, and original_text in responses is cut to this many characters.
+    request_memory_limit_bytes: int = 32 * 1024 ** 2
+
+    # Response compression: gzip bodies of at least RESPONSE_GZIP_MIN_BYTES for clients that
+    # accept it (Server-Sent Events are never compressed)
+    response_gzip_enabled: bool = True
+    response_gzip_min_bytes: int = 1024
+    response_gzip_level: int = 3
+
+    # Background summary job settings
+    summary_job_workers: int = 8
+    summary_job_model_concurrency: int = 2
+    summary_job_max_queued: int = 1000
+    summary_job_max_finished: int = 1000
+
+    # Speculative prefetch: after an incremental summary for page N, precompute the next
+    # PREFETCH_CHECKPOINTS segment checkpoints while no request is running (at most
+    # PREFETCH_MAX_PENDING waiting). Prefetched checkpoints unused after
+    # PREFETCH_WASTE_AFTER_SECONDS count as wasted
+    prefetch_enabled: bool = False
+    prefetch_checkpoints: int = 2
+    prefetch_max_pending: int = 32
+    prefetch_waste_after_seconds: float = 3600.0
+
+    # Observability settings: log level and format ("json" or "text"), Prometheus
+    # metrics on /metrics, and Server-Timing response headers with per-stage timings
+    log_level: str = "INFO"
+    log_format: str = field(default="json", metadata={"lower": True})
+    metrics_enabled: bool = True
+    server_timing_enabled: bool = False
+
+    @property
+    def ollama_hosts(self) -> List[str]:
+        return _split(self.ollama_host)
+
+    @property
+    def llm_models(self) -> List[str]:
+        return _split(self.llm_model)
+
+    @property
+    def openai_api_bases(self) -> List[str]:
+        return _split(self.openai_api_base)
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        """
+        Read the settings from environment variables
+
+        Args:
+            environ: The environment (unset variables keep their defaults)
+
+        Returns:
+            The Settings
+
+        Raises:
+            ValueError: If a variable cannot be parsed as its setting's type
+        """
+        values = {}
+        for setting in fields(cls):
+            name = setting.name.upper()
+            raw = environ.get(name)
+            if raw is None:
+                continue
+            try:
+                if setting.type is bool:
+                    value: Any = raw.strip().lower() in _TRUE
+                elif setting.type in (int, float):
+                    value = setting.type(raw)
+                else:
+                    value = raw.lower() if setting.metadata.get("lower") else raw
+            except ValueError:
+                raise ValueError(f"{name} must be {setting.type.__name__}, got {raw!r}") from None
+            values[setting.name] = value
+        return cls(**values)
+
+
+_settings: Optional[Settings] = None
+
+
+def get_settings() -> Settings:
+    """
+    Get the process-wide settings, reading the environment and .env on first use
+
+    Returns:
+        The Settings
+    """
+    global _settings
+    if _settings is None:
+        from dotenv import load_dotenv
+
+        # Load environment variables from .env file
+        load_dotenv()
+        _settings = Settings.from_env()
+    return _settings
+
+
+def __getattr__(name: str) -> Any:
+    # Settings also read as module constants: LLM_MODEL is get_settings().llm_model
+    if name.isupper() and hasattr(get_settings(), name.lower()):
+        return getattr(get_settings(), name.lower())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
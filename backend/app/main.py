@@ -1,8 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router as api_router
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api.routes import cache_stats, router as api_router
+from app.core.config import RESPONSE_GZIP_ENABLED, RESPONSE_GZIP_LEVEL, RESPONSE_GZIP_MIN_BYTES
+from app.core.log import configure_logging
+from app.services.http_clients import close_clients
+from app.services.job_queue import get_job_queue
+from app.services.metrics import REGISTRY, MetricsMiddleware, gauge_lines
+from app.services.prefetch import get_prefetcher
+from app.services.readiness import get_readiness
 
-app = FastAPI(title="Book Summarizer API")
+configure_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the caches and clients in the background; /ready reports when they are warm
+    readiness = get_readiness()
+    readiness.start()
+    yield
+    await readiness.stop()
+    # The job and prefetch workers are created lazily on first use
+    await get_job_queue().close()
+    prefetcher = get_prefetcher()
+    if prefetcher is not None:
+        await prefetcher.close()
+    await close_clients()
+
+app = FastAPI(title="Book Summarizer API", lifespan=lifespan)
 
 # Configure CORS for frontend
 app.add_middleware(
@@ -11,11 +37,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+if RESPONSE_GZIP_ENABLED:
+    app.add_middleware(GZipMiddleware, minimum_size=RESPONSE_GZIP_MIN_BYTES, compresslevel=RESPONSE_GZIP_LEVEL)
+# Time every request (added last, so it also covers the CORS middleware)
+app.add_middleware(MetricsMiddleware)
 
 # Include API routes
 app.include_router(api_router)
 
+# The cache and job counters are kept by the services themselves; export them on every scrape
+REGISTRY.collectors.append(lambda: gauge_lines(
+    "book_summarizer_cache_stats", "Counters of the server-side caches, the job queue and prefetching", ("cache", "stat"),
+    {(cache, stat): value for cache, stats in cache_stats().items() if stats for stat, value in stats.items()},
+))
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Book Summarizer API"}
@@ -23,3 +60,14 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+async def ready_check():
+    """Readiness: 200 once the caches and clients are warm, 503 while starting up or shutting down"""
+    readiness = get_readiness()
+    return JSONResponse(readiness.snapshot(), status_code=200 if readiness.ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: request and stage latency histograms, sizes and cache counters"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
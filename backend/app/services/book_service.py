@@ -1,7 +1,19 @@
-import httpx
-import requests
-from typing import Dict, List, Optional
-from app.core.config import GUTENBERG_API_URL
+import asyncio
+import itertools
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.core.config import GUTENBERG_API_URL, REQUEST_MEMORY_LIMIT_BYTES
+from app.services.book_text import BookText, MappedText, download_text
+from app.services.compaction import COMPACTION_VERSION, compact_book
+from app.services.http_clients import get_gutenberg_client
+from app.services.metadata_cache import get_metadata_cache
+from app.services.metrics import record_cache, record_size
+from app.services.page_index import PageIndex
+from app.services.search_index import get_search_index
+from app.services.text_cache import cache_key, get_text_cache
+from app.services.tokens import count_page_tokens, get_tokenizer
+
+# Books per page of gutendex's search results (it has no page size parameter)
+GUTENDEX_PAGE_SIZE = 32
 
 class BookService:
     """Service for retrieving books from Project Gutenberg"""
@@ -14,23 +26,46 @@ class BookService:
     ) -> Dict:
         """
         Fetch a list of books from Project Gutenberg
+
+        Searches are answered from the local search index when it has every
+        book gutendex reported for the search, and go to gutendex otherwise.
+        Books fetched from gutendex are added to the index along with the
+        number of books the search matches upstream. Local pages hold
+        GUTENDEX_PAGE_SIZE books like gutendex's, so paging through a search
+        never skips or repeats books when the source changes between pages.
         
         Args:
             search_query: Optional search term
             page: Page number for pagination
-            limit: Number of results per page
+            limit: Unused; gutendex pages always hold GUTENDEX_PAGE_SIZE books
             
         Returns:
             Dict containing book data
         """
+        search_index = get_search_index()
+        if search_query and search_index is not None:
+            local = await asyncio.to_thread(search_index.search, search_query, page, GUTENDEX_PAGE_SIZE, True)
+            record_cache("search_index", "hit" if local is not None else "miss")
+            if local is not None:
+                return local
+
         params = {"page": page}
         if search_query:
             params["search"] = search_query
-            
-        async with httpx.AsyncClient() as client:
+
+        async def load() -> Dict:
+            client = get_gutenberg_client()
             response = await client.get(GUTENBERG_API_URL, params=params, timeout=10.0, follow_redirects=True)
             response.raise_for_status()
-            return response.json()
+            data = response.json()
+            if search_index is not None:
+                await asyncio.to_thread(search_index.add_books, data.get("results") or [])
+                if search_query and isinstance(data.get("count"), int):
+                    await asyncio.to_thread(search_index.record_search, search_query, data["count"])
+            return data
+
+        # Concurrent identical searches share a single upstream request
+        return await get_metadata_cache().get_or_load(("books", search_query or "", page), load)
     
     @staticmethod
     async def get_book_by_id(book_id: int) -> Dict:
@@ -43,26 +78,149 @@ class BookService:
         Returns:
             Dict containing book data
         """
-        # GUTENBERG_API_URL already ends with '/', and we need to add another trailing slash after the book ID
-        async with httpx.AsyncClient() as client:
+        loaded = False
+
+        async def load() -> Dict:
+            nonlocal loaded
+            loaded = True
+            # GUTENBERG_API_URL already ends with '/', and we need to add another trailing slash after the book ID
+            client = get_gutenberg_client()
             response = await client.get(f"{GUTENBERG_API_URL}{book_id}/", timeout=10.0, follow_redirects=True)
             response.raise_for_status()
-            return response.json()
+            book = response.json()
+            search_index = get_search_index()
+            if search_index is not None:
+                await asyncio.to_thread(search_index.add_books, [book])
+            return book
+
+        book = await get_metadata_cache().get_or_load(("book", book_id), load)
+        record_cache("metadata", "miss" if loaded else "hit", stage="metadata")
+        return book
     
     @staticmethod
-    def download_book_text(text_url: str) -> str:
+    async def download_book_text(text_url: str, book_id: Optional[int] = None, format_type: str = "text/plain") -> BookText:
         """
         Download the plain text content of a book
         
         Args:
             text_url: URL to the plain text version of the book
+            book_id: Optional book ID, used to key the text cache
+            format_type: MIME type of the format the URL points to
+            
+        Returns:
+            The book text (a MappedText when larger than REQUEST_MEMORY_LIMIT_BYTES)
+        """
+        book_text, _ = await BookService.fetch_book_text(text_url, book_id, format_type)
+        return book_text
+
+    @staticmethod
+    async def fetch_book_text(
+        text_url: str, book_id: Optional[int] = None, format_type: str = "text/plain", custom_url: bool = False
+    ) -> Tuple[BookText, Optional[str]]:
+        """
+        Get the plain text content of a book, going through the text cache when enabled
+
+        The download is streamed to disk. Texts larger than REQUEST_MEMORY_LIMIT_BYTES
+        are returned as a MappedText, so only the pages that are used get decoded.
+        
+        Args:
+            text_url: URL to the plain text version of the book
+            book_id: Optional book ID, used to key the text cache
+            format_type: MIME type of the format the URL points to
+            custom_url: Whether text_url is not one of the book's gutendex formats (see cache_key)
+            
+        Returns:
+            Tuple of the book text and its cache digest (None when the cache is disabled)
+        """
+        client = get_gutenberg_client()
+        text_cache = get_text_cache()
+        if text_cache is None:
+            book_text, size = await download_text(client, text_url)
+            record_size("bytes", size)
+            return book_text, None
+
+        with await text_cache.fetch(cache_key(book_id, format_type, text_url, custom_url), text_url, client) as cached_text:
+            record_cache("text", cached_text.cache_status, stage="download")
+            record_size("bytes", len(cached_text))
+            if len(cached_text) > REQUEST_MEMORY_LIMIT_BYTES:
+                try:
+                    return MappedText.open(cached_text.path, cached_text.charset), cached_text.digest
+                except ValueError:
+                    # Multi-byte charsets other than UTF-8 cannot be mapped
+                    pass
+            return cached_text.decode(), cached_text.digest
+
+    @staticmethod
+    def get_page_index(text: BookText, max_chars_per_page: int, digest: Optional[str] = None) -> PageIndex:
+        """
+        Load the page index stored with a cached text, building and storing it if missing
+
+        The index carries per-page token estimates from the configured tokenizer.
+        
+        Args:
+            text: The raw text of the novel
+            max_chars_per_page: Maximum characters per page
+            digest: Cache digest of the text from fetch_book_text, if any
             
         Returns:
-            String containing the book text
+            PageIndex for the text
+        """
+        tokenizer = get_tokenizer()
+        text_cache = get_text_cache()
+        page_index = None
+        if text_cache is not None and digest is not None:
+            page_index = text_cache.load_page_index(digest, max_chars_per_page)
+            if page_index is not None and page_index.text_length != len(text):
+                page_index = None
+            if page_index is not None and page_index.has_tokens(tokenizer.name):
+                return page_index
+
+        if page_index is None:
+            page_index = BookService.build_page_index(text, max_chars_per_page)
+        # Token estimates are stored with the index so prompts can be budgeted without re-counting
+        page_index.set_page_tokens(count_page_tokens(text, page_index, tokenizer), tokenizer.name)
+        if text_cache is not None and digest is not None:
+            text_cache.store_page_index(digest, page_index)
+        return page_index
+
+    @staticmethod
+    def get_compacted_text(text: BookText, page_index: PageIndex, digest: Optional[str] = None) -> Tuple[BookText, PageIndex]:
+        """
+        Load the prompt-compacted text stored with a cached text, compacting and storing it if missing
+
+        The index of the compacted text is stored in the page index, so a book
+        is compacted once per version of the compaction rules.
+
+        Args:
+            text: The raw text of the novel
+            page_index: Page index of the text, with its chapters indexed
+            digest: Cache digest of the text from fetch_book_text, if any
+
+        Returns:
+            Tuple of the compacted text and its page index (page N of one is page N of the other)
         """
-        response = requests.get(text_url, timeout=30.0)
-        response.raise_for_status()
-        return response.text
+        tokenizer = get_tokenizer()
+        text_cache = get_text_cache()
+        compacted = page_index.compacted
+        if (
+            text_cache is not None and digest is not None and compacted is not None
+            and page_index.compaction_version == COMPACTION_VERSION and compacted.has_tokens(tokenizer.name)
+        ):
+            compacted_text = text_cache.load_compacted_text(digest, page_index.max_chars_per_page)
+            if compacted_text is not None and len(compacted_text) == compacted.text_length:
+                return compacted_text, compacted
+
+        if text_cache is None or digest is None:
+            pieces: List[str] = []
+            compacted, bytes_saved = compact_book(text, page_index, pieces.append, tokenizer)
+            page_index.set_compacted(compacted, COMPACTION_VERSION, bytes_saved)
+            return "".join(pieces), compacted
+        # Written straight to the cache, so the compacted text is never held in memory whole
+        with text_cache.compacted_text_writer(digest, page_index.max_chars_per_page) as write:
+            compacted, bytes_saved = compact_book(text, page_index, write, tokenizer)
+        page_index.set_compacted(compacted, COMPACTION_VERSION, bytes_saved)
+        text_cache.store_page_index(digest, page_index)
+        return text_cache.load_compacted_text(digest, page_index.max_chars_per_page), compacted
     
     @staticmethod
     # def extract_text_to_page(text: str, page_number: int, chars_per_page: int = 3000) -> str:
@@ -243,7 +401,7 @@ class BookService:
     #     if end_char >= len(text_from_chapter):
     #         return text_from_chapter
     #     return text_from_chapter[:end_char]
-    def paginate_text(text, max_chars_per_page):
+    def paginate_text(text, max_chars_per_page, page_index: Optional[PageIndex] = None, max_pages: Optional[int] = None):
         """
         Split text into pages of approximately max_chars_per_page characters
         and add page numbers to each page.
@@ -251,62 +409,101 @@ class BookService:
         Args:
             text (str): The raw text of the novel
             max_chars_per_page (int): Maximum characters per page
+            page_index (PageIndex, optional): Precomputed page index for the text
+            max_pages (int, optional): Only include the first max_pages pages
             
         Returns:
             str: Text split into pages with page numbers added
         """
-        pages = []
-        remaining_text = text
-        page_num = 1
+        if page_index is not None:
+            page_contents = (
+                page_index.extract(text, page_num, page_num).strip()
+                for page_num in range(1, len(page_index) + 1)
+            )
+        else:
+            page_contents = BookService.iter_pages(text, max_chars_per_page)
+        if max_pages is not None:
+            page_contents = itertools.islice(page_contents, max_pages)
+        pages = [
+            f"Page {page_num}\n\n{page_content}"
+            for page_num, page_content in enumerate(page_contents, start=1)
+        ]
+        
+        # Join all pages with a page separator
+        return "\n\n" + "-" * 40 + "\n\n".join(pages)
+
+    @staticmethod
+    def iter_page_bounds(text: BookText, max_chars_per_page: int) -> Iterator[Tuple[int, int]]:
+        """
+        Lazily compute page boundaries in a single pass over the text
+        
+        Pages are cut at the last paragraph break, or failing that the last
+        sentence break, that falls beyond 70% of max_chars_per_page. Only
+        offsets are tracked, so the text is never re-sliced.
+        
+        Args:
+            text: The raw text of the novel
+            max_chars_per_page: Maximum characters per page
+            
+        Yields:
+            (start, end) character offsets of each page in the original text
+        """
+        text_length = len(text)
+        min_break = max_chars_per_page * 0.7
+        offset = 0
         
-        while remaining_text:
+        while offset < text_length:
+            window_end = offset + max_chars_per_page
             # If remaining text is shorter than max chars, make it the last page
-            if len(remaining_text) <= max_chars_per_page:
-                page_content = remaining_text
-                remaining_text = ""
+            if window_end >= text_length:
+                yield offset, text_length
+                return
+            
+            # Try to find a good breaking point (end of paragraph or sentence)
+            cut_point = window_end
+            
+            # Look for paragraph break first
+            paragraph_break = text.rfind('\n\n', offset, window_end)
+            if paragraph_break != -1 and paragraph_break - offset > min_break:
+                cut_point = paragraph_break + 2
             else:
-                # Try to find a good breaking point (end of paragraph or sentence)
-                cut_point = max_chars_per_page
-                
-                # Look for paragraph break first
-                paragraph_break = remaining_text.rfind('\n\n', 0, max_chars_per_page)
-                if paragraph_break != -1 and paragraph_break > max_chars_per_page * 0.7:
-                    cut_point = paragraph_break + 2
-                else:
-                    # Look for sentence break
-                    sentence_break = remaining_text.rfind('. ', 0, max_chars_per_page)
-                    if sentence_break != -1 and sentence_break > max_chars_per_page * 0.7:
-                        cut_point = sentence_break + 2
-                
-                page_content = remaining_text[:cut_point]
-                remaining_text = remaining_text[cut_point:]
+                # Look for sentence break
+                sentence_break = text.rfind('. ', offset, window_end)
+                if sentence_break != -1 and sentence_break - offset > min_break:
+                    cut_point = sentence_break + 2
             
-            # Add page number and append to pages list
-            pages.append(f"Page {page_num}\n\n{page_content.strip()}")
-            page_num += 1
+            yield offset, cut_point
+            offset = cut_point
+
+    @staticmethod
+    def iter_pages(text: str, max_chars_per_page: int) -> Iterator[str]:
+        """
+        Lazily yield the stripped content of each page
         
-        # Join all pages with a page separator
-        return "\n\n" + "-" * 40 + "\n\n".join(pages)
+        Callers can stop iterating once they reach the page they need
+        without paginating the rest of the book.
+        
+        Args:
+            text: The raw text of the novel
+            max_chars_per_page: Maximum characters per page
+            
+        Yields:
+            The content of each page, in order
+        """
+        for start, end in BookService.iter_page_bounds(text, max_chars_per_page):
+            yield text[start:end].strip()
 
 
     @staticmethod
-    def extract_text_to_page(text: str, first_page_of_important_text: int, max_chars_per_page: int, page_number: int) -> str:
+    def build_page_index(text: BookText, max_chars_per_page: int) -> PageIndex:
         """
-        Extract text up to a specified page
+        Build the page index for a book in a single pass
         
         Args:
-            text: The text to extract from
-            first_page_of_important_text: The page number of the first page of important text
-            max_chars_per_page: The maximum number of characters per page
-            page_number: The page number to extract text up to
+            text: The raw text of the novel
+            max_chars_per_page: Maximum characters per page
             
         Returns:
-            The extracted text from the first page of important text up to the specified page
+            PageIndex with the character offsets of every page
         """
-        # Using the first page from the LLM, remove all text before the first page of important text
-        # by calculating the number of chars per page up until the first page of important text
-        start_char = (first_page_of_important_text - 1) * max_chars_per_page
-        end_char = page_number * max_chars_per_page
-        clipped_text = text[start_char:end_char]
-        
-        return clipped_text
\ No newline at end of file
+        return PageIndex.from_bounds(BookService.iter_page_bounds(text, max_chars_per_page), max_chars_per_page)
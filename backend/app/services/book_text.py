@@ -0,0 +1,264 @@
+import codecs
+import mmap
+import os
+import re
+import tempfile
+from array import array
+from bisect import bisect_right
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+import httpx
+from app.core.config import REQUEST_MEMORY_LIMIT_BYTES
+
+# Bytes per checkpoint of the character -> byte map of a multi-byte text
+_BLOCK_BYTES = 4096
+# Resident pages of a mapping are dropped after this many bytes have been read through it
+_RELEASE_BYTES = 16 * 1024 * 1024
+# Longest match iter_matches finds across the windows it scans a mapped text in
+_MAX_MATCH_BYTES = 4096
+
+
+def _is_single_byte(charset: str) -> bool:
+    # Every byte decodes to exactly one character in single-byte charsets (ASCII, Latin-1, cp1252, ...)
+    try:
+        return len(bytes(range(256)).decode(charset, errors="replace")) == 256
+    except LookupError:
+        return False
+
+
+class MappedText:
+    """
+    Read-only, str-like view of a large text in a memory-mapped file
+
+    Supports the parts of the str interface the pipeline uses on a book text
+    (len, slicing, find and rfind) with character offsets, so page indexes and
+    content starts mean the same as for the decoded text. Only the slices that
+    are asked for are decoded.
+
+    Offsets of single-byte texts (including UTF-8 that is pure ASCII) are byte
+    offsets. For other UTF-8 texts a checkpoint is kept every few KB to map
+    character offsets to byte offsets. Pages read through the mapping are
+    dropped from the process every _RELEASE_BYTES, so scanning a whole book
+    does not grow the resident set by its size.
+    """
+
+    def __init__(self, file: BinaryIO, charset: str = "utf-8", path: Optional[str] = None):
+        """
+        Args:
+            file: Open binary file to map; the MappedText closes it
+            charset: Encoding of the text
+            path: Path of the file, if it has one (needed to send the text to another process)
+        """
+        self.charset = codecs.lookup(charset).name
+        if self.charset != "utf-8" and not _is_single_byte(self.charset):
+            raise ValueError(f"Cannot map text in multi-byte charset {charset}")
+        self._file = file
+        self.path = path
+        size = os.fstat(file.fileno()).st_size
+        # Empty files cannot be memory-mapped
+        self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._read = 0
+        self._block_bytes: Optional[array] = None
+        self._block_chars: Optional[array] = None
+        if self.charset == "utf-8" and not self._is_ascii():
+            self._build_checkpoints()
+
+    @classmethod
+    def open(cls, path: str, charset: str = "utf-8") -> "MappedText":
+        """Map the text in a file"""
+        return cls(open(path, "rb"), charset, path)
+
+    def __reduce__(self):
+        # Worker processes map the same file instead of receiving a copy of the text
+        if self.path is None:
+            return str, (self[:],)
+        return MappedText.open, (self.path, self.charset)
+
+    def _count_read(self, nbytes: int) -> None:
+        self._read += nbytes
+        if self._read >= _RELEASE_BYTES and isinstance(self.data, mmap.mmap) and hasattr(mmap, "MADV_DONTNEED"):
+            # Clean file-backed pages: they are read back from the page cache if needed again
+            self.data.madvise(mmap.MADV_DONTNEED)
+            self._read = 0
+
+    def _is_ascii(self) -> bool:
+        for start in range(0, len(self.data), _RELEASE_BYTES):
+            chunk = self.data[start:start + _RELEASE_BYTES]
+            self._count_read(len(chunk))
+            if not chunk.isascii():
+                return False
+        return True
+
+    def _build_checkpoints(self) -> None:
+        data, size = self.data, len(self.data)
+        block_bytes, block_chars = array("q", [0]), array("q", [0])
+        start, chars = 0, 0
+        while start < size:
+            end = min(start + _BLOCK_BYTES, size)
+            # Move back to a character boundary (continuation bytes are 0b10xxxxxx)
+            for _ in range(3):
+                if end >= size or data[end] & 0xC0 != 0x80:
+                    break
+                end -= 1
+            block = data[start:end]
+            self._count_read(len(block))
+            chars += len(block.decode("utf-8", errors="surrogateescape"))
+            start = end
+            block_bytes.append(start)
+            block_chars.append(chars)
+        self._block_bytes, self._block_chars = block_bytes, block_chars
+
+    def _byte_offset(self, char_offset: int) -> int:
+        if self._block_chars is None:
+            return char_offset
+        i = bisect_right(self._block_chars, char_offset) - 1
+        block_start, block_chars = self._block_bytes[i], self._block_chars[i]
+        if char_offset == block_chars:
+            return block_start
+        block = self.data[block_start:self._block_bytes[i + 1]].decode("utf-8", errors="surrogateescape")
+        return block_start + len(block[:char_offset - block_chars].encode("utf-8", errors="surrogateescape"))
+
+    def _char_offset(self, byte_offset: int) -> int:
+        if self._block_bytes is None:
+            return byte_offset
+        i = bisect_right(self._block_bytes, byte_offset) - 1
+        block_start = self._block_bytes[i]
+        return self._block_chars[i] + len(self.data[block_start:byte_offset].decode("utf-8", errors="surrogateescape"))
+
+    def __len__(self) -> int:
+        return self._block_chars[-1] if self._block_chars is not None else len(self.data)
+
+    def _byte_range(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        start, end, _ = slice(start, end).indices(len(self))
+        return self._byte_offset(start), self._byte_offset(max(end, start))
+
+    def __getitem__(self, key: Union[int, slice]) -> str:
+        if isinstance(key, int):
+            index = key + len(self) if key < 0 else key
+            if not 0 <= index < len(self):
+                raise IndexError("MappedText index out of range")
+            return self[index:index + 1]
+        if key.step not in (None, 1):
+            raise ValueError("MappedText slices cannot have a step")
+        start, end = self._byte_range(key.start, key.stop)
+        self._count_read(end - start)
+        return self.data[start:end].decode(self.charset, errors="replace")
+
+    def find(self, sub: str, start: Optional[int] = None, end: Optional[int] = None) -> int:
+        byte_start, byte_end = self._byte_range(start, end)
+        self._count_read(byte_end - byte_start)
+        found = self.data.find(sub.encode(self.charset), byte_start, byte_end)
+        return self._char_offset(found) if found != -1 else -1
+
+    def rfind(self, sub: str, start: Optional[int] = None, end: Optional[int] = None) -> int:
+        byte_start, byte_end = self._byte_range(start, end)
+        self._count_read(byte_end - byte_start)
+        found = self.data.rfind(sub.encode(self.charset), byte_start, byte_end)
+        return self._char_offset(found) if found != -1 else -1
+
+    def finditer(self, pattern: str, flags: int = 0) -> Iterator[Tuple[int, int]]:
+        """
+        Find the matches of a regular expression, scanning the mapping a window at a time
+
+        Case-insensitive matching only folds ASCII letters, as the bytes are searched.
+
+        Args:
+            pattern: Regular expression
+            flags: re flags
+
+        Yields:
+            (start, end) character offsets of each match, in text order
+        """
+        regex = re.compile(pattern.encode(self.charset), flags)
+        size, window = len(self.data), _RELEASE_BYTES
+        for window_start in range(0, size, window):
+            # Windows overlap so matches crossing a window edge are found once, in the first window
+            chunk = self.data[window_start:window_start + window + _MAX_MATCH_BYTES]
+            self._count_read(len(chunk))
+            for match in regex.finditer(chunk):
+                if match.start() >= window:
+                    break
+                start = window_start + match.start()
+                yield self._char_offset(start), self._char_offset(window_start + match.end())
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def __enter__(self) -> "MappedText":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# A book text: decoded in memory, or memory-mapped when it is too large for that
+BookText = Union[str, MappedText]
+
+
+def iter_matches(text: BookText, pattern: str, flags: int = 0) -> Iterator[Tuple[int, int]]:
+    """
+    Find the matches of a regular expression in a book text
+
+    Args:
+        text: The book text
+        pattern: Regular expression
+        flags: re flags
+
+    Yields:
+        (start, end) character offsets of each match, in text order
+    """
+    if isinstance(text, MappedText):
+        yield from text.finditer(pattern, flags)
+        return
+    for match in re.finditer(pattern, text, flags):
+        yield match.span()
+
+
+async def download_text(
+    client: httpx.AsyncClient,
+    url: str,
+    memory_limit: int = REQUEST_MEMORY_LIMIT_BYTES,
+    timeout: float = 30.0,
+) -> Tuple[BookText, int]:
+    """
+    Download a text, spilling it to a temporary file once it exceeds memory_limit
+
+    Args:
+        client: Client used for the download
+        url: URL of the text
+        memory_limit: Largest text kept in memory, in bytes
+        timeout: Request timeout in seconds
+
+    Returns:
+        Tuple of the text (a str, or a MappedText of the unlinked temporary file) and its size in bytes
+    """
+    buffer, spill, size = bytearray(), None, 0
+    async with client.stream("GET", url, timeout=timeout) as response:
+        response.raise_for_status()
+        charset = response.charset_encoding or "utf-8"
+        try:
+            async for chunk in response.aiter_bytes(64 * 1024):
+                size += len(chunk)
+                if spill is None and size > memory_limit:
+                    spill = tempfile.TemporaryFile()
+                    spill.write(buffer)
+                    buffer = bytearray()
+                if spill is not None:
+                    spill.write(chunk)
+                else:
+                    buffer.extend(chunk)
+        except BaseException:
+            if spill is not None:
+                spill.close()
+            raise
+    if spill is None:
+        return buffer.decode(charset, errors="replace"), size
+    spill.flush()
+    try:
+        return MappedText(spill, charset), size
+    except ValueError:
+        # Multi-byte charsets other than UTF-8 cannot be mapped
+        spill.seek(0)
+        with spill:
+            return spill.read().decode(charset, errors="replace"), size
@@ -0,0 +1,162 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import MAP_REDUCE_CHUNK_TOKENS, MAP_REDUCE_MAX_CONCURRENCY
+from app.services.book_text import BookText
+from app.services.leases import get_lease_store
+from app.services.llm_service import CHUNK_SUMMARY_PROMPT, LLMService
+from app.services.map_reduce import MapReduceSummarizer
+from app.services.page_index import PageIndex
+from app.services.summary_cache import SummaryCache, SummaryKey
+
+
+class ChapterSummarizer:
+    """
+    Summarize ranges of chapters from per-chapter summaries
+
+    Every chapter is summarized once, on its own (map-reduced when it does
+    not fit in one prompt), and stored in the summary cache. A range of
+    chapters combines the summaries of its chapters, so a request for
+    chapters 1-5 after one for chapters 1-4 only summarizes chapter 5 and
+    combines the five summaries.
+
+    Chapter summaries are keyed like page summaries, with the chapter numbers
+    in place of the page numbers and mode "chapter" (a single chapter) or
+    "chapters" (a combined range). Like page summaries, each is generated
+    under a lease, so workers sharing the cache generate it once.
+
+    The chapters of a range are summarized concurrently, but their map-reduce
+    calls share one limiter: at most max_concurrency prompts are built and in
+    flight at once across the whole range.
+    """
+
+    def __init__(
+        self,
+        llm_service: LLMService,
+        summary_cache: Optional[SummaryCache],
+        chunk_tokens: int = MAP_REDUCE_CHUNK_TOKENS,
+        max_concurrency: int = MAP_REDUCE_MAX_CONCURRENCY,
+    ):
+        self.summary_cache = summary_cache
+        self.max_concurrency = max_concurrency
+        chunk_tokens = min(chunk_tokens, llm_service.prompt_budget(CHUNK_SUMMARY_PROMPT))
+        self.map_reduce = MapReduceSummarizer(
+            llm_service, chunk_tokens=chunk_tokens, max_concurrency=max_concurrency,
+            limiter=asyncio.Semaphore(max_concurrency),
+        )
+
+    @staticmethod
+    def range_key(key: SummaryKey, first_chapter: int, last_chapter: int) -> SummaryKey:
+        """Get the summary cache key of a chapter range (key supplies the book, model and prompt fields)"""
+        mode = "chapter" if first_chapter == last_chapter else "chapters"
+        return key._replace(start_page=first_chapter, page_number=last_chapter, mode=mode)
+
+    async def _cached(self, key: SummaryKey) -> Optional[str]:
+        if self.summary_cache is None:
+            return None
+        return await asyncio.to_thread(self.summary_cache.get, key)
+
+    async def _store(self, key: SummaryKey, summary: str) -> None:
+        if self.summary_cache is not None:
+            await asyncio.to_thread(self.summary_cache.put, key, summary)
+
+    async def _single_flight(self, key: SummaryKey, generate: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        # Generate and store the summary, unless another worker is already generating it
+        async def compute() -> str:
+            summary = await generate()
+            await self._store(key, summary)
+            return summary
+
+        lease_store = get_lease_store()
+        if lease_store is None or self.summary_cache is None:
+            return await compute(), True
+        return await lease_store.single_flight(f"summary:{':'.join(map(str, key))}", lambda: self._cached(key), compute)
+
+    def _chunks(self, book_text: BookText, page_index: PageIndex, chapter: int) -> List:
+        # Chunks of whole pages, cut back to the chapter at both ends
+        start, end = page_index.chapter_span(chapter, chapter)
+        first_page, last_page = page_index.chapter_page_range(chapter, chapter)
+        chunks = []
+        for chunk_first, chunk_last in self.map_reduce.chunk_bounds(book_text, page_index, first_page, last_page):
+            chunk_start, chunk_end = page_index.page_span(chunk_first, chunk_last)
+            chunk_start, chunk_end = max(chunk_start, start), min(chunk_end, end)
+            chunks.append(lambda chunk_start=chunk_start, chunk_end=chunk_end: book_text[chunk_start:chunk_end])
+        return chunks
+
+    async def _summarize_chapter(
+        self, key: SummaryKey, book_text: BookText, page_index: PageIndex, chapter: int
+    ) -> Tuple[str, int]:
+        chapter_key = self.range_key(key, chapter, chapter)
+        summary = await self._cached(chapter_key)
+        if summary is not None:
+            return summary, 0
+        calls = 0
+
+        async def generate() -> str:
+            nonlocal calls
+            summary, stages = await self.map_reduce.summarize(
+                book_text, page_index, 0, 0, chunks=self._chunks(book_text, page_index, chapter)
+            )
+            calls = sum(stage["calls"] for stage in stages)
+            return summary
+
+        summary, _ = await self._single_flight(chapter_key, generate)
+        return summary, calls
+
+    async def summarize(
+        self,
+        key: SummaryKey,
+        book_text: BookText,
+        page_index: PageIndex,
+        first_chapter: int,
+        last_chapter: int,
+    ) -> Tuple[str, bool, List[Dict[str, Any]]]:
+        """
+        Summarize chapters first_chapter..last_chapter
+
+        Args:
+            key: Summary key of the request (book, model, prompt version and page size)
+            book_text: The original book text
+            page_index: Page index of the book text, with its chapters indexed
+            first_chapter: First chapter to include (1-based)
+            last_chapter: Last chapter to include (1-based, inclusive)
+
+        Returns:
+            Tuple of the summary, whether the whole range came from cache (or
+            from another worker), and per-stage stats (LLM calls and cached
+            chapters, then any reduce stages; empty when nothing was generated)
+
+        Raises:
+            ValueError: If the chapter range is out of bounds
+        """
+        page_index.chapter_span(first_chapter, last_chapter)
+        range_key = self.range_key(key, first_chapter, last_chapter)
+        summary = await self._cached(range_key)
+        if summary is not None:
+            return summary, True, []
+
+        stages: List[Dict[str, Any]] = []
+
+        async def generate() -> str:
+            start = time.perf_counter()
+            # The LLM calls of every chapter are bounded by the map-reduce limiter
+            results = await asyncio.gather(*(
+                self._summarize_chapter(key, book_text, page_index, chapter)
+                for chapter in range(first_chapter, last_chapter + 1)
+            ))
+            stages.append({
+                "stage": "chapters",
+                "calls": sum(calls for _, calls in results),
+                "cached": sum(1 for _, calls in results if calls == 0),
+                "seconds": round(time.perf_counter() - start, 3),
+            })
+            if len(results) == 1:
+                return results[0][0]
+            return await self.map_reduce.reduce([summary for summary, _ in results], stages)
+
+        if first_chapter == last_chapter:
+            # A single chapter's range key is its chapter key, which _summarize_chapter generates once
+            summary = await generate()
+            return summary, stages[0]["cached"] == 1, stages
+        summary, generated = await self._single_flight(range_key, generate)
+        return summary, not generated, stages
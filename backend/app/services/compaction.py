@@ -0,0 +1,134 @@
+import re
+from typing import Callable, List, Optional, Tuple
+from app.services.book_text import BookText
+from app.services.page_index import PageIndex
+from app.services.tokens import get_tokenizer
+
+# Version of the compaction rules; stored compacted texts of other versions are rebuilt
+COMPACTION_VERSION = 1
+
+# [Illustration], [Illustration: caption] and [Illustration:\n multi-line caption]
+_ILLUSTRATION = re.compile(r"\[Illustrations?(?::[^\]]*)?\]", re.IGNORECASE)
+# Footnote markers ([1], [12], [A]) and printed page numbers ([Pg 23], {23}, [Page 23])
+_MARKER = re.compile(r"\[(?:\d{1,3}|[A-Z]|Pg\.? ?\d+|Page \d+)\]|\{\d+\}")
+# Lines of only decoration (-----, * * * * *, =====) and "Page N" headers like paginate_text's
+_DECORATION_LINE = re.compile(r"^[ \t]*(?:(?:[-=_~*#.+][ \t]*){3,}|Page \d+)[ \t]*$", re.MULTILINE)
+# _italics_ as Gutenberg marks them
+# (the lookbehind follows the first "_", so the regex engine can skip ahead to underscores)
+_EMPHASIS = re.compile(r"_(?<![\w_]_)(?=[^\s_])([^_]*?[^\s_])_(?![\w_])")
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t\r]*\n\s*")
+
+
+def compact_text(text: str) -> str:
+    """
+    Normalize text for a prompt, keeping only what the model needs to read
+
+    Drops illustration tags, footnote and page markers, decoration lines and
+    _emphasis_ underscores, unwraps hard-wrapped lines into paragraphs and
+    collapses runs of whitespace. Paragraphs are separated by one blank line.
+
+    Args:
+        text: Text as it appears in the book
+
+    Returns:
+        The compacted text, without leading or trailing whitespace
+    """
+    text = _ILLUSTRATION.sub("", text.replace("\r\n", "\n"))
+    text = _MARKER.sub("", text)
+    text = _DECORATION_LINE.sub("", text)
+    text = _EMPHASIS.sub(r"\1", text)
+    # str.split collapses whitespace runs at C speed
+    paragraphs = (" ".join(paragraph.split()) for paragraph in _PARAGRAPH_BREAK.split(text))
+    return "\n\n".join(paragraph for paragraph in paragraphs if paragraph)
+
+
+def _separator(gap: str) -> str:
+    # What joins two compacted pieces, given the original whitespace between them
+    if _PARAGRAPH_BREAK.search(gap):
+        return "\n\n"
+    return " " if gap else ""
+
+
+def _leading_space(text: str) -> str:
+    return text[:len(text) - len(text.lstrip())]
+
+
+def _trailing_space(text: str) -> str:
+    return text[len(text.rstrip()):]
+
+
+def compact_book(
+    text: BookText, page_index: PageIndex, write: Callable[[str], None], tokenizer: Optional[object] = None
+) -> Tuple[PageIndex, int]:
+    """
+    Compact a book page by page, keeping the pages aligned with the original
+
+    Page N of the compacted text holds the compacted page N of the original,
+    so page numbers, start pages and checkpoints mean the same for both. The
+    chapter markers are moved to where their text starts in the compacted
+    text. Pages are passed to write one at a time, so the whole compacted
+    text never has to be held in memory.
+
+    Args:
+        text: The original book text
+        page_index: Page index of the original text (with its chapters indexed, if any)
+        write: Receives the compacted text piece by piece, in order
+        tokenizer: Tokenizer estimating the tokens of each compacted page (default: the configured one)
+
+    Returns:
+        Tuple of the page index of the compacted text (with token estimates) and the bytes saved
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    chapters = page_index.chapters or []
+    next_chapter = 0
+    content_end = page_index.content_end
+    offsets: List[int] = [0]
+    page_tokens: List[int] = []
+    compacted_chapters: List[Tuple[int, str]] = []
+    compacted_end: Optional[int] = None
+    position, original_bytes, compacted_bytes = 0, 0, 0
+    # Original whitespace since the last compacted text written, and whether any was written
+    gap, written = "", False
+
+    for page in range(1, len(page_index) + 1):
+        page_start, page_end = page_index.page_span(page, page)
+        raw = page_index.extract(text, page, page)
+        original_bytes += len(raw.encode("utf-8", errors="surrogateescape"))
+        compacted = compact_text(raw)
+        piece = ""
+        if compacted:
+            piece = (_separator(gap + _leading_space(raw)) if written else "") + compacted
+            gap, written = _trailing_space(raw), True
+        else:
+            # A page of only decoration breaks the paragraph like a blank line
+            gap += "\n\n" if raw.strip() else raw
+        body_start = position + len(piece) - len(compacted)
+
+        def locate(offset: int) -> int:
+            # Position in the compacted text of an offset within this page
+            prefix, suffix = raw[:offset - page_start], raw[offset - page_start:]
+            compacted_prefix = compact_text(prefix)
+            if not compacted_prefix:
+                return body_start
+            located = body_start + len(compacted_prefix) + len(_separator(_trailing_space(prefix) + _leading_space(suffix)))
+            return min(located, position + len(piece))
+
+        while next_chapter < len(chapters) and chapters[next_chapter][0] < page_end:
+            offset, title = chapters[next_chapter]
+            compacted_chapters.append((locate(max(offset, page_start)), title))
+            next_chapter += 1
+        if content_end is not None and compacted_end is None and content_end < page_end:
+            compacted_end = locate(max(content_end, page_start))
+
+        write(piece)
+        position += len(piece)
+        offsets.append(position)
+        page_tokens.append(tokenizer.count(piece))
+        compacted_bytes += len(piece.encode("utf-8", errors="surrogateescape"))
+
+    compacted_index = PageIndex(offsets, page_index.max_chars_per_page)
+    compacted_index.set_page_tokens(page_tokens, tokenizer.name)
+    if page_index.chapters is not None:
+        compacted_chapters.extend((position, title) for _, title in chapters[next_chapter:])
+        compacted_index.set_chapters(compacted_chapters, compacted_end if content_end is not None else None)
+    return compacted_index, original_bytes - compacted_bytes
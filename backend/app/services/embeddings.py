@@ -0,0 +1,113 @@
+import logging
+import math
+import re
+import zlib
+import httpx
+from typing import List, Optional
+from app.core.config import EMBEDDING_BACKEND, EMBEDDING_MODEL, OLLAMA_HOSTS
+from app.services.http_clients import get_ollama_client
+from app.services.llm_backends import RETRYABLE_STATUS_CODES, LLMBackendError
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class OllamaEmbedder:
+    """Text embeddings from Ollama's /api/embed endpoint"""
+
+    def __init__(self, host: str, model: str = EMBEDDING_MODEL):
+        self.api_base = host
+        self.model = model
+        # Vectors from different models are not comparable, so stored indexes are keyed by name
+        self.name = f"ollama-{model}"
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts in one call
+
+        Args:
+            texts: The texts to embed (Ollama truncates each to the model's context)
+
+        Returns:
+            One vector per text, in order
+
+        Raises:
+            LLMBackendError: If the call fails
+        """
+        url = f"{self.api_base}/api/embed"
+        try:
+            response = await get_ollama_client().post(
+                url, json={"model": self.model, "input": texts, "truncate": True}, timeout=120.0
+            )
+        except httpx.RequestError as e:
+            logger.warning("Request error to Ollama API", extra={"api_base": self.api_base, "error": str(e)})
+            raise LLMBackendError(f"Failed to connect to Ollama API: {e}. Make sure Ollama is running at {self.api_base}", retryable=True)
+        if response.status_code >= 400:
+            raise LLMBackendError(
+                f"Ollama API returned error {response.status_code}: {response.text}",
+                status_code=response.status_code,
+                retryable=response.status_code in RETRYABLE_STATUS_CODES,
+            )
+        return response.json()["embeddings"]
+
+
+class FakeEmbedder:
+    """
+    Deterministic stand-in embedder for tests and offline development
+
+    Hashes the words of a text into a fixed number of buckets (the hashing
+    trick), so texts sharing words get similar vectors.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.api_base = "fake://"
+        self.model = "fake"
+        self.name = f"fake-{dimensions}"
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in _WORD.findall(text.lower()):
+            bucket = zlib.crc32(word.encode("utf-8"))
+            vector[bucket % self.dimensions] += 1.0 if bucket & 0x80000000 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        return [self._vector(text) for text in texts]
+
+
+def create_embedder(backend: str = EMBEDDING_BACKEND):
+    """
+    Build the configured embedder
+
+    Args:
+        backend: "ollama" or "fake"
+
+    Returns:
+        An object with a name and an async embed(texts) method
+    """
+    if backend == "ollama":
+        return OllamaEmbedder(OLLAMA_HOSTS[0])
+    if backend == "fake":
+        return FakeEmbedder()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+
+_embedder: Optional[object] = None
+
+
+def get_embedder():
+    """
+    Get the process-wide embedder selected by EMBEDDING_BACKEND
+
+    Returns:
+        The shared embedder
+    """
+    global _embedder
+    if _embedder is None:
+        _embedder = create_embedder()
+    return _embedder
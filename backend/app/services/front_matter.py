@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import re
+from typing import Dict, List, NamedTuple, Tuple
+from app.core.config import FRONT_MATTER_LLM_PAGES, FRONT_MATTER_MIN_CONFIDENCE
+from app.services.book_service import BookService
+from app.services.book_text import BookText, MappedText, iter_matches
+from app.services.llm_service import PAGE_NUMBER_PROMPT, LLMService
+from app.services.page_index import PageIndex
+
+logger = logging.getLogger(__name__)
+
+_GUTENBERG_START_RE = re.compile(r"^\*{3}\s*START OF (?:THE|THIS) PROJECT GUTENBERG E-?BOOK[^\n]*$", re.IGNORECASE | re.MULTILINE)
+_GUTENBERG_END_RE = re.compile(r"^\*{3}\s*END OF (?:THE|THIS) PROJECT GUTENBERG E-?BOOK[^\n]*$", re.IGNORECASE | re.MULTILINE)
+_CONTENTS_RE = re.compile(r"^[ \t]*(?:TABLE\s+OF\s+)?CONTENTS\.?[ \t]*$", re.IGNORECASE | re.MULTILINE)
+# Chapter-style headings: "CHAPTER I.", "Chapter 1: Loomings", "BOOK ONE", "PART THE FIRST"
+_HEADING_RE = re.compile(
+    r"^[ \t]*(?:CHAPTER|BOOK|PART|LETTER|STAVE)\s+(?P<number>[IVXLCDM]+|\d+|[A-Z]+(?:\s+FIRST)?)\b[^\n]{0,80}$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# A bare roman numeral on its own line; case-sensitive so ordinary words never match
+_ROMAN_HEADING_RE = re.compile(r"^[ \t]*(?P<number>[IVXLC]{1,7})\.?[ \t]*$", re.MULTILINE)
+_FIRST_NUMBERS = {"1", "I", "ONE", "FIRST", "THE FIRST"}
+_PROSE_LINE_RE = re.compile(r"[a-z][^\n]{38,}")
+_PARAGRAPH_RE = re.compile(r"[^\n]+(?:\n[^\n]+)*")
+
+# Chapter index headings: a keyword and a number (digits, roman numerals or English
+# number words), or a bare roman numeral, alone on a line
+_NUMBER_WORDS = (
+    r"(?:ONE|TWO|THREE|FOUR|FIVE|SIX|SEVEN|EIGHT|NINE|TEN|ELEVEN|TWELVE|\w+TEEN"
+    r"|TWENTY|THIRTY|FORTY|FIFTY|SIXTY|SEVENTY|EIGHTY|NINETY)(?:[-\s](?:ONE|TWO|THREE|FOUR|FIVE|SIX|SEVEN|EIGHT|NINE))?"
+)
+_ORDINAL_WORDS = (
+    r"(?:THE\s+)?(?:FIRST|SECOND|THIRD|FOURTH|FIFTH|SIXTH|SEVENTH|EIGHTH|NINTH|TENTH|ELEVENTH|TWELFTH"
+    r"|\w+TEENTH|\w+IETH|LAST)"
+)
+_CHAPTER_KEYWORDS = ("CHAPTER", "BOOK", "PART", "LETTER", "STAVE")
+_CHAPTER_RE = re.compile(
+    rf"^[ \t]*(?:(?i:(?:{'|'.join(_CHAPTER_KEYWORDS)})\s+(?:[IVXLCDM]+|\d+|{_NUMBER_WORDS}|{_ORDINAL_WORDS})\b[^\n]{{0,80}})"
+    r"|[IVXLC]{1,7}\.?[ \t]*\r?)$",
+    re.MULTILINE,
+)
+
+# Front matter of a memory-mapped (very large) text is looked for in this many leading characters
+MAPPED_SCAN_CHARS = 2_000_000
+
+HIGH_CONFIDENCE = 0.9
+MEDIUM_CONFIDENCE = 0.5
+LOW_CONFIDENCE = 0.2
+
+
+class ContentStart(NamedTuple):
+    """Where the real content of a book starts"""
+    offset: int
+    confidence: float
+    method: str
+
+
+def strip_gutenberg_boilerplate(text: str) -> Tuple[int, int]:
+    """
+    Find the body of a Project Gutenberg text
+
+    Args:
+        text: The raw book text
+
+    Returns:
+        (start, end) offsets of the text between the START and END markers,
+        or the whole text when the markers are missing
+    """
+    start_match = _GUTENBERG_START_RE.search(text)
+    start = start_match.end() if start_match else 0
+    end_match = _GUTENBERG_END_RE.search(text, start)
+    end = end_match.start() if end_match else len(text)
+    return start, end
+
+
+def _followed_by_prose(text: str, offset: int, end: int) -> bool:
+    """Check that a heading is followed by narrative text rather than more headings (as in a TOC)"""
+    lines = [line for line in text[offset:min(offset + 1500, end)].split("\n")[1:] if line.strip()][:6]
+    headings = sum(1 for line in lines if _HEADING_RE.match(line) or _ROMAN_HEADING_RE.match(line))
+    if headings >= 2:
+        return False
+    return any(_PROSE_LINE_RE.search(line) and not _HEADING_RE.match(line) for line in lines)
+
+
+def _toc_end(text: str, start: int, end: int) -> int:
+    """Find where a table of contents near the start of the body ends"""
+    contents = _CONTENTS_RE.search(text, start, start + max((end - start) // 3, 20_000))
+    if not contents:
+        return start
+    # The TOC is the run of multi-line listing blocks before the first prose paragraph.
+    # Single-line paragraphs may be a chapter heading, so they do not extend it; TOC
+    # entries separated by blank lines are rejected by _followed_by_prose instead.
+    toc_end = contents.end()
+    for paragraph in _PARAGRAPH_RE.finditer(text, contents.end(), min(contents.end() + 50_000, end)):
+        lines = paragraph.group(0).split("\n")
+        if any(_PROSE_LINE_RE.search(line) and not _HEADING_RE.match(line) for line in lines):
+            break
+        if len(lines) >= 2:
+            toc_end = paragraph.end()
+    return toc_end
+
+
+def detect_content_start(text: BookText) -> ContentStart:
+    """
+    Find where the real content of a book starts without calling the LLM
+
+    Strips the Gutenberg boilerplate, skips the table of contents, and ranks
+    chapter headings that are followed by prose. A first-chapter heading
+    ("CHAPTER I", "Chapter 1", "BOOK ONE", a lone "I") ranks highest.
+
+    Args:
+        text: The raw book text. Only the first MAPPED_SCAN_CHARS characters
+            of a MappedText are decoded and searched.
+
+    Returns:
+        ContentStart with the character offset, a 0-1 confidence and the rule that matched
+    """
+    if isinstance(text, MappedText):
+        text = text[:MAPPED_SCAN_CHARS]
+    start, end = strip_gutenberg_boilerplate(text)
+    toc_end = _toc_end(text, start, end)
+
+    # Front matter rarely runs past the first part of the body, so stop looking there
+    scan_end = min(end, max(start + (end - start) // 2, toc_end + 100_000))
+    candidates: List[ContentStart] = []
+    for pattern in (_HEADING_RE, _ROMAN_HEADING_RE):
+        first_other_heading = None
+        for match in pattern.finditer(text, toc_end, scan_end):
+            if not _followed_by_prose(text, match.start(), end):
+                continue
+            if match.group("number").upper() in _FIRST_NUMBERS:
+                candidates.append(ContentStart(match.start(), HIGH_CONFIDENCE, "first-heading"))
+                break
+            if first_other_heading is None:
+                first_other_heading = ContentStart(match.start(), MEDIUM_CONFIDENCE, "heading")
+        else:
+            if first_other_heading is not None:
+                candidates.append(first_other_heading)
+
+    if candidates:
+        return max(candidates, key=lambda candidate: (candidate.confidence, -candidate.offset))
+
+    # No usable heading: fall back to the first paragraph of prose after the TOC
+    prose = _PROSE_LINE_RE.search(text, toc_end, end)
+    if prose:
+        paragraph_start = text.rfind("\n\n", toc_end, prose.start())
+        return ContentStart(paragraph_start + 2 if paragraph_start != -1 else prose.start(), LOW_CONFIDENCE, "first-prose")
+    return ContentStart(start, 0.0, "body-start")
+
+
+def _body_bounds(text: BookText) -> Tuple[int, int, int]:
+    """(start, end, table of contents end) of the body; only the two ends of a MappedText are decoded"""
+    if not isinstance(text, MappedText):
+        start, end = strip_gutenberg_boilerplate(text)
+        return start, end, _toc_end(text, start, end)
+    head = text[:MAPPED_SCAN_CHARS]
+    start, _ = strip_gutenberg_boilerplate(head)
+    toc_end = _toc_end(head, start, len(head))
+    tail_start = max(len(text) - MAPPED_SCAN_CHARS, start)
+    end_match = _GUTENBERG_END_RE.search(text[tail_start:])
+    return start, tail_start + end_match.start() if end_match else len(text), toc_end
+
+
+def _heading_title(text: BookText, start: int, end: int) -> str:
+    title = text[start:end].strip()
+    # A short line right under the heading is its title: "CHAPTER I\nDown the Rabbit-Hole"
+    lines = text[end:end + 200].replace("\r", "").split("\n")
+    if len(lines) > 2 and 0 < len(lines[1].strip()) <= 60 and not lines[2].strip():
+        title = f"{title} {lines[1].strip()}"
+    return title
+
+
+def index_chapters(text: BookText) -> Tuple[List[Tuple[int, str]], int]:
+    """
+    Find the chapter headings of a book in a single pass over its body
+
+    Headings must stand in a paragraph of their own and be followed by prose,
+    which rules out tables of contents. When the book has CHAPTER headings
+    only those are kept (so PART and BOOK headings do not interleave with
+    them); otherwise the most common kind of heading is kept.
+
+    Args:
+        text: The raw book text
+
+    Returns:
+        Tuple of the (character offset, title) of each chapter, in order, and
+        the offset where the body ends (before the Gutenberg license)
+    """
+    start, end, toc_end = _body_bounds(text)
+    by_kind: Dict[str, List[Tuple[int, str]]] = {}
+    for match_start, match_end in iter_matches(text, _CHAPTER_RE.pattern, re.MULTILINE):
+        if match_start < toc_end:
+            continue
+        if match_start >= end:
+            break
+        preceding = text[max(match_start - 4, start):match_start].replace("\r", "")
+        if match_start - start > 2 and not preceding.endswith("\n\n"):
+            continue
+        if not _followed_by_prose(text, match_start, end):
+            continue
+        title = _heading_title(text, match_start, match_end)
+        keyword = title.split()[0].upper()
+        by_kind.setdefault(keyword if keyword in _CHAPTER_KEYWORDS else "ROMAN", []).append((match_start, title))
+    if not by_kind:
+        return [], end
+    if "CHAPTER" in by_kind:
+        return by_kind["CHAPTER"], end
+    return max(by_kind.values(), key=len), end
+
+
+def parse_page_number(page_number_response: str, default: int = 1) -> int:
+    """
+    Parse the "Page <number>" answer returned by LLMService.get_page_number
+
+    Args:
+        page_number_response: The raw LLM response
+        default: Page to use when no page number can be parsed
+
+    Returns:
+        The page number
+    """
+    page_match = re.search(r'Page\s*(\d+)', page_number_response)
+    return int(page_match.group(1)) if page_match else default
+
+
+async def resolve_content_start(
+    book_text: BookText,
+    page_index: PageIndex,
+    llm_service: LLMService,
+    min_confidence: float = FRONT_MATTER_MIN_CONFIDENCE,
+    llm_pages: int = FRONT_MATTER_LLM_PAGES,
+) -> Tuple[int, ContentStart]:
+    """
+    Resolve the first page of important text
+
+    The deterministic detector runs first. Only when its confidence is below
+    min_confidence is the LLM asked, and then only about the first llm_pages
+    pages, fewer when those do not fit in the model's context window. If the
+    LLM call fails the detector's answer is used.
+
+    Args:
+        book_text: The original book text
+        page_index: Page index of the book text
+        llm_service: LLMService used for the low-confidence fallback
+        min_confidence: Confidence needed to skip the LLM
+        llm_pages: Number of leading pages shown to the LLM
+
+    Returns:
+        Tuple of the start page and the detection result
+    """
+    detected = await asyncio.to_thread(detect_content_start, book_text)
+    detected_page = page_index.page_for_offset(detected.offset)
+    if detected.confidence >= min_confidence:
+        return detected_page, detected
+
+    if page_index.has_tokens():
+        # The page decorations added by paginate_text cost a few tokens per page
+        budget = llm_service.prompt_budget(PAGE_NUMBER_PROMPT) - 10 * llm_pages
+        llm_pages = max(min(llm_pages, page_index.pages_within(1, budget)), 1)
+    leading_pages = BookService.paginate_text(book_text, page_index.max_chars_per_page, page_index, max_pages=llm_pages)
+    try:
+        page_number_response = await llm_service.get_page_number(leading_pages)
+    except Exception as e:
+        logger.warning("Front-matter LLM fallback failed, using detector result", extra={"error": str(e)})
+        return detected_page, detected
+
+    page = parse_page_number(page_number_response, default=detected_page)
+    page = min(max(page, 1), max(min(llm_pages, len(page_index)), 1))
+    return page, ContentStart(page_index.offsets[page - 1], detected.confidence, "llm")
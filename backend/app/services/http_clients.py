@@ -0,0 +1,68 @@
+import asyncio
+import httpx
+from typing import Dict, Optional, Tuple
+from app.core.config import LLM_BACKEND, LLM_CONCURRENCY_MAX, LLM_MODELS, OLLAMA_HOSTS, OPENAI_API_BASES
+
+# Shared clients keyed by name. Each entry remembers the event loop it was
+# created on, because httpx connection pools cannot be reused across loops
+# (e.g. between separate TestClient instances).
+_clients: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+
+def _llm_limits() -> httpx.Limits:
+    # Every replica's adaptive limit may grow to LLM_CONCURRENCY_MAX calls; a smaller
+    # pool would queue them in httpx, and pool timeouts would look like overload
+    hosts = OPENAI_API_BASES if LLM_BACKEND == "openai" else OLLAMA_HOSTS
+    connections = LLM_CONCURRENCY_MAX * max(len(hosts), len(LLM_MODELS), 1)
+    return httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+
+_CLIENT_LIMITS = {
+    "gutenberg": httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    "ollama": _llm_limits(),
+}
+
+
+def _get_client(name: str, timeout: float) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(name)
+    if entry is not None:
+        client, client_loop = entry
+        if client_loop is loop and not client.is_closed:
+            return client
+
+    client = httpx.AsyncClient(
+        timeout=timeout,
+        limits=_CLIENT_LIMITS[name],
+        follow_redirects=True,
+    )
+    _clients[name] = (client, loop)
+    return client
+
+
+def get_gutenberg_client() -> httpx.AsyncClient:
+    """
+    Get the shared client used for gutendex lookups and book text downloads
+
+    Returns:
+        A keep-alive httpx.AsyncClient bound to the running event loop
+    """
+    return _get_client("gutenberg", timeout=30.0)
+
+
+def get_ollama_client() -> httpx.AsyncClient:
+    """
+    Get the shared client used for Ollama (and other LLM server) API calls
+
+    Returns:
+        A keep-alive httpx.AsyncClient bound to the running event loop
+    """
+    return _get_client("ollama", timeout=60.0)
+
+
+async def close_clients() -> None:
+    """Close all shared clients created on the running event loop"""
+    loop = asyncio.get_running_loop()
+    for name, (client, client_loop) in list(_clients.items()):
+        if client_loop is loop:
+            await client.aclose()
+            del _clients[name]
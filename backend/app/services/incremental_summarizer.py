@@ -0,0 +1,62 @@
+import asyncio
+from typing import Optional
+from app.core.config import INCREMENTAL_SEGMENT_PAGES
+from app.services.llm_service import LLMService
+from app.services.page_index import PageIndex
+from app.services.summary_cache import SummaryCache, SummaryKey
+
+
+class IncrementalSummarizer:
+    """
+    Summarize page prefixes by extending stored rolling summaries
+
+    Starting at the content start page, the book is split into segments of
+    segment_pages pages. The rolling summary at the end of every segment is
+    stored, so a request for page N only summarizes the pages after the
+    furthest stored checkpoint at or before N, instead of the whole prefix.
+    """
+
+    def __init__(
+        self,
+        llm_service: LLMService,
+        summary_cache: Optional[SummaryCache],
+        segment_pages: int = INCREMENTAL_SEGMENT_PAGES,
+    ):
+        self.llm_service = llm_service
+        self.summary_cache = summary_cache
+        self.segment_pages = segment_pages
+
+    async def summarize(self, key: SummaryKey, book_text: str, page_index: PageIndex) -> str:
+        """
+        Summarize pages key.start_page..key.page_number
+
+        Args:
+            key: Key of the requested summary
+            book_text: The original book text
+            page_index: Page index of the book text
+
+        Returns:
+            A summary of the requested pages
+        """
+        last_page = min(key.page_number, len(page_index))
+        summary, summarized_to = None, key.start_page - 1
+        if self.summary_cache is not None:
+            checkpoint = await asyncio.to_thread(self.summary_cache.get_latest_segment, key, self.segment_pages)
+            if checkpoint is not None:
+                summarized_to, summary = checkpoint
+
+        while summarized_to < last_page:
+            segment_end = min(summarized_to + self.segment_pages, last_page)
+            text = page_index.extract(book_text, summarized_to + 1, segment_end)
+            if summary is None:
+                summary = await self.llm_service.summarize_text(text)
+            else:
+                summary = await self.llm_service.update_summary(summary, text)
+            summarized_to = segment_end
+
+            # Only whole segments become checkpoints, so they can be shared by later requests
+            is_checkpoint = (segment_end - key.start_page + 1) % self.segment_pages == 0
+            if is_checkpoint and self.summary_cache is not None:
+                await asyncio.to_thread(self.summary_cache.put_segment, key, self.segment_pages, segment_end, summary)
+
+        return summary if summary is not None else await self.llm_service.summarize_text("")
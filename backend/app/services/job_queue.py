@@ -0,0 +1,270 @@
+import asyncio
+import contextvars
+import logging
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import (
+    SUMMARY_JOB_MAX_FINISHED,
+    SUMMARY_JOB_MAX_QUEUED,
+    SUMMARY_JOB_MODEL_CONCURRENCY,
+    SUMMARY_JOB_WORKERS,
+)
+from app.services.llm_backends import get_llm_backend
+from app.services.prefetch import run_foreground
+from app.services.summary_pipeline import SummaryPipeline
+
+logger = logging.getLogger(__name__)
+
+# Identical requests share one job while it is queued or running
+JobKey = Tuple[int, Optional[int], Optional[str], str, str, Optional[Tuple[int, int]], bool, Optional[str]]
+
+
+class JobQueueFullError(Exception):
+    """Too many jobs are waiting to run"""
+
+
+class SummaryJob:
+    """A summarization request running in the background"""
+
+    def __init__(self, key: JobKey):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.model = key[4]
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.progress: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        book_id, page_number, text_url, mode, _, chapters, _, question = self.key
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "book_id": book_id,
+            "page_number": page_number,
+            "text_url": text_url,
+            "mode": mode,
+            "model": self.model,
+            "chapter_start": chapters[0] if chapters is not None else None,
+            "chapter_end": chapters[1] if chapters is not None else None,
+            "question": question,
+            "stage": self.stage,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+# Runs the pipeline for a job; receives the job and the slot guarding its model
+JobRunner = Callable[[SummaryJob, asyncio.Semaphore], Awaitable[Dict[str, Any]]]
+
+
+async def run_summary_pipeline(job: SummaryJob, llm_slot: asyncio.Semaphore) -> Dict[str, Any]:
+    """Run the summary pipeline for a job, recording each completed stage on it"""
+    async def on_progress(stage: str, details: Dict[str, Any]) -> None:
+        job.stage = stage
+        job.progress.append({"stage": stage, **details})
+
+    book_id, page_number, text_url, mode, _, chapters, include_original_text, question = job.key
+    pipeline = SummaryPipeline(book_id, page_number, text_url, mode, on_progress, chapters, question)
+    return await run_foreground(pipeline, llm_slot=llm_slot, include_original_text=include_original_text)
+
+
+class SummaryJobQueue:
+    """
+    In-process queue of summarization jobs
+
+    A fixed pool of worker tasks runs queued jobs. Downloading and paginating
+    run freely, but the LLM stages of each job hold a slot of its model, so at
+    most model_concurrency jobs talk to any one model at a time. Submitting a
+    request identical to a queued or running job returns that job instead of
+    queueing a duplicate. Finished jobs are kept (oldest dropped first) so
+    clients can poll for the result.
+
+    Jobs live in memory only: they are lost when the process restarts, and
+    each worker process has its own queue.
+    """
+
+    def __init__(
+        self,
+        workers: int = SUMMARY_JOB_WORKERS,
+        model_concurrency: int = SUMMARY_JOB_MODEL_CONCURRENCY,
+        max_queued: int = SUMMARY_JOB_MAX_QUEUED,
+        max_finished: int = SUMMARY_JOB_MAX_FINISHED,
+        runner: JobRunner = run_summary_pipeline,
+    ):
+        self.workers = workers
+        self.model_concurrency = model_concurrency
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.runner = runner
+        self.stats: Counter = Counter()
+        self._jobs: "OrderedDict[str, SummaryJob]" = OrderedDict()
+        self._active: Dict[JobKey, SummaryJob] = {}
+        self._model_slots: Dict[str, asyncio.Semaphore] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_workers(self) -> None:
+        # Workers, the queue and the semaphores belong to one event loop; start
+        # them lazily and restart them if the loop changed (e.g. between TestClients)
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._model_slots = {}
+        for job in self._active.values():
+            self._fail(job, "Job was interrupted")
+        self._active = {}
+        # Workers outlive the request that starts them, so they must not inherit its
+        # context (and with it the request's metrics timings)
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)
+        ]
+
+    def _model_slot(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_slots:
+            self._model_slots[model] = asyncio.Semaphore(self.model_concurrency)
+        return self._model_slots[model]
+
+    def submit(
+        self,
+        book_id: int,
+        page_number: Optional[int],
+        text_url: Optional[str] = None,
+        mode: str = "full",
+        model: Optional[str] = None,
+        chapters: Optional[Tuple[int, int]] = None,
+        include_original_text: bool = False,
+        question: Optional[str] = None,
+    ) -> Tuple[SummaryJob, bool]:
+        """
+        Queue a summarization job, or join an identical unfinished one
+
+        Args:
+            book_id: ID of the book to summarize
+            page_number: Page to summarize up to (None when summarizing chapters)
+            text_url: Optional URL of the plain text version of the book
+            mode: Summarization mode
+            model: LLM model whose concurrency slot the job uses (default: the
+                models the LLM backend serves, as pipelines use it)
+            chapters: First and last chapter to summarize, instead of a page range
+            include_original_text: Put the summarized text itself in the result
+            question: The question to answer in retrieval mode
+
+        Returns:
+            Tuple of the job and whether it was newly created
+
+        Raises:
+            JobQueueFullError: If max_queued jobs are already waiting
+        """
+        self._ensure_workers()
+        if model is None:
+            model = get_llm_backend().model
+        key = (book_id, page_number, text_url, mode, model, chapters, include_original_text, question)
+        job = self._active.get(key)
+        if job is not None:
+            self.stats["deduplicated"] += 1
+            return job, False
+        if self._queue.qsize() >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise JobQueueFullError(f"{self._queue.qsize()} summary jobs are already queued")
+
+        job = SummaryJob(key)
+        self._jobs[job.id] = job
+        self._active[key] = job
+        self._queue.put_nowait(job)
+        self.stats["submitted"] += 1
+        return job, True
+
+    def get(self, job_id: str) -> Optional[SummaryJob]:
+        """Look up a job by ID (None when unknown or already dropped)"""
+        return self._jobs.get(job_id)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: SummaryJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = await self.runner(job, self._model_slot(job.model))
+            job.status = "done"
+            self.stats["completed"] += 1
+        except asyncio.CancelledError:
+            self._fail(job, "Job was cancelled")
+            raise
+        except Exception as e:
+            logger.exception("Summary job failed", extra={"job_id": job.id, "book_id": job.key[0]})
+            self._fail(job, f"Error generating summary: {str(e)}")
+        finally:
+            job.finished_at = time.time()
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+            self._drop_finished()
+
+    def _fail(self, job: SummaryJob, error: str) -> None:
+        job.status = "failed"
+        job.error = error
+        job.finished_at = time.time()
+        self.stats["failed"] += 1
+
+    def _drop_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def snapshot(self) -> Dict[str, int]:
+        """Counters plus the current number of queued and running jobs"""
+        statuses = Counter(job.status for job in self._jobs.values())
+        return {**self.stats, "queued": statuses["queued"], "running": statuses["running"]}
+
+    async def close(self) -> None:
+        """Stop the workers; unfinished jobs are marked failed"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        for job in self._active.values():
+            if not job.finished:
+                self._fail(job, "Job was interrupted")
+        self._active = {}
+        self._worker_tasks = []
+        self._loop = None
+
+
+_job_queue: Optional[SummaryJobQueue] = None
+
+
+def get_job_queue() -> SummaryJobQueue:
+    """
+    Get the process-wide summary job queue
+
+    Returns:
+        The shared SummaryJobQueue
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = SummaryJobQueue()
+    return _job_queue
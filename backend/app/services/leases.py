@@ -0,0 +1,171 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Tuple, TypeVar
+from app.core.config import CACHE_DIR, SINGLE_FLIGHT_ENABLED, SINGLE_FLIGHT_LEASE_SECONDS, SINGLE_FLIGHT_POLL_SECONDS
+
+T = TypeVar("T")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class LeaseStore:
+    """
+    Named, expiring leases in SQLite, for single-flight work across processes
+
+    Workers sharing CACHE_DIR take the lease of a piece of work (a download,
+    a summary) before doing it; the others wait for the lease to be released
+    and then read the result from the shared caches. A holder renews its
+    lease while it works, so a lease only expires when its holder died. Like
+    the summary cache, every operation opens a short-lived connection.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = SINGLE_FLIGHT_LEASE_SECONDS,
+        poll_interval: float = SINGLE_FLIGHT_POLL_SECONDS,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.stats: Dict[str, int] = {"acquired": 0, "waited": 0, "expired": 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += amount
+
+    def acquire(self, name: str, owner: str) -> bool:
+        """
+        Take a lease unless another owner holds it
+
+        Args:
+            name: Name of the work the lease guards
+            owner: Unique ID of the caller
+
+        Returns:
+            Whether the caller now holds the lease
+        """
+        now = time.time()
+        with self._connect() as conn:
+            expired = conn.execute("DELETE FROM leases WHERE name = ? AND expires_at < ?", (name, now)).rowcount
+            acquired = conn.execute(
+                "INSERT OR IGNORE INTO leases VALUES (?, ?, ?)", (name, owner, now + self.lease_seconds)
+            ).rowcount == 1
+        if expired:
+            self._count("expired", expired)
+        if acquired:
+            self._count("acquired")
+        return acquired
+
+    def renew(self, name: str, owner: str) -> bool:
+        """Extend a lease held by owner; returns False if it was lost"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?",
+                (time.time() + self.lease_seconds, name, owner),
+            ).rowcount == 1
+
+    def release(self, name: str, owner: str) -> None:
+        """Give up a lease held by owner"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def is_held(self, name: str) -> bool:
+        """Check whether anyone holds an unexpired lease"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM leases WHERE name = ? AND expires_at >= ?", (name, time.time())
+            ).fetchone()
+        return row is not None
+
+    async def _keep_alive(self, name: str, owner: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await asyncio.to_thread(self.renew, name, owner)
+
+    async def single_flight(
+        self,
+        name: str,
+        check: Callable[[], Awaitable[Optional[T]]],
+        compute: Callable[[], Awaitable[T]],
+    ) -> Tuple[T, bool]:
+        """
+        Compute a value at most once across processes, after a cache miss
+
+        The caller that gets the lease checks the cache once more (the previous
+        holder may have just finished) and otherwise computes the value, which
+        compute must store where check finds it. Everyone else waits for the
+        lease to be released and checks the cache again; if the holder failed,
+        one of them takes over.
+
+        Args:
+            name: Name of the work, e.g. "summary:<key>"
+            check: Coroutine function returning the cached value, or None
+            compute: Coroutine function computing and storing the value
+
+        Returns:
+            Tuple of the value and whether this caller computed it
+        """
+        owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        while True:
+            if await asyncio.to_thread(self.acquire, name, owner):
+                keep_alive = asyncio.create_task(self._keep_alive(name, owner))
+                try:
+                    value = await check()
+                    if value is not None:
+                        return value, False
+                    return await compute(), True
+                finally:
+                    keep_alive.cancel()
+                    await asyncio.to_thread(self.release, name, owner)
+
+            self._count("waited")
+            while await asyncio.to_thread(self.is_held, name):
+                await asyncio.sleep(self.poll_interval)
+            value = await check()
+            if value is not None:
+                return value, False
+
+
+_lease_store: Optional[LeaseStore] = None
+
+
+def get_lease_store() -> Optional[LeaseStore]:
+    """
+    Get the process-wide lease store
+
+    Returns:
+        The LeaseStore, or None when SINGLE_FLIGHT_ENABLED is off
+    """
+    global _lease_store
+    if not SINGLE_FLIGHT_ENABLED:
+        return None
+    if _lease_store is None:
+        _lease_store = LeaseStore(os.path.join(CACHE_DIR, "leases.sqlite3"))
+    return _lease_store
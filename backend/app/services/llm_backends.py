@@ -0,0 +1,560 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import random
+import time
+import httpx
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import (
+    LLM_BACKEND,
+    LLM_BATCH_MAX_PROMPT_TOKENS,
+    LLM_BATCH_SIZE,
+    LLM_BATCH_WINDOW_SECONDS,
+    LLM_CONCURRENCY_INITIAL,
+    LLM_CONCURRENCY_MAX,
+    LLM_CONCURRENCY_MIN,
+    LLM_LATENCY_TARGET_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_MODELS,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    OLLAMA_HOSTS,
+    OPENAI_API_BASES,
+    OPENAI_API_KEY,
+)
+from app.services.http_clients import get_ollama_client
+from app.services.tokens import context_window, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Status codes that mean "try again later" (overload, restarting replica)
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Status codes that mean the server is overloaded, so the limiter backs off
+OVERLOAD_STATUS_CODES = {429, 503}
+
+
+class LLMBackendError(Exception):
+    """An LLM server call failed"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+class OllamaBackend:
+    """One Ollama server, called through the shared keep-alive client"""
+
+    name = "Ollama"
+    supports_batching = False
+
+    def __init__(self, host: str, model: str):
+        self.api_base = host
+        self.model = model
+        # Ollama's default num_ctx is smaller than most models support
+        self.context_tokens = context_window(model)
+
+    def _payload(self, prompt: str, system: str, max_tokens: int, temperature: float, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "system": system,
+            "stream": stream,
+            "options": {
+                "num_predict": max_tokens,
+                "num_ctx": self.context_tokens,
+                "temperature": temperature
+            }
+        }
+
+    def _connect_error(self, e: httpx.RequestError) -> LLMBackendError:
+        logger.warning("Request error to Ollama API", extra={"api_base": self.api_base, "error": str(e)})
+        return LLMBackendError(
+            f"Failed to connect to Ollama API: {e}. Make sure Ollama is running at {self.api_base}", retryable=True
+        )
+
+    def _status_error(self, status_code: int, text: str) -> LLMBackendError:
+        logger.warning("Ollama API error", extra={"api_base": self.api_base, "status_code": status_code, "error": text})
+        return LLMBackendError(
+            f"Ollama API returned error {status_code}: {text}",
+            status_code=status_code,
+            retryable=status_code in RETRYABLE_STATUS_CODES,
+        )
+
+    async def generate(self, prompt: str, system: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """
+        Call Ollama's /api/generate endpoint
+
+        Returns:
+            Dict with the response text and prompt/completion token counts
+            (None when Ollama does not report them)
+        """
+        url = f"{self.api_base}/api/generate"
+        payload = self._payload(prompt, system, max_tokens, temperature, stream=False)
+
+        logger.debug("Calling Ollama API", extra={"url": url, "model": self.model})
+
+        try:
+            response = await get_ollama_client().post(url, json=payload, timeout=60.0)
+        except httpx.RequestError as e:
+            raise self._connect_error(e)
+        logger.debug("Ollama API responded", extra={"url": url, "status_code": response.status_code})
+        if response.status_code >= 400:
+            raise self._status_error(response.status_code, response.text)
+
+        result = response.json()
+        return {
+            "response": result.get("response", ""),
+            "prompt_tokens": result.get("prompt_eval_count"),
+            "completion_tokens": result.get("eval_count"),
+        }
+
+    async def generate_batch(self, prompts: List[str], system: str, max_tokens: int, temperature: float) -> List[Dict[str, Any]]:
+        # Ollama has no batch endpoint; it schedules parallel requests itself
+        return await asyncio.gather(*(self.generate(prompt, system, max_tokens, temperature) for prompt in prompts))
+
+    async def stream(self, prompt: str, system: str, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        """Yield response pieces from Ollama's stream mode (one JSON object per line)"""
+        url = f"{self.api_base}/api/generate"
+        payload = self._payload(prompt, system, max_tokens, temperature, stream=True)
+
+        logger.debug("Streaming from Ollama API", extra={"url": url, "model": self.model})
+
+        try:
+            async with get_ollama_client().stream("POST", url, json=payload, timeout=60.0) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise self._status_error(response.status_code, response.text)
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise LLMBackendError(f"Ollama API returned error: {chunk['error']}")
+                    if chunk.get("response"):
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        break
+        except httpx.RequestError as e:
+            raise self._connect_error(e)
+
+
+class OpenAICompatibleBackend:
+    """
+    One OpenAI-compatible server (llama.cpp server, vLLM, LM Studio, ...)
+
+    Single prompts and streams use /v1/chat/completions so the server applies
+    the model's chat template. Batches use /v1/completions, which accepts a
+    list of prompts and lets the server run them in one forward pass.
+    """
+
+    name = "OpenAI-compatible server"
+    supports_batching = True
+
+    def __init__(self, api_base: str, model: str, api_key: Optional[str] = None):
+        self.api_base = api_base.rstrip("/")
+        self.model = model
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"{self.api_base}{path}"
+        try:
+            response = await get_ollama_client().post(url, json=payload, headers=self.headers, timeout=60.0)
+        except httpx.RequestError as e:
+            raise LLMBackendError(f"Failed to connect to {url}: {e}", retryable=True)
+        if response.status_code >= 400:
+            raise LLMBackendError(
+                f"{self.name} returned error {response.status_code}: {response.text}",
+                status_code=response.status_code,
+                retryable=response.status_code in RETRYABLE_STATUS_CODES,
+            )
+        return response.json()
+
+    def _messages(self, prompt: str, system: str) -> List[Dict[str, str]]:
+        return [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+
+    async def generate(self, prompt: str, system: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        result = await self._post("/v1/chat/completions", {
+            "model": self.model,
+            "messages": self._messages(prompt, system),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        })
+        usage = result.get("usage") or {}
+        return {
+            "response": result["choices"][0]["message"]["content"],
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+        }
+
+    async def generate_batch(self, prompts: List[str], system: str, max_tokens: int, temperature: float) -> List[Dict[str, Any]]:
+        result = await self._post("/v1/completions", {
+            "model": self.model,
+            "prompt": [f"{system}\n\n{prompt}" for prompt in prompts],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        })
+        choices = sorted(result["choices"], key=lambda choice: choice.get("index", 0))
+        # Usage is reported for the whole batch only
+        return [{"response": choice["text"], "prompt_tokens": None, "completion_tokens": None} for choice in choices]
+
+    async def stream(self, prompt: str, system: str, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        """Yield response pieces from the server-sent events of a streamed chat completion"""
+        url = f"{self.api_base}/v1/chat/completions"
+        payload = {
+            "model": self.model,
+            "messages": self._messages(prompt, system),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        try:
+            async with get_ollama_client().stream("POST", url, json=payload, headers=self.headers, timeout=60.0) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise LLMBackendError(
+                        f"{self.name} returned error {response.status_code}: {response.text}",
+                        status_code=response.status_code,
+                        retryable=response.status_code in RETRYABLE_STATUS_CODES,
+                    )
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {})
+                    if delta.get("content"):
+                        yield delta["content"]
+        except httpx.RequestError as e:
+            raise LLMBackendError(f"Failed to connect to {url}: {e}", retryable=True)
+
+
+class FakeBackend:
+    """
+    Deterministic stand-in LLM for tests and offline development
+
+    The same prompt always gets the same answer. Page-number questions are
+    answered with "Page 1"; everything else gets a short summary-shaped reply.
+    """
+
+    name = "fake LLM"
+    supports_batching = True
+
+    def __init__(self, model: str = "fake", latency: float = 0.0):
+        self.api_base = "fake://"
+        self.model = model
+        self.latency = latency
+        self.prompts: List[str] = []
+        self.batches: List[int] = []
+
+    def _answer(self, prompt: str) -> str:
+        if "first page of important text" in prompt:
+            return "Page 1"
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"Key plot points: summary {digest}\nThemes: fake\nCharacter development: fake"
+
+    async def generate(self, prompt: str, system: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        self.prompts.append(prompt)
+        await asyncio.sleep(self.latency)
+        answer = self._answer(prompt)
+        return {"response": answer, "prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(answer)}
+
+    async def generate_batch(self, prompts: List[str], system: str, max_tokens: int, temperature: float) -> List[Dict[str, Any]]:
+        self.batches.append(len(prompts))
+        return [await self.generate(prompt, system, max_tokens, temperature) for prompt in prompts]
+
+    async def stream(self, prompt: str, system: str, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        result = await self.generate(prompt, system, max_tokens, temperature)
+        for word in result["response"].split(" "):
+            yield word + " "
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit (additive increase, multiplicative decrease)
+
+    Each success below latency_target raises the limit by 1/limit, so about
+    one more concurrent call per round of successes. An overload response
+    (429/503) or a call slower than latency_target multiplies it by backoff,
+    at most once per latency_target: the calls in flight when the server
+    slowed down all report it, but they are one congestion event.
+    """
+
+    def __init__(
+        self,
+        initial: int = LLM_CONCURRENCY_INITIAL,
+        minimum: int = LLM_CONCURRENCY_MIN,
+        maximum: int = LLM_CONCURRENCY_MAX,
+        latency_target: float = LLM_LATENCY_TARGET_SECONDS,
+        backoff: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.clock = clock
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Waiters belong to one event loop; start over if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self.in_flight = 0
+        return self._condition
+
+    async def acquire(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: Optional[float], overloaded: bool = False) -> None:
+        """
+        Give back a slot and adjust the limit
+
+        Args:
+            latency: Seconds the call took, or None when it failed for another reason
+            overloaded: Whether the server reported overload
+        """
+        if overloaded or (latency is not None and latency > self.latency_target):
+            now = self.clock()
+            if now - self._last_decrease >= self.latency_target:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._last_decrease = now
+        elif latency is not None:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight = max(self.in_flight - 1, 0)
+            condition.notify_all()
+
+    @property
+    def load(self) -> float:
+        return self.in_flight / max(self.limit, 1)
+
+
+class PromptBatcher:
+    """
+    Collect small prompts submitted at about the same time into one call
+
+    Prompts with the same system prompt and token limit that arrive within
+    window seconds are sent together, up to max_size at a time.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[str], str, int, float], Awaitable[List[Dict[str, Any]]]],
+        max_size: int = LLM_BATCH_SIZE,
+        window: float = LLM_BATCH_WINDOW_SECONDS,
+    ):
+        self.send = send
+        self.max_size = max_size
+        self.window = window
+        self._pending: Dict[Tuple[str, int, float], List[Tuple[str, asyncio.Future]]] = {}
+        # Keep references to in-flight sends so they are not garbage collected
+        self._tasks = set()
+
+    async def submit(self, prompt: str, system: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        group = (system, max_tokens, temperature)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(group, [])
+        pending.append((prompt, future))
+        if len(pending) == 1:
+            asyncio.get_running_loop().call_later(self.window, self._flush, group)
+        if len(pending) >= self.max_size:
+            self._flush(group)
+        return await future
+
+    def _flush(self, group: Tuple[str, int, float]) -> None:
+        batch = self._pending.pop(group, None)
+        if batch:
+            task = asyncio.create_task(self._send(group, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, group: Tuple[str, int, float], batch: List[Tuple[str, asyncio.Future]]) -> None:
+        system, max_tokens, temperature = group
+        try:
+            results = await self.send([prompt for prompt, _ in batch], system, max_tokens, temperature)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class ReplicaPool:
+    """
+    Load-balanced, retrying front for one or more backend replicas
+
+    Each call goes to the replica with the lowest load (in-flight calls over
+    its adaptive concurrency limit), round-robin among equals. Connection
+    errors and 429/502/503/504 responses are retried on another replica when
+    there is one, after a fully jittered exponential backoff. Small prompts
+    are batched when the replicas support it.
+    """
+
+    def __init__(
+        self,
+        replicas: List[Any],
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base_delay: float = LLM_RETRY_BASE_DELAY,
+        retry_max_delay: float = LLM_RETRY_MAX_DELAY,
+        batch_size: int = LLM_BATCH_SIZE,
+        batch_max_prompt_tokens: int = LLM_BATCH_MAX_PROMPT_TOKENS,
+        limiter_factory: Callable[[], AIMDLimiter] = AIMDLimiter,
+    ):
+        if not replicas:
+            raise ValueError("At least one LLM replica is required")
+        self.replicas = replicas
+        self.limiters = [limiter_factory() for _ in replicas]
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.batch_max_prompt_tokens = batch_max_prompt_tokens
+        self.batcher = (
+            PromptBatcher(self._generate_batch, max_size=batch_size)
+            if batch_size > 1 and all(replica.supports_batching for replica in replicas) else None
+        )
+        self._round_robin = itertools.count()
+        self.name = replicas[0].name
+        # Replicas are interchangeable, so cached results are keyed by the set of models
+        self.model = ",".join(sorted({replica.model for replica in replicas}))
+        self.api_base = ",".join(replica.api_base for replica in replicas)
+
+    def _pick(self, exclude: Optional[int]) -> int:
+        start = next(self._round_robin)
+        order = [(start + offset) % len(self.replicas) for offset in range(len(self.replicas))]
+        if exclude is not None and len(order) > 1:
+            order.remove(exclude)
+        return min(order, key=lambda i: self.limiters[i].load)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    async def _call(self, call: Callable[[Any], Awaitable[Any]]) -> Any:
+        failed = None
+        for attempt in range(self.max_retries + 1):
+            index = self._pick(exclude=failed)
+            limiter = self.limiters[index]
+            await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = await call(self.replicas[index])
+            except LLMBackendError as e:
+                await limiter.release(None, overloaded=e.status_code in OVERLOAD_STATUS_CODES)
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+                failed = index
+                logger.warning("LLM call failed, retrying", extra={"api_base": self.replicas[index].api_base, "attempt": attempt + 1, "error": str(e)})
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            except BaseException:
+                await limiter.release(None)
+                raise
+            await limiter.release(time.perf_counter() - start)
+            return result
+
+    async def _generate_batch(self, prompts: List[str], system: str, max_tokens: int, temperature: float) -> List[Dict[str, Any]]:
+        return await self._call(lambda replica: replica.generate_batch(prompts, system, max_tokens, temperature))
+
+    async def generate(self, prompt: str, system: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """
+        Run one prompt on the least loaded replica
+
+        Returns:
+            Dict with the response text and prompt/completion token counts (None when unknown)
+        """
+        if self.batcher is not None and estimate_tokens(prompt) <= self.batch_max_prompt_tokens:
+            return await self.batcher.submit(prompt, system, max_tokens, temperature)
+        return await self._call(lambda replica: replica.generate(prompt, system, max_tokens, temperature))
+
+    async def stream(self, prompt: str, system: str, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        """Stream one prompt; failures are retried only until the first piece has been yielded"""
+        failed = None
+        for attempt in range(self.max_retries + 1):
+            index = self._pick(exclude=failed)
+            limiter = self.limiters[index]
+            await limiter.acquire()
+            start, started = time.perf_counter(), False
+            try:
+                async for piece in self.replicas[index].stream(prompt, system, max_tokens, temperature):
+                    started = True
+                    yield piece
+            except LLMBackendError as e:
+                await limiter.release(None, overloaded=e.status_code in OVERLOAD_STATUS_CODES)
+                if started or not e.retryable or attempt == self.max_retries:
+                    raise
+                failed = index
+                logger.warning("LLM stream failed, retrying", extra={"api_base": self.replicas[index].api_base, "attempt": attempt + 1, "error": str(e)})
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            except BaseException:
+                await limiter.release(None)
+                raise
+            await limiter.release(time.perf_counter() - start)
+            return
+
+
+def _pair_replicas(hosts: List[str], models: List[str]) -> List[Tuple[str, str]]:
+    # One model serves every host, one host serves every model, or they pair up by position
+    if len(models) == 1:
+        return [(host, models[0]) for host in hosts]
+    if len(hosts) == 1:
+        return [(hosts[0], model) for model in models]
+    if len(hosts) != len(models):
+        raise ValueError("LLM_MODEL must list one model, or one model per host")
+    return list(zip(hosts, models))
+
+
+def create_llm_backend(backend: str = LLM_BACKEND) -> ReplicaPool:
+    """
+    Build the configured LLM backend
+
+    Args:
+        backend: "ollama", "openai" or "fake"
+
+    Returns:
+        A ReplicaPool over every configured replica
+    """
+    if backend == "ollama":
+        replicas = [OllamaBackend(host, model) for host, model in _pair_replicas(OLLAMA_HOSTS, LLM_MODELS)]
+    elif backend == "openai":
+        replicas = [
+            OpenAICompatibleBackend(api_base, model, OPENAI_API_KEY)
+            for api_base, model in _pair_replicas(OPENAI_API_BASES, LLM_MODELS)
+        ]
+    elif backend == "fake":
+        replicas = [FakeBackend(model) for model in LLM_MODELS]
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND: {backend}")
+    return ReplicaPool(replicas)
+
+
+_llm_backend: Optional[ReplicaPool] = None
+
+
+def get_llm_backend() -> ReplicaPool:
+    """
+    Get the process-wide LLM backend
+
+    Returns:
+        The shared ReplicaPool
+    """
+    global _llm_backend
+    if _llm_backend is None:
+        _llm_backend = create_llm_backend()
+    return _llm_backend
@@ -1,16 +1,129 @@
-import httpx
-from typing import Optional, Dict, Any, List
-from app.core.config import OLLAMA_HOST, LLM_MODEL
+import hashlib
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+from app.core.config import PROMPT_COMPACTION_ENABLED
+from app.services.compaction import COMPACTION_VERSION
+from app.services.llm_backends import get_llm_backend
+from app.services.metrics import record_size, timed
+from app.services.tokens import context_window, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Prompt templates. PROMPT_VERSION changes whenever a template (or how the book
+# text in it is compacted) changes, so cached LLM results produced by older
+# prompts are not reused.
+PAGE_NUMBER_PROMPT = """You are tasked at figuring out at which point important text in a book begins. Important text is the text that
+        includes only content text and excludes the preface, content page, dedication, acknowledgments, and other non-content text. 
+        Return the page number of the first page of important text.
+        Output response should be Page <number> where <number> is the page number of the first page of important text.
+        {text}"""
+
+SUMMARY_PROMPT = """You are tasked at summarizing text from a book. Focus on key plot points, themes, and character development. 
+        Present the output in a nicely formatted manner as shown here:
+        Sample output:
+        This summary is about <book_name> by <author_name> and is summarized up to page <page_number>
+        Key plot points: <plot_points>
+        Themes: <themes>
+        Character development: <character_development>
+      
+        {text}"""
+
+ROLLING_SUMMARY_PROMPT = """You are tasked at continuing the summary of a book. Below is the summary of the book so far, followed by the
+        pages that come next. Rewrite the summary so that it covers both. Focus on key plot points, themes, and character development.
+        Present the output in the same format as the summary so far:
+        Key plot points: <plot_points>
+        Themes: <themes>
+        Character development: <character_development>
+
+        Summary so far:
+        {summary}
+
+        Next pages:
+        {text}"""
+
+CHUNK_SUMMARY_PROMPT = """You are tasked at summarizing one passage of a longer book. Summarize the passage below in a few short
+        paragraphs. Keep every plot event, named character and theme that appears, in the order they appear.
+        Do not add an introduction or any commentary.
+
+        {text}"""
+
+COMBINE_SUMMARIES_PROMPT = """You are tasked at combining summaries of consecutive passages of a book into a single summary.
+        Focus on key plot points, themes, and character development.
+        Present the output in a nicely formatted manner as shown here:
+        Key plot points: <plot_points>
+        Themes: <themes>
+        Character development: <character_development>
+
+        {text}"""
+
+RETRIEVAL_PROMPT = """You are tasked at answering a reader's question about a book from selected passages of it. The passages
+        are in reading order and each one starts with its page number. Only use what the passages say, focus on the
+        characters, events and themes the question asks about, and say so when the passages do not answer it.
+
+        Question: {question}
+
+        {text}"""
+
+PROMPT_VERSION = hashlib.sha256(
+    (
+        PAGE_NUMBER_PROMPT + SUMMARY_PROMPT + ROLLING_SUMMARY_PROMPT + CHUNK_SUMMARY_PROMPT + COMBINE_SUMMARIES_PROMPT
+        + RETRIEVAL_PROMPT + f"compaction-{COMPACTION_VERSION if PROMPT_COMPACTION_ENABLED else 0}"
+    ).encode("utf-8")
+).hexdigest()[:12]
+
+SYSTEM_PROMPT = "You are a helpful assistant that provides concise book summaries."
 
 class LLMService:
-    """Service for interacting with LLM APIs for text summarization using Ollama"""
-    
-    def __init__(self):
-        self.api_base = OLLAMA_HOST
-        self.model = LLM_MODEL
+    """Service for interacting with LLM APIs for text summarization (Ollama by default)"""
     
+    def __init__(self, backend: Optional[Any] = None, temperature: float = 0.7):
+        """
+        Args:
+            backend: Backend to call (anything with generate/stream, see
+                llm_backends); defaults to the configured, shared ReplicaPool
+            temperature: Sampling temperature for every call
+        """
+        self.backend = backend if backend is not None else get_llm_backend()
+        self.api_base = self.backend.api_base
+        self.model = self.backend.model
+        self.temperature = temperature
+        self.context_tokens = context_window(self.model)
+
+    def prompt_budget(self, template: str = SUMMARY_PROMPT, max_tokens: int = 500) -> int:
+        """
+        Get how many tokens of book text fit in a prompt
+        
+        Args:
+            template: The prompt template the text goes into
+            max_tokens: Tokens reserved for the response
+            
+        Returns:
+            The context window minus the response, the template and system
+            prompt, and a 10% margin for token estimation error
+        """
+        overhead = estimate_tokens(template) + estimate_tokens(SYSTEM_PROMPT)
+        return max(int(self.context_tokens * 0.9) - max_tokens - overhead, 0)
+
+    async def _generate(self, prompt: str, max_tokens: int, operation: str) -> Dict[str, Any]:
+        """
+        Run a prompt on the LLM backend
+        
+        Args:
+            prompt: The full prompt
+            max_tokens: Maximum length of the response
+            operation: Name the call is timed under in the metrics
+            
+        Returns:
+            Dict with the response text and prompt/completion token counts
+        """
+        with timed(operation, llm=True):
+            result = await self.backend.generate(prompt, SYSTEM_PROMPT, max_tokens, self.temperature)
+        record_size("prompt_tokens", result.get("prompt_tokens") or estimate_tokens(prompt))
+        if result.get("completion_tokens") is not None:
+            record_size("completion_tokens", result["completion_tokens"])
+        return result
 
-    def get_page_number(self, text: str, max_tokens: int = 500) -> str:
+    async def get_page_number(self, text: str, max_tokens: int = 500) -> str:
         """
         Extract text up to the specified page
         
@@ -21,56 +134,19 @@ class LLMService:
         Returns:
             Page number
         """
-        prompt = f"""You are tasked at figuring out at which point important text in a book begins. Important text is the text that
-        includes only content text and excludes the preface, content page, dedication, acknowledgments, and other non-content text. 
-        Return the page number of the first page of important text.
-        Output response should be Page <number> where <number> is the page number of the first page of important text.
-        {text}"""
+        prompt = PAGE_NUMBER_PROMPT.format(text=text)
 
         try:
-            # Using httpx for the API call to Ollama
-            url = f"{self.api_base}/api/generate"
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "system": "You are a helpful assistant that provides concise book summaries.",
-                "stream": False,
-                "options": {
-                    "num_predict": max_tokens,
-                    "temperature": 0.7
-                }
-            }
-            
-            print(f"Calling Ollama API at {url} with model {self.model}")
-            
-            try:
-                response = httpx.post(url, json=payload, timeout=60.0)
-                print(f"Ollama API response status: {response.status_code}")
-                
-                # If we got an error response, print the details
-                if response.status_code >= 400:
-                    print(f"Ollama API error: {response.text}")
-                    raise Exception(f"Ollama API returned error {response.status_code}: {response.text}")
-                    
-                response.raise_for_status()
-                result = response.json()
-                first_page_of_important_text = result['response']
-                return first_page_of_important_text
-
-            except httpx.RequestError as e:
-                print(f"Request error to Ollama API: {e}")
-                raise Exception(f"Failed to connect to Ollama API: {e}. Make sure Ollama is running at {self.api_base}")
-            except httpx.HTTPStatusError as e:
-                print(f"HTTP error from Ollama API: {e}")
-                raise Exception(f"Ollama API returned error {e.response.status_code}: {e.response.text}")
-            
+            result = await self._generate(prompt, max_tokens, "get_page_number")
+            first_page_of_important_text = result['response']
+            return first_page_of_important_text
         except Exception as e:
-            print(f"Error in LLMService.summarize_text: {str(e)}")
-            raise Exception(f"Error finding content-only text with Ollama: {str(e)}")
+            logger.error("LLM call failed", extra={"operation": "get_page_number", "backend": self.backend.name, "error": str(e)})
+            raise Exception(f"Error finding content-only text with {self.backend.name}: {str(e)}")
     
-    def summarize_text(self, text: str, max_tokens: int = 500) -> str:
+    async def summarize_text(self, text: str, max_tokens: int = 500) -> str:
         """
-        Summarize the provided text using Ollama LLM
+        Summarize the provided text using the LLM
         
         Args:
             text: The text to summarize
@@ -79,52 +155,93 @@ class LLMService:
         Returns:
             A summary of the text
         """
-        prompt = f"""You are tasked at summarizing text from a book. Focus on key plot points, themes, and character development. 
-        Present the output in a nicely formatted manner as shown here:
-        Sample output:
-        This summary is about <book_name> by <author_name> and is summarized up to page <page_number>
-        Key plot points: <plot_points>
-        Themes: <themes>
-        Character development: <character_development>
-      
-        {text}"""
+        prompt = SUMMARY_PROMPT.format(text=text)
         
         try:
-            # Using httpx for the API call to Ollama
-            url = f"{self.api_base}/api/generate"
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "system": "You are a helpful assistant that provides concise book summaries.",
-                "stream": False,
-                "options": {
-                    "num_predict": max_tokens,
-                    "temperature": 0.7
-                }
-            }
+            result = await self._generate(prompt, max_tokens, "summarize_text")
+            return result.get("response") or "No summary generated"
+        except Exception as e:
+            logger.error("LLM call failed", extra={"operation": "summarize_text", "backend": self.backend.name, "error": str(e)})
+            raise Exception(f"Error generating summary with {self.backend.name}: {str(e)}")
+
+    async def stream_summary(self, text: str, max_tokens: int = 500) -> AsyncIterator[str]:
+        """
+        Summarize the provided text, yielding tokens as the LLM generates them
+        
+        Args:
+            text: The text to summarize
+            max_tokens: Maximum length of the summary
             
-            print(f"Calling Ollama API at {url} with model {self.model}")
+        Yields:
+            Pieces of the summary, in order
+        """
+        prompt = SUMMARY_PROMPT.format(text=text)
+        
+        try:
+            with timed("stream_summary", llm=True):
+                async for piece in self.backend.stream(prompt, SYSTEM_PROMPT, max_tokens, self.temperature):
+                    yield piece
+            record_size("prompt_tokens", estimate_tokens(prompt))
+        except Exception as e:
+            logger.error("LLM call failed", extra={"operation": "stream_summary", "backend": self.backend.name, "error": str(e)})
+            raise Exception(f"Error generating summary with {self.backend.name}: {str(e)}")
+
+    async def update_summary(self, previous_summary: str, text: str, max_tokens: int = 500) -> str:
+        """
+        Extend a running summary with the next pages of a book
+        
+        Args:
+            previous_summary: Summary of the book so far
+            text: The pages that follow the summarized text
+            max_tokens: Maximum length of the updated summary
             
-            try:
-                response = httpx.post(url, json=payload, timeout=60.0)
-                print(f"Ollama API response status: {response.status_code}")
-                
-                # If we got an error response, print the details
-                if response.status_code >= 400:
-                    print(f"Ollama API error: {response.text}")
-                    raise Exception(f"Ollama API returned error {response.status_code}: {response.text}")
-                    
-                response.raise_for_status()
-                result = response.json()
-                
-                return result.get("response", "No summary generated")
-            except httpx.RequestError as e:
-                print(f"Request error to Ollama API: {e}")
-                raise Exception(f"Failed to connect to Ollama API: {e}. Make sure Ollama is running at {self.api_base}")
-            except httpx.HTTPStatusError as e:
-                print(f"HTTP error from Ollama API: {e}")
-                raise Exception(f"Ollama API returned error {e.response.status_code}: {e.response.text}")
+        Returns:
+            A summary covering both the previous summary and the new text
+        """
+        prompt = ROLLING_SUMMARY_PROMPT.format(summary=previous_summary, text=text)
+        
+        try:
+            result = await self._generate(prompt, max_tokens, "update_summary")
+            return result.get("response") or previous_summary
+        except Exception as e:
+            logger.error("LLM call failed", extra={"operation": "update_summary", "backend": self.backend.name, "error": str(e)})
+            raise Exception(f"Error updating summary with {self.backend.name}: {str(e)}")
+
+    async def answer_question(self, question: str, text: str, max_tokens: int = 500) -> str:
+        """
+        Answer a question about a book from passages of it
+        
+        Args:
+            question: The reader's question
+            text: The passages to answer from
+            max_tokens: Maximum length of the answer
             
+        Returns:
+            The answer
+        """
+        prompt = RETRIEVAL_PROMPT.format(question=question, text=text)
+        
+        try:
+            result = await self._generate(prompt, max_tokens, "answer_question")
+            return result.get("response") or "No answer generated"
+        except Exception as e:
+            logger.error("LLM call failed", extra={"operation": "answer_question", "backend": self.backend.name, "error": str(e)})
+            raise Exception(f"Error answering question with {self.backend.name}: {str(e)}")
+
+    async def complete(self, prompt: str, max_tokens: int = 500) -> Dict[str, Any]:
+        """
+        Run a prompt and report token usage
+        
+        Args:
+            prompt: The full prompt
+            max_tokens: Maximum length of the response
+            
+        Returns:
+            Dict with the response text and the backend's prompt/completion token
+            counts (None when the backend does not report them)
+        """
+        try:
+            return await self._generate(prompt, max_tokens, "complete")
         except Exception as e:
-            print(f"Error in LLMService.summarize_text: {str(e)}")
-            raise Exception(f"Error generating summary with Ollama: {str(e)}")
+            logger.error("LLM call failed", extra={"operation": "complete", "backend": self.backend.name, "error": str(e)})
+            raise Exception(f"Error generating text with {self.backend.name}: {str(e)}")
@@ -0,0 +1,190 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from app.core.config import MAP_REDUCE_CHUNK_TOKENS, MAP_REDUCE_MAX_CONCURRENCY
+from app.services.book_text import BookText
+from app.services.llm_service import (
+    CHUNK_SUMMARY_PROMPT,
+    COMBINE_SUMMARIES_PROMPT,
+    SUMMARY_PROMPT,
+    LLMService,
+)
+from app.services.page_index import PageIndex
+from app.services.tokens import estimate_tokens, get_tokenizer
+
+
+class MapReduceSummarizer:
+    """
+    Hierarchical summarization for page ranges that do not fit in one prompt
+
+    The page range is cut into chunks of whole pages that fit in chunk_tokens,
+    using the page index's token estimates when they match count_tokens.
+    Chunks are summarized concurrently (at most max_concurrency LLM calls at
+    once), then the chunk summaries are combined in groups that fit the same
+    budget, recursively, until a single summary remains.
+
+    A limiter (semaphore) can be shared by several summarize calls, e.g. the
+    chapters of a range, so max_concurrency bounds their calls together.
+    """
+
+    def __init__(
+        self,
+        llm_service: LLMService,
+        chunk_tokens: int = MAP_REDUCE_CHUNK_TOKENS,
+        max_concurrency: int = MAP_REDUCE_MAX_CONCURRENCY,
+        count_tokens: Optional[Callable[[str], int]] = None,
+        limiter: Optional[asyncio.Semaphore] = None,
+    ):
+        self.llm_service = llm_service
+        self.limiter = limiter
+        self.chunk_tokens = chunk_tokens
+        self.max_concurrency = max_concurrency
+        self.count_tokens = count_tokens or estimate_tokens
+        # Page token estimates in the index are only comparable with the configured tokenizer
+        self._use_index_tokens = count_tokens is None
+
+    def chunk_bounds(self, book_text: BookText, page_index: PageIndex, first_page: int, last_page: int) -> List[Tuple[int, int]]:
+        """
+        Group consecutive pages into chunks that fit the token budget
+
+        A single page larger than the budget becomes a chunk of its own.
+
+        Args:
+            book_text: The original book text (only read when the index has no matching token estimates)
+            page_index: Page index of the book text
+            first_page: First page to include (1-based)
+            last_page: Last page to include (1-based, inclusive)
+
+        Returns:
+            List of (first page, last page) of each chunk, in page order
+        """
+        bounds = []
+        chunk_start, chunk_tokens = None, 0
+        last_page = min(last_page, len(page_index))
+        for page in range(max(first_page, 1), last_page + 1):
+            if self._use_index_tokens and page_index.has_tokens(get_tokenizer().name):
+                page_tokens = page_index.page_tokens(page, page)
+            else:
+                page_tokens = self.count_tokens(page_index.extract(book_text, page, page))
+            if chunk_start is not None and chunk_tokens + page_tokens > self.chunk_tokens:
+                bounds.append((chunk_start, page - 1))
+                chunk_start, chunk_tokens = None, 0
+            if chunk_start is None:
+                chunk_start = page
+            chunk_tokens += page_tokens
+        if chunk_start is not None:
+            bounds.append((chunk_start, last_page))
+        return bounds
+
+    def chunk_pages(self, book_text: BookText, page_index: PageIndex, first_page: int, last_page: int) -> List[str]:
+        """
+        Get the texts of the chunks from chunk_bounds
+
+        Returns:
+            List of chunk texts in page order
+        """
+        return [page_index.extract(book_text, first, last) for first, last in self.chunk_bounds(book_text, page_index, first_page, last_page)]
+
+    def _group_summaries(self, summaries: List[str]) -> List[List[str]]:
+        groups: List[List[str]] = [[]]
+        group_tokens = 0
+        for summary in summaries:
+            tokens = self.count_tokens(summary)
+            # Every group takes at least two summaries so each round makes progress
+            if len(groups[-1]) >= 2 and group_tokens + tokens > self.chunk_tokens:
+                groups.append([])
+                group_tokens = 0
+            groups[-1].append(summary)
+            group_tokens += tokens
+        if len(groups) > 1 and len(groups[-1]) == 1:
+            groups[-2].extend(groups.pop())
+        return groups
+
+    async def _run_stage(self, name: str, prompts: Sequence[Union[str, Callable[[], str]]], stages: List[Dict[str, Any]]) -> List[str]:
+        """Run prompts with bounded concurrency; callables are only built once a slot is free"""
+        semaphore = self.limiter or asyncio.Semaphore(self.max_concurrency)
+
+        async def run(prompt: Union[str, Callable[[], str]]) -> Tuple[Dict[str, Any], int]:
+            async with semaphore:
+                # Built here so at most max_concurrency chunk texts are in memory at once
+                prompt = prompt() if callable(prompt) else prompt
+                result = await self.llm_service.complete(prompt)
+                prompt_tokens = result["prompt_tokens"] if result["prompt_tokens"] is not None else self.count_tokens(prompt)
+                return result, prompt_tokens
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run(prompt) for prompt in prompts))
+        stages.append({
+            "stage": name,
+            "calls": len(prompts),
+            "seconds": round(time.perf_counter() - start, 3),
+            "prompt_tokens": sum(prompt_tokens for _, prompt_tokens in results),
+            "completion_tokens": sum(
+                result["completion_tokens"] if result["completion_tokens"] is not None else self.count_tokens(result["response"])
+                for result, _ in results
+            ),
+        })
+        return [result["response"] for result, _ in results]
+
+    async def summarize(
+        self,
+        book_text: BookText,
+        page_index: PageIndex,
+        first_page: int,
+        last_page: int,
+        chunks: Optional[Sequence[Union[str, Callable[[], str]]]] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Summarize pages first_page..last_page with map-reduce
+
+        Args:
+            book_text: The original book text
+            page_index: Page index of the book text
+            first_page: First page to include (1-based)
+            last_page: Last page to include (1-based, inclusive)
+            chunks: Precomputed chunks (texts, or callables returning them), if the caller already has them
+
+        Returns:
+            Tuple of the final summary and per-stage stats (calls, seconds and token counts)
+        """
+        if chunks is None:
+            # Chunk texts are extracted only when their LLM call starts
+            chunks = [
+                lambda first=first, last=last: page_index.extract(book_text, first, last)
+                for first, last in self.chunk_bounds(book_text, page_index, first_page, last_page)
+            ]
+        stages: List[Dict[str, Any]] = []
+        if len(chunks) <= 1:
+            prompt = lambda: SUMMARY_PROMPT.format(text="".join(chunk() if callable(chunk) else chunk for chunk in chunks))
+            summaries = await self._run_stage("map", [prompt], stages)
+            return summaries[0], stages
+
+        prompts = [
+            (lambda chunk=chunk: CHUNK_SUMMARY_PROMPT.format(text=chunk() if callable(chunk) else chunk))
+            for chunk in chunks
+        ]
+        summaries = await self._run_stage("map", prompts, stages)
+        return await self.reduce(summaries, stages), stages
+
+    async def reduce(self, summaries: List[str], stages: List[Dict[str, Any]]) -> str:
+        """
+        Combine summaries in groups that fit the token budget, recursively, until one remains
+
+        Args:
+            summaries: Summaries of consecutive passages, in order
+            stages: List the stats of each reduce stage are appended to
+
+        Returns:
+            The combined summary
+        """
+        level = 1
+        while len(summaries) > 1:
+            prompts = [
+                COMBINE_SUMMARIES_PROMPT.format(
+                    text="\n\n".join(f"Passage {i}:\n{summary}" for i, summary in enumerate(group, start=1))
+                )
+                for group in self._group_summaries(summaries)
+            ]
+            summaries = await self._run_stage(f"reduce-{level}", prompts, stages)
+            level += 1
+        return summaries[0]
@@ -0,0 +1,274 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.core.config import METRICS_ENABLED, SERVER_TIMING_ENABLED
+
+# Seconds: from a cache hit (sub-millisecond) to a slow LLM call (minutes)
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Bytes, pages and tokens all span several orders of magnitude
+SIZE_BUCKETS = tuple(10 ** exponent for exponent in range(0, 9))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Histogram:
+    """Prometheus histogram with fixed buckets and optional labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labelvalues, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, f'le="{_format_number(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_number(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Counter:
+    """Prometheus counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            snapshot = list(self._values.items())
+        for labelvalues, value in snapshot:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_number(value)}"
+
+
+class Registry:
+    """Metrics rendered on /metrics, plus collectors that read counters kept elsewhere"""
+
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def gauge_lines(name: str, documentation: str, labelnames: Sequence[str], values: Dict[Tuple[str, ...], float]) -> List[str]:
+    """Render values read at scrape time (e.g. counters kept by the caches) as a Prometheus gauge"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for labelvalues, value in values.items():
+        lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_number(value)}")
+    return lines
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "book_summarizer_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "book_summarizer_stage_duration_seconds", "Time spent in each summary pipeline stage", ("stage",)
+))
+LLM_SECONDS = REGISTRY.register(Histogram(
+    "book_summarizer_llm_call_duration_seconds", "LLM call latency by operation", ("operation",)
+))
+SIZES = REGISTRY.register(Histogram(
+    "book_summarizer_request_size", "Bytes, pages and tokens handled per summary request", ("kind",), SIZE_BUCKETS
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "book_summarizer_cache_lookups_total", "Cache lookups made while serving requests", ("cache", "result")
+))
+
+
+class RequestTimings:
+    """Stage timings and counts collected while serving one request"""
+
+    __slots__ = ("stages", "counts", "cache")
+
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+        self.counts: Dict[str, float] = {}
+        self.cache: Dict[str, str] = {}
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """Format the timings as a Server-Timing header value (durations in milliseconds)"""
+        entries = []
+        for stage, seconds in self.stages:
+            description = self.cache.get(stage)
+            entry = f"{stage};dur={seconds * 1000:.1f}"
+            entries.append(f'{entry};desc="{description}"' if description else entry)
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """Get the timings of the request being served, if any"""
+    return _current.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Record how long a pipeline stage took"""
+    if not METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _current.get()
+    if timings is not None:
+        timings.stages.append((stage, seconds))
+
+
+def record_size(kind: str, value: float) -> None:
+    """Record the bytes, pages or tokens a request handled"""
+    if not METRICS_ENABLED:
+        return
+    SIZES.observe(value, kind)
+    timings = _current.get()
+    if timings is not None:
+        timings.counts[kind] = timings.counts.get(kind, 0) + value
+
+
+def record_cache(cache: str, result: str, stage: Optional[str] = None) -> None:
+    """
+    Record a cache lookup
+
+    Args:
+        cache: Which cache was used ("text", "metadata", "summary", ...)
+        result: "hit", "miss", or another status such as "revalidated"
+        stage: Pipeline stage the lookup belongs to, to annotate its Server-Timing entry
+    """
+    if not METRICS_ENABLED:
+        return
+    CACHE_LOOKUPS.inc(1, cache, result)
+    timings = _current.get()
+    if timings is not None:
+        timings.cache[stage or cache] = result
+
+
+class timed:
+    """
+    Time a block as a pipeline stage (usable with both `with` and `async with`)
+
+    The LLM operation variant records into the LLM call histogram instead.
+    """
+
+    __slots__ = ("name", "llm", "start")
+
+    def __init__(self, name: str, llm: bool = False):
+        self.name = name
+        self.llm = llm
+
+    def __enter__(self) -> "timed":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        seconds = time.perf_counter() - self.start
+        if self.llm:
+            if METRICS_ENABLED:
+                LLM_SECONDS.observe(seconds, self.name)
+        else:
+            record_stage(self.name, seconds)
+
+    async def __aenter__(self) -> "timed":
+        return self.__enter__()
+
+    async def __aexit__(self, *exc) -> None:
+        self.__exit__(*exc)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every request and collecting its stage timings
+
+    Adds a Server-Timing header when enabled. Streaming responses send their
+    headers before the pipeline runs, so only the stages finished by then
+    appear in theirs.
+    """
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = timings.server_timing(time.perf_counter() - start).encode("latin-1")
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], route_path, str(status))
@@ -0,0 +1,326 @@
+import base64
+import json
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, List, Optional, Tuple
+
+PAGE_INDEX_VERSION = 4
+# Indexes written before per-page token estimates (1), the chapter index (2) or the
+# compacted text (3) existed can still be read; what they lack is built again
+_READABLE_VERSIONS = {1, 2, 3, PAGE_INDEX_VERSION}
+
+
+class PageIndex:
+    """
+    Character offsets of every page in a book's original text
+
+    Pages are contiguous, so the index stores a single array of n + 1
+    boundaries: page N (1-based) spans offsets[N - 1]:offsets[N]. Chapter
+    markers are optional (character offset, title) pairs, None until the
+    chapters have been indexed, with the offset where the body of the book
+    ends (where the last chapter stops). Per-page token
+    estimates are optional too, stored as n + 1 running totals so the tokens
+    of any page range cost two lookups.
+
+    The index of the book's prompt-compacted text (see
+    app.services.compaction) can be attached as `compacted`, with the
+    compaction version and the bytes compaction saved on the whole book.
+    """
+
+    def __init__(
+        self,
+        offsets: Iterable[int],
+        max_chars_per_page: int,
+        chapters: Optional[List[Tuple[int, str]]] = None,
+    ):
+        self.offsets = array("q", offsets)
+        if not self.offsets:
+            self.offsets.append(0)
+        self.max_chars_per_page = max_chars_per_page
+        self.chapters = list(chapters) if chapters is not None else None
+        self.content_end: Optional[int] = None
+        self.token_totals: Optional[array] = None
+        self.tokenizer: Optional[str] = None
+        self.compacted: Optional["PageIndex"] = None
+        self.compaction_version: Optional[int] = None
+        self.compaction_bytes_saved = 0
+
+    @classmethod
+    def from_bounds(
+        cls,
+        bounds: Iterable[Tuple[int, int]],
+        max_chars_per_page: int,
+        chapters: Optional[List[Tuple[int, str]]] = None,
+    ) -> "PageIndex":
+        """
+        Build an index from (start, end) page bounds
+
+        Args:
+            bounds: Contiguous page bounds, e.g. from BookService.iter_page_bounds
+            max_chars_per_page: The page size the bounds were computed with
+            chapters: Optional (character offset, title) chapter markers
+
+        Returns:
+            A PageIndex over the bounds
+        """
+        offsets = array("q", [0])
+        for start, end in bounds:
+            if len(offsets) == 1:
+                offsets[0] = start
+            offsets.append(end)
+        return cls(offsets, max_chars_per_page, chapters)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def text_length(self) -> int:
+        return self.offsets[-1]
+
+    def page_span(self, first_page: int, last_page: int) -> Tuple[int, int]:
+        """
+        Get the character span covering pages first_page..last_page
+
+        Page numbers are clamped to the pages in the book, so an empty span is
+        returned when first_page is past the end.
+
+        Args:
+            first_page: First page to include (1-based)
+            last_page: Last page to include (1-based, inclusive)
+
+        Returns:
+            (start, end) character offsets into the original text
+        """
+        page_count = len(self)
+        first_page = min(max(first_page, 1), page_count + 1)
+        last_page = min(max(last_page, first_page - 1), page_count)
+        return self.offsets[first_page - 1], self.offsets[last_page]
+
+    def extract(self, text, first_page: int, last_page: int):
+        """
+        Slice pages first_page..last_page out of the original text
+
+        Args:
+            text: The text the index was built from (str, MappedText, bytes, mmap or memoryview)
+            first_page: First page to include (1-based)
+            last_page: Last page to include (1-based, inclusive)
+
+        Returns:
+            The slice of text; a zero-copy view when text is a memoryview
+        """
+        start, end = self.page_span(first_page, last_page)
+        return text[start:end]
+
+    def set_page_tokens(self, page_tokens: Iterable[int], tokenizer: str) -> None:
+        """
+        Attach per-page token estimates
+
+        Args:
+            page_tokens: Token count of each page, in page order
+            tokenizer: Name of the tokenizer that produced the counts
+        """
+        token_totals = array("q", accumulate(page_tokens, initial=0))
+        if len(token_totals) != len(self.offsets):
+            raise ValueError(f"Expected {len(self)} page token counts, got {len(token_totals) - 1}")
+        self.token_totals = token_totals
+        self.tokenizer = tokenizer
+
+    def has_tokens(self, tokenizer: Optional[str] = None) -> bool:
+        """Check for token estimates (made by the given tokenizer, when one is named)"""
+        return self.token_totals is not None and (tokenizer is None or tokenizer == self.tokenizer)
+
+    def page_tokens(self, first_page: int, last_page: int) -> int:
+        """
+        Get the estimated tokens of pages first_page..last_page (clamped like page_span)
+
+        Args:
+            first_page: First page to include (1-based)
+            last_page: Last page to include (1-based, inclusive)
+
+        Returns:
+            The sum of the page token estimates
+        """
+        page_count = len(self)
+        first_page = min(max(first_page, 1), page_count + 1)
+        last_page = min(max(last_page, first_page - 1), page_count)
+        return self.token_totals[last_page] - self.token_totals[first_page - 1]
+
+    def pages_within(self, first_page: int, budget: int) -> int:
+        """
+        Find the last page such that first_page..last_page fits in a token budget
+
+        Args:
+            first_page: First page to include (1-based)
+            budget: Maximum number of tokens
+
+        Returns:
+            The last page that fits, or first_page - 1 when not even first_page fits
+        """
+        first_page = min(max(first_page, 1), len(self) + 1)
+        limit = self.token_totals[first_page - 1] + budget
+        return min(bisect_right(self.token_totals, limit) - 1, len(self))
+
+    def max_page_tokens(self) -> int:
+        """Get the token estimate of the largest page"""
+        totals = self.token_totals
+        return max((totals[i + 1] - totals[i] for i in range(len(self))), default=0)
+
+    def page_for_offset(self, offset: int) -> int:
+        """
+        Find the page containing a character offset
+
+        Args:
+            offset: Character offset into the original text
+
+        Returns:
+            The 1-based page number, clamped to the pages in the book
+        """
+        page = bisect_right(self.offsets, offset)
+        return min(max(page, 1), max(len(self), 1))
+
+    def chapter_pages(self) -> List[Tuple[int, str]]:
+        """
+        Get the starting page of each chapter marker
+
+        Returns:
+            List of (page number, chapter title) pairs
+        """
+        return [(self.page_for_offset(offset), title) for offset, title in self.chapters or []]
+
+    def set_chapters(self, chapters: List[Tuple[int, str]], content_end: Optional[int] = None) -> None:
+        """
+        Attach the chapter index
+
+        Args:
+            chapters: (character offset, title) of each chapter, in order
+            content_end: Offset where the body of the book ends (defaults to the end of the text)
+        """
+        self.chapters = list(chapters)
+        self.content_end = content_end
+
+    def chapter_span(self, first_chapter: int, last_chapter: int) -> Tuple[int, int]:
+        """
+        Get the character span of chapters first_chapter..last_chapter
+
+        Args:
+            first_chapter: First chapter to include (1-based)
+            last_chapter: Last chapter to include (1-based, inclusive)
+
+        Returns:
+            (start, end) character offsets into the original text
+
+        Raises:
+            ValueError: If the chapters are not indexed or the range is out of bounds
+        """
+        chapters = self.chapters or []
+        if not 1 <= first_chapter <= last_chapter <= len(chapters):
+            raise ValueError(f"Chapters {first_chapter}-{last_chapter} out of range (the book has {len(chapters)})")
+        start = chapters[first_chapter - 1][0]
+        if last_chapter < len(chapters):
+            return start, chapters[last_chapter][0]
+        return start, self.content_end if self.content_end is not None else self.text_length
+
+    def chapter_page_range(self, first_chapter: int, last_chapter: int) -> Tuple[int, int]:
+        """
+        Get the pages chapters first_chapter..last_chapter fall on
+
+        Chapters rarely start on a page boundary, so the first and last pages
+        may be shared with the neighbouring chapters.
+
+        Returns:
+            (first page, last page), 1-based and inclusive
+        """
+        start, end = self.chapter_span(first_chapter, last_chapter)
+        return self.page_for_offset(start), self.page_for_offset(max(end - 1, start))
+
+    def set_compacted(self, compacted: "PageIndex", version: int, bytes_saved: int) -> None:
+        """
+        Attach the index of the prompt-compacted text
+
+        Args:
+            compacted: Index of the compacted text, with the same number of pages
+            version: Version of the compaction rules
+            bytes_saved: Bytes compaction removed from the whole book
+        """
+        if len(compacted) != len(self):
+            raise ValueError(f"Expected a compacted index of {len(self)} pages, got {len(compacted)}")
+        self.compacted = compacted
+        self.compaction_version = version
+        self.compaction_bytes_saved = bytes_saved
+
+    def _payload(self) -> dict:
+        payload = {
+            "version": PAGE_INDEX_VERSION,
+            "max_chars_per_page": self.max_chars_per_page,
+            "offsets": _pack(self.offsets),
+            "chapters": self.chapters,
+            "content_end": self.content_end,
+        }
+        if self.token_totals is not None:
+            payload["token_totals"] = _pack(self.token_totals)
+            payload["tokenizer"] = self.tokenizer
+        if self.compacted is not None:
+            payload["compacted"] = self.compacted._payload()
+            payload["compaction_version"] = self.compaction_version
+            payload["compaction_bytes_saved"] = self.compaction_bytes_saved
+        return payload
+
+    @classmethod
+    def _from_payload(cls, payload: dict) -> "PageIndex":
+        if payload.get("version") not in _READABLE_VERSIONS:
+            raise ValueError(f"Unsupported page index version: {payload.get('version')}")
+        chapters = None
+        if payload["version"] >= 3 and payload.get("chapters") is not None:
+            chapters = [(offset, title) for offset, title in payload["chapters"]]
+        page_index = cls(_unpack(payload["offsets"]), payload["max_chars_per_page"], chapters)
+        page_index.content_end = payload.get("content_end")
+        if "token_totals" in payload:
+            token_totals = _unpack(payload["token_totals"])
+            if len(token_totals) == len(page_index.offsets):
+                page_index.token_totals = token_totals
+                page_index.tokenizer = payload.get("tokenizer")
+        if "compacted" in payload:
+            compacted = cls._from_payload(payload["compacted"])
+            if len(compacted) == len(page_index):
+                page_index.set_compacted(compacted, payload["compaction_version"], payload["compaction_bytes_saved"])
+        return page_index
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialise the index so it can be stored next to the cached text
+
+        Returns:
+            JSON-encoded index with the offsets packed as little-endian int64
+        """
+        return json.dumps(self._payload()).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PageIndex":
+        """
+        Load an index produced by to_bytes
+
+        Args:
+            data: Serialised index
+
+        Returns:
+            The deserialised PageIndex
+        """
+        return cls._from_payload(json.loads(data))
+
+
+def _pack(values: array) -> str:
+    # Little-endian int64, base64-encoded
+    values = array("q", values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _unpack(data: str) -> array:
+    values = array("q")
+    values.frombytes(base64.b64decode(data))
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
@@ -0,0 +1,257 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import (
+    PREFETCH_CHECKPOINTS,
+    PREFETCH_ENABLED,
+    PREFETCH_MAX_PENDING,
+    PREFETCH_WASTE_AFTER_SECONDS,
+)
+from app.services.summary_pipeline import SummaryPipeline
+
+logger = logging.getLogger(__name__)
+
+# Book, checkpoint page and text URL of one prefetch
+PrefetchTarget = Tuple[int, int, Optional[str]]
+# Runs one prefetch; returns whether it generated anything (False when it was already cached)
+PrefetchRunner = Callable[[int, int, Optional[str]], Awaitable[bool]]
+
+
+async def prefetch_checkpoint(book_id: int, page_number: int, text_url: Optional[str]) -> bool:
+    """Summarize a book up to a checkpoint page in incremental mode, storing its segments"""
+    result = await SummaryPipeline(book_id, page_number, text_url, "incremental").run()
+    return not result["cached"]
+
+
+class Prefetcher:
+    """
+    Speculative summaries of the next checkpoints for active readers
+
+    Readers move forward through a book, so after an incremental summary for
+    page N the next checkpoints_ahead segment checkpoints (N+10 and N+20 with
+    10-page segments) are queued. One background task summarizes them, only
+    while no foreground request is running in this process: a request that
+    starts meanwhile cancels the prefetch in progress, which is queued again
+    and resumes from its stored segments once the server is idle. At most
+    max_pending prefetches wait; further ones are dropped.
+
+    Prefetched checkpoints are counted as used when a later request for the
+    same book reaches them, and as wasted when none does within waste_after
+    seconds.
+    """
+
+    def __init__(
+        self,
+        checkpoints_ahead: int = PREFETCH_CHECKPOINTS,
+        max_pending: int = PREFETCH_MAX_PENDING,
+        waste_after: float = PREFETCH_WASTE_AFTER_SECONDS,
+        runner: PrefetchRunner = prefetch_checkpoint,
+    ):
+        self.checkpoints_ahead = checkpoints_ahead
+        self.max_pending = max_pending
+        self.waste_after = waste_after
+        self.runner = runner
+        self.stats: Dict[str, int] = {
+            "scheduled": 0,
+            "dropped": 0,
+            "already_cached": 0,
+            "prefetched": 0,
+            "preempted": 0,
+            "failed": 0,
+            "used": 0,
+            "wasted": 0,
+            "hits": 0,
+        }
+        self._pending: "OrderedDict[PrefetchTarget, None]" = OrderedDict()
+        # Prefetched checkpoints no request has reached yet, with when they were prefetched
+        self._unused: "OrderedDict[PrefetchTarget, float]" = OrderedDict()
+        self._foreground = 0
+        self._running: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._worker_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_worker(self) -> None:
+        # Like the job queue, the worker belongs to one event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._wake = asyncio.Event()
+        self._running = None
+        self._foreground = 0
+        # Started from a request, but must not inherit its context (and with it the request's
+        # metrics timings); the prefetch tasks the worker creates inherit the fresh one
+        self._worker_task = asyncio.create_task(self._worker(), context=contextvars.Context())
+
+    @staticmethod
+    def next_checkpoints(start_page: int, page_number: int, segment_pages: int, total_pages: int, count: int) -> List[int]:
+        """
+        Get the next count checkpoint pages after page_number
+
+        Checkpoints are the last pages of the segment_pages-page segments counted from start_page.
+        """
+        first = (page_number - start_page + 1) // segment_pages + 1
+        checkpoints = [start_page - 1 + segment * segment_pages for segment in range(first, first + count)]
+        return [page for page in checkpoints if page <= total_pages]
+
+    @asynccontextmanager
+    async def foreground(self) -> AsyncIterator[None]:
+        """Mark a request as running; prefetching pauses (and a running prefetch is cancelled) meanwhile"""
+        self._ensure_worker()
+        self._foreground += 1
+        if self._running is not None and not self._running.done():
+            self._running.cancel()
+        try:
+            yield
+        finally:
+            self._foreground -= 1
+            if self._foreground == 0:
+                self._wake.set()
+
+    def after_summary(self, pipeline: SummaryPipeline) -> None:
+        """
+        Count prefetched checkpoints a served request used, and queue the next ones
+
+        Args:
+            pipeline: The pipeline that just served a request
+        """
+        self._expire()
+        if pipeline.chapters is not None or pipeline.page_index is None:
+            return
+        used = [
+            target for target in self._unused
+            if target[0] == pipeline.book_id and target[2] == pipeline.text_url and target[1] <= pipeline.page_number
+        ]
+        for target in used:
+            del self._unused[target]
+        if used:
+            self.stats["used"] += len(used)
+            self.stats["hits"] += 1
+        # The request went past these itself, so prefetching them would be wasted
+        for target in [target for target in self._pending if target[0] == pipeline.book_id
+                       and target[2] == pipeline.text_url and target[1] <= pipeline.page_number]:
+            del self._pending[target]
+
+        if pipeline.mode != "incremental":
+            return
+        self._ensure_worker()
+        for page in self.next_checkpoints(
+            pipeline.start_page, pipeline.page_number, pipeline.segment_pages(), len(pipeline.page_index),
+            self.checkpoints_ahead,
+        ):
+            target = (pipeline.book_id, page, pipeline.text_url)
+            if target in self._pending or target in self._unused:
+                continue
+            if len(self._pending) >= self.max_pending:
+                self.stats["dropped"] += 1
+                continue
+            self._pending[target] = None
+            self.stats["scheduled"] += 1
+        if self._foreground == 0:
+            self._wake.set()
+
+    def _expire(self) -> None:
+        deadline = time.time() - self.waste_after
+        while self._unused and next(iter(self._unused.values())) < deadline:
+            self._unused.popitem(last=False)
+            self.stats["wasted"] += 1
+
+    async def _worker(self) -> None:
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._pending and self._foreground == 0:
+                target, _ = self._pending.popitem(last=False)
+                self._running = asyncio.create_task(self.runner(*target))
+                try:
+                    # wait() does not raise when the prefetch (rather than this worker) is cancelled
+                    await asyncio.wait({self._running})
+                except asyncio.CancelledError:
+                    self._running.cancel()
+                    raise
+                if self._running.cancelled():
+                    # Preempted by a request; resume it (from its stored segments) when idle again
+                    self.stats["preempted"] += 1
+                    self._pending[target] = None
+                    self._pending.move_to_end(target, last=False)
+                elif self._running.exception() is not None:
+                    self.stats["failed"] += 1
+                    logger.warning(
+                        "Prefetch failed",
+                        extra={"book_id": target[0], "page_number": target[1], "error": str(self._running.exception())},
+                    )
+                elif self._running.result():
+                    self.stats["prefetched"] += 1
+                    self._unused[target] = time.time()
+                else:
+                    self.stats["already_cached"] += 1
+                self._running = None
+
+    async def idle(self) -> None:
+        """Wait until nothing is queued or running (for tests and shutdown)"""
+        while self._pending or self._running is not None:
+            await asyncio.sleep(0.01)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus the queued prefetches and the share of prefetched checkpoints used"""
+        self._expire()
+        settled = self.stats["used"] + self.stats["wasted"]
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "hit_rate": round(self.stats["used"] / settled, 3) if settled else 0.0,
+        }
+
+    async def close(self) -> None:
+        """Stop the worker; queued prefetches are dropped"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        self._worker_task.cancel()
+        await asyncio.gather(self._worker_task, return_exceptions=True)
+        self._pending.clear()
+        self._running = None
+        self._worker_task = None
+        self._loop = None
+
+
+async def run_foreground(pipeline: SummaryPipeline, **run_args: Any) -> Dict[str, Any]:
+    """
+    Run a request's summary pipeline as foreground work, then let the prefetcher follow up
+
+    Args:
+        pipeline: The pipeline serving the request
+        run_args: Arguments of SummaryPipeline.run
+
+    Returns:
+        The result of SummaryPipeline.run
+    """
+    prefetcher = get_prefetcher()
+    if prefetcher is None:
+        return await pipeline.run(**run_args)
+    async with prefetcher.foreground():
+        result = await pipeline.run(**run_args)
+    prefetcher.after_summary(pipeline)
+    return result
+
+
+_prefetcher: Optional[Prefetcher] = None
+
+
+def get_prefetcher() -> Optional[Prefetcher]:
+    """
+    Get the process-wide prefetcher
+
+    Returns:
+        The Prefetcher, or None when PREFETCH_ENABLED is off
+    """
+    global _prefetcher
+    if not PREFETCH_ENABLED:
+        return None
+    if _prefetcher is None:
+        _prefetcher = Prefetcher()
+    return _prefetcher
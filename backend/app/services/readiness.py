@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.services.http_clients import get_gutenberg_client, get_ollama_client
+from app.services.leases import get_lease_store
+from app.services.llm_backends import get_llm_backend
+from app.services.search_index import get_search_index
+from app.services.summary_cache import get_summary_cache
+from app.services.text_cache import get_text_cache
+from app.services.tokens import get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Name and initializer of each component opened at startup; initializers return None when disabled
+WarmUpStep = Tuple[str, Callable[[], Any]]
+
+
+def _http_clients() -> Tuple[Any, Any]:
+    return get_gutenberg_client(), get_ollama_client()
+
+
+DEFAULT_STEPS: List[WarmUpStep] = [
+    ("summary_cache", get_summary_cache),
+    ("text_cache", get_text_cache),
+    ("search_index", get_search_index),
+    ("leases", get_lease_store),
+    ("tokenizer", get_tokenizer),
+    ("llm_backend", get_llm_backend),
+]
+
+
+class Readiness:
+    """
+    Startup warm-up of the caches and clients, reported by GET /ready
+
+    The components are created lazily, so importing the app stays cheap and
+    the process answers /health right away. At startup a background task
+    opens them one by one (SQLite schemas, the tokenizer, the LLM replica
+    pool and the shared HTTP clients), off the event loop where they block.
+    /ready answers 503 until every step has finished, and again once
+    shutdown has begun, so a load balancer only routes requests to a warm
+    process.
+    """
+
+    def __init__(self, steps: Optional[List[WarmUpStep]] = None):
+        self.steps = steps if steps is not None else DEFAULT_STEPS
+        # Step name -> "pending", "ok", "disabled" or "failed: <error>"
+        self.checks: Dict[str, str] = {}
+        self.status = "starting"
+        self.started_at: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def start(self) -> None:
+        """Start warming up in the background (call from the app lifespan)"""
+        self.status = "starting"
+        self.started_at = time.perf_counter()
+        self.checks = {name: "pending" for name, _ in self.steps}
+        self.checks["http_clients"] = "pending"
+        self._task = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self) -> None:
+        """Open every component, recording how each step went"""
+        for name, initialize in self.steps:
+            try:
+                component = await asyncio.to_thread(initialize)
+            except Exception as e:
+                logger.exception("Warm-up step failed", extra={"step": name})
+                self.checks[name] = f"failed: {e}"
+                continue
+            self.checks[name] = "ok" if component is not None else "disabled"
+        # httpx clients belong to the event loop they are created on
+        _http_clients()
+        self.checks["http_clients"] = "ok"
+        failed = any(check.startswith("failed") for check in self.checks.values())
+        self.status = "failed" if failed else "ready"
+        self.seconds = round(time.perf_counter() - self.started_at, 3)
+        logger.info("Warm-up finished", extra={"status": self.status, "seconds": self.seconds})
+
+    async def stop(self) -> None:
+        """Report not ready from now on and cancel an unfinished warm-up"""
+        self.status = "stopping"
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """The status, the state of each warm-up step and how long warming up took"""
+        return {"status": self.status, "checks": dict(self.checks), "seconds": self.seconds}
+
+
+_readiness: Optional[Readiness] = None
+
+
+def get_readiness() -> Readiness:
+    """
+    Get the process-wide readiness state
+
+    Returns:
+        The shared Readiness
+    """
+    global _readiness
+    if _readiness is None:
+        _readiness = Readiness()
+    return _readiness
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import EMBEDDING_BATCH_SIZE, MAP_REDUCE_MAX_CONCURRENCY, RETRIEVAL_TOP_K
+from app.services.book_text import BookText
+from app.services.embeddings import get_embedder
+from app.services.leases import get_lease_store
+from app.services.llm_service import RETRIEVAL_PROMPT, LLMService
+from app.services.page_index import PageIndex
+from app.services.text_cache import get_text_cache
+from app.services.tokens import estimate_tokens, get_tokenizer
+from app.services.vector_index import VectorIndex
+
+
+class RetrievalSummarizer:
+    """
+    Answer a question about pages of a book from the pages most relevant to it
+
+    Every page of a text is embedded once and the vectors are stored next to
+    the page index in the text cache (one file per page size and embedder).
+    A question is embedded, the pages up to the requested page are ranked by
+    cosine similarity to it, and the best top_k pages that fit in one prompt
+    go to the LLM in reading order. The prompt stays the same size however far
+    into the book the reader is.
+    """
+
+    def __init__(
+        self,
+        llm_service: LLMService,
+        embedder: Optional[Any] = None,
+        top_k: int = RETRIEVAL_TOP_K,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_concurrency: int = MAP_REDUCE_MAX_CONCURRENCY,
+    ):
+        self.llm_service = llm_service
+        self.embedder = embedder if embedder is not None else get_embedder()
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+
+    async def _embed_pages(self, book_text: BookText, page_index: PageIndex) -> VectorIndex:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed_batch(first_page: int, last_page: int) -> List[List[float]]:
+            async with semaphore:
+                texts = [page_index.extract(book_text, page, page) for page in range(first_page, last_page + 1)]
+                return await self.embedder.embed(texts)
+
+        pages = len(page_index)
+        batches = await asyncio.gather(*(
+            embed_batch(first_page, min(first_page + self.batch_size - 1, pages))
+            for first_page in range(1, pages + 1, self.batch_size)
+        ))
+        return VectorIndex.build([vector for batch in batches for vector in batch])
+
+    async def vector_index(
+        self, book_text: BookText, page_index: PageIndex, digest: Optional[str], compaction_version: Optional[int] = None
+    ) -> Tuple[VectorIndex, int]:
+        """
+        Get the page embeddings of a text, embedding its pages if they are not stored yet
+
+        Args:
+            book_text: The book text
+            page_index: Page index of the book text
+            digest: Text cache digest of the original text; without one the vectors are not stored
+            compaction_version: Version of the compaction rules book_text was
+                compacted with (None for the original text)
+
+        Returns:
+            Tuple of the VectorIndex and the number of pages embedded by this call
+        """
+        text_cache = get_text_cache()
+        if text_cache is None or digest is None:
+            return await self._embed_pages(book_text, page_index), len(page_index)
+
+        max_chars = page_index.max_chars_per_page
+
+        async def load() -> Optional[VectorIndex]:
+            vector_index = await asyncio.to_thread(
+                text_cache.load_vector_index, digest, max_chars, self.embedder.name, compaction_version
+            )
+            # A text re-paginated under the same page size gets new vectors
+            return vector_index if vector_index is not None and len(vector_index) == len(page_index) else None
+
+        async def build() -> VectorIndex:
+            vector_index = await self._embed_pages(book_text, page_index)
+            await asyncio.to_thread(
+                text_cache.store_vector_index, digest, max_chars, self.embedder.name, vector_index, compaction_version
+            )
+            # Serve from the memory-mapped file, like every later request
+            return await load() or vector_index
+
+        vector_index = await load()
+        if vector_index is not None:
+            return vector_index, 0
+        lease_store = get_lease_store()
+        if lease_store is None:
+            return await build(), len(page_index)
+        # Another worker may be embedding the same text; wait for its vectors
+        vector_index, built = await lease_store.single_flight(
+            f"vectors:{digest}:{max_chars}:{self.embedder.name}:{compaction_version}", load, build
+        )
+        return vector_index, len(page_index) if built else 0
+
+    def select_pages(
+        self, ranked: List[Tuple[int, float]], page_index: PageIndex, book_text: BookText, budget: int
+    ) -> List[int]:
+        """
+        Take the best ranked pages that fit in the token budget
+
+        Returns:
+            The selected page numbers, in reading order (at least the best page)
+        """
+        use_index_tokens = page_index.has_tokens(get_tokenizer().name)
+        selected, tokens = [], 0
+        for page, _ in ranked:
+            if use_index_tokens:
+                page_tokens = page_index.page_tokens(page, page)
+            else:
+                page_tokens = estimate_tokens(page_index.extract(book_text, page, page))
+            if selected and tokens + page_tokens > budget:
+                continue
+            selected.append(page)
+            tokens += page_tokens
+        return sorted(selected)
+
+    async def summarize(
+        self,
+        question: str,
+        book_text: BookText,
+        page_index: PageIndex,
+        digest: Optional[str],
+        first_page: int,
+        last_page: int,
+        compaction_version: Optional[int] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Answer a question from the most relevant of pages first_page..last_page
+
+        Args:
+            question: The reader's question
+            book_text: The book text, original or compacted
+            page_index: Page index of the book text
+            digest: Text cache digest of the original text (None when the text cache is off)
+            first_page: First page that may be used (1-based)
+            last_page: Last page that may be used (1-based, inclusive)
+            compaction_version: Version of the compaction rules book_text was
+                compacted with (None for the original text)
+
+        Returns:
+            Tuple of the answer and the retrieval stage stats
+        """
+        start = time.perf_counter()
+        vector_index, embedded = await self.vector_index(book_text, page_index, digest, compaction_version)
+        query = (await self.embedder.embed([question]))[0]
+        ranked = await asyncio.to_thread(vector_index.top_pages, query, first_page, last_page, self.top_k)
+
+        budget = self.llm_service.prompt_budget(RETRIEVAL_PROMPT) - estimate_tokens(question)
+        pages = self.select_pages(ranked, page_index, book_text, budget)
+        text = "\n\n".join(f"[Page {page}]\n{page_index.extract(book_text, page, page)}" for page in pages)
+        stages: List[Dict[str, Any]] = [{
+            "stage": "retrieval",
+            "embedded_pages": embedded,
+            "selected_pages": pages,
+            "prompt_tokens": estimate_tokens(text),
+            "seconds": round(time.perf_counter() - start, 3),
+        }]
+        return await self.llm_service.answer_question(question, text), stages
@@ -0,0 +1,342 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+from app.core.config import CACHE_DIR, METADATA_CACHE_TTL_SECONDS, SEARCH_INDEX_ENABLED, SEARCH_INDEX_FULL_TEXT
+from app.services.book_text import BookText, iter_matches
+from app.services.page_index import PageIndex
+
+# Bump SCHEMA_VERSION whenever _SCHEMA changes; older indexes are dropped and rebuilt
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    download_count INTEGER NOT NULL DEFAULT 0,
+    indexed_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, authors, subjects, bookshelves, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS book_texts (
+    book_id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    book_id UNINDEXED, page UNINDEXED, text, tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS searches (
+    query TEXT PRIMARY KEY,
+    upstream_count INTEGER NOT NULL,
+    searched_at REAL NOT NULL
+);
+"""
+
+_TABLES = ("books", "books_fts", "book_texts", "pages_fts", "searches")
+
+# One page of metadata matches: books whose title matches first, then the most downloaded
+_METADATA_PAGE = (
+    "SELECT books.id, books.data FROM books_fts JOIN books ON books.id = books_fts.rowid"
+    " WHERE books_fts MATCH ?"
+    " ORDER BY books.id NOT IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?),"
+    " books.download_count DESC, books.id LIMIT ? OFFSET ?"
+)
+# Books matching in their page texts but not their metadata
+_TEXT_ONLY = (
+    "SELECT DISTINCT books.id, books.data, books.download_count FROM pages_fts"
+    " JOIN books ON books.id = pages_fts.book_id WHERE pages_fts MATCH ?"
+    " AND books.id NOT IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)"
+)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_query(search_query: str, prefix: bool = True) -> Optional[str]:
+    """
+    Turn a user's search into an FTS5 query
+
+    Every word must match, and the last one also matches as a prefix so
+    results keep up with a search typed one keystroke at a time.
+
+    Args:
+        search_query: The search as typed
+        prefix: Whether the last word matches as a prefix
+
+    Returns:
+        The FTS5 query, or None if the search has no words
+    """
+    words = _WORD.findall(search_query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if prefix:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def normalize_query(search_query: str) -> str:
+    """Normalize a search for recording its gutendex result count (case and punctuation do not matter)"""
+    return " ".join(word.lower() for word in _WORD.findall(search_query))
+
+
+def _names(people: Iterable[Dict]) -> str:
+    return " ; ".join(person.get("name", "") for person in people or [])
+
+
+class SearchIndex:
+    """
+    Local SQLite FTS5 index of book metadata, and optionally of book texts
+
+    Metadata is added as books are fetched from gutendex, and page texts as
+    books are downloaded, so searches over books seen before are answered
+    without calling gutendex. The number of books gutendex reported for each
+    search is recorded too, which tells whether every match of a search has
+    been indexed; like cached metadata, a recorded count expires after
+    max_age seconds, since gutendex gains books. Like the summary cache, every operation opens a
+    short-lived connection, so the index can be used from worker threads and
+    several processes at once.
+    """
+
+    def __init__(self, path: str, full_text: bool = SEARCH_INDEX_FULL_TEXT, max_age: float = METADATA_CACHE_TTL_SECONDS):
+        self.path = path
+        self.full_text = full_text
+        self.max_age = max_age
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "books_indexed": 0, "texts_indexed": 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                for table in _TABLES:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += amount
+
+    def add_books(self, books: Iterable[Dict]) -> int:
+        """
+        Add or update the metadata of books (gutendex book objects)
+
+        Args:
+            books: Book objects, as returned by gutendex
+
+        Returns:
+            Number of books written
+        """
+        rows = [
+            (
+                book["id"],
+                json.dumps(book),
+                book.get("download_count") or 0,
+                book.get("title") or "",
+                _names(book.get("authors")),
+                " ; ".join(book.get("subjects") or []),
+                " ; ".join(book.get("bookshelves") or []),
+            )
+            for book in books
+            if isinstance(book, dict) and "id" in book
+        ]
+        if not rows:
+            return 0
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM books_fts WHERE rowid = ?", [(row[0],) for row in rows])
+            conn.executemany(
+                "INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?)", [(*row[:3], now) for row in rows]
+            )
+            conn.executemany("INSERT INTO books_fts (rowid, title, authors, subjects, bookshelves) VALUES (?, ?, ?, ?, ?)",
+                             [(row[0], *row[3:]) for row in rows])
+        self._count("books_indexed", len(rows))
+        return len(rows)
+
+    def record_search(self, search_query: str, upstream_count: int) -> None:
+        """
+        Record how many books gutendex matches for a search
+
+        Args:
+            search_query: The search as sent to gutendex
+            upstream_count: The "count" of gutendex's response
+        """
+        query = normalize_query(search_query)
+        if not query:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM searches WHERE searched_at < ?", (now - self.max_age,))
+            conn.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?)", (query, upstream_count, now))
+
+    def has_text(self, book_id: int, digest: Optional[str]) -> bool:
+        """Check whether the pages of this version of a book's text are indexed"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT digest FROM book_texts WHERE book_id = ?", (book_id,)).fetchone()
+        return row is not None and (digest is None or row[0] == digest)
+
+    def add_text(self, book_id: int, text: BookText, page_index: PageIndex, digest: Optional[str] = None) -> bool:
+        """
+        Index the pages of a book's text, replacing any earlier version
+
+        Does nothing when full-text indexing is off or this version of the text is already indexed.
+
+        Args:
+            book_id: The book ID
+            text: The book text the page index was built from
+            page_index: Page index of the text
+            digest: Text cache digest of the text, if any
+
+        Returns:
+            Whether the text was indexed
+        """
+        if not self.full_text or self.has_text(book_id, digest):
+            return False
+        pages = ((book_id, page, page_index.extract(text, page, page)) for page in range(1, len(page_index) + 1))
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pages_fts WHERE book_id = ?", (book_id,))
+            conn.executemany("INSERT INTO pages_fts (book_id, page, text) VALUES (?, ?, ?)", pages)
+            conn.execute(
+                "INSERT OR REPLACE INTO book_texts VALUES (?, ?, ?, ?)",
+                (book_id, digest or "", len(page_index), time.time()),
+            )
+        self._count("texts_indexed")
+        return True
+
+    def search(self, search_query: str, page: int = 1, limit: int = 20, complete_only: bool = False) -> Optional[Dict]:
+        """
+        Search the indexed books
+
+        Books whose title matches every word come first, then books matching on
+        their other metadata and, with full-text indexing, books matching only
+        in their text. Like gutendex, the most downloaded books come first
+        within each group. Sorting and paging happen in SQLite, so only one
+        page of results is loaded.
+
+        Args:
+            search_query: The search as typed
+            page: Page of results (1-based)
+            limit: Results per page
+            complete_only: Only answer when the search was recorded with
+                record_search less than max_age seconds ago and at least as many books match in the index
+                as gutendex reported, so no page of the answer is missing books.
+                gutendex only searches titles and authors, so only whole-word
+                matches on those count towards this
+
+        Returns:
+            A gutendex-style page of results ("count", "next", "previous",
+            "results"), or None when no indexed book matches (or, with
+            complete_only, when the index may be missing matches)
+        """
+        query = fts_query(search_query)
+        if query is None:
+            return None
+        offset = (page - 1) * limit
+        with self._connect() as conn:
+            count = conn.execute("SELECT count(*) FROM books_fts WHERE books_fts MATCH ?", (query,)).fetchone()[0]
+            if complete_only:
+                recorded = conn.execute(
+                    "SELECT upstream_count FROM searches WHERE query = ? AND searched_at >= ?",
+                    (normalize_query(search_query), time.time() - self.max_age),
+                ).fetchone()
+                upstream_matches = conn.execute(
+                    "SELECT count(*) FROM books_fts WHERE books_fts MATCH ?",
+                    (f"{{title authors}} : ({fts_query(search_query, prefix=False)})",),
+                ).fetchone()[0]
+                if recorded is None or upstream_matches < recorded[0]:
+                    self._count("misses")
+                    return None
+            rows = []
+            if offset < count:
+                rows = conn.execute(_METADATA_PAGE, (query, f"title : ({query})", limit, offset)).fetchall()
+            if self.full_text:
+                text_count = conn.execute(f"SELECT count(*) FROM ({_TEXT_ONLY})", (query, query)).fetchone()[0]
+                if len(rows) < limit and text_count:
+                    rows += conn.execute(
+                        f"{_TEXT_ONLY} ORDER BY books.download_count DESC, books.id LIMIT ? OFFSET ?",
+                        (query, query, limit - len(rows), max(offset - count, 0)),
+                    ).fetchall()
+                count += text_count
+        if not count:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return {
+            "count": count,
+            "next": page + 1 if page * limit < count else None,
+            "previous": page - 1 if page > 1 else None,
+            "results": [json.loads(row[1]) for row in rows],
+            "source": "local",
+        }
+
+    def size(self) -> Dict[str, int]:
+        """Count the indexed books and book texts"""
+        with self._connect() as conn:
+            books = conn.execute("SELECT count(*) FROM books").fetchone()[0]
+            texts = conn.execute("SELECT count(*) FROM book_texts").fetchone()[0]
+        return {"books": books, "texts": texts}
+
+
+def find_phrase(text: BookText, page_index: PageIndex, phrase: str, limit: int = 20) -> List[Dict]:
+    """
+    Find the pages of a book containing a phrase
+
+    Matching ignores case and treats any run of whitespace (including the line
+    breaks of hard-wrapped texts) as a single space.
+
+    Args:
+        text: The book text the page index was built from
+        page_index: Page index of the text
+        phrase: The phrase to look for
+        limit: Most matches to return
+
+    Returns:
+        One dict per match, in text order, with the page number, the character
+        offset and a short snippet around the match
+    """
+    words = phrase.split()
+    if not words:
+        return []
+    pattern = r"\s+".join(re.escape(word) for word in words)
+    matches = []
+    for start, end in iter_matches(text, pattern, re.IGNORECASE):
+        snippet = " ".join(text[max(start - 80, 0):min(end + 80, len(text))].split())
+        matches.append({"page": page_index.page_for_offset(start), "offset": start, "snippet": snippet})
+        if len(matches) >= limit:
+            break
+    return matches
+
+
+_search_index: Optional[SearchIndex] = None
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """
+    Get the process-wide search index
+
+    Returns:
+        The SearchIndex, or None when SEARCH_INDEX_ENABLED is off
+    """
+    global _search_index
+    if not SEARCH_INDEX_ENABLED:
+        return None
+    if _search_index is None:
+        _search_index = SearchIndex(os.path.join(CACHE_DIR, "search.sqlite3"))
+    return _search_index
+
@@ -0,0 +1,313 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+from app.core.config import CACHE_DIR, SUMMARY_CACHE_ENABLED, SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_TTL_SECONDS
+
+
+class SummaryKey(NamedTuple):
+    """Everything that determines the output of a summary"""
+    book_id: int
+    start_page: int
+    page_number: int
+    model: str
+    prompt_version: str
+    max_chars_per_page: int
+    # Content digest of the summarized text (a hash of its URL when the text cache is off)
+    text_digest: str
+    mode: str = "full"
+
+
+# Bump SCHEMA_VERSION whenever _SCHEMA changes; older cache databases are
+# dropped and recreated rather than migrated
+SCHEMA_VERSION = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    book_id INTEGER NOT NULL,
+    start_page INTEGER NOT NULL,
+    page_number INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    max_chars_per_page INTEGER NOT NULL,
+    text_digest TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (book_id, start_page, page_number, model, prompt_version, max_chars_per_page, text_digest, mode)
+);
+CREATE INDEX IF NOT EXISTS summaries_accessed_at ON summaries (accessed_at);
+CREATE TABLE IF NOT EXISTS content_starts (
+    book_id INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    max_chars_per_page INTEGER NOT NULL,
+    text_digest TEXT NOT NULL,
+    start_page INTEGER NOT NULL,
+    start_offset INTEGER,
+    method TEXT,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (book_id, model, prompt_version, max_chars_per_page, text_digest)
+);
+CREATE INDEX IF NOT EXISTS content_starts_accessed_at ON content_starts (accessed_at);
+CREATE TABLE IF NOT EXISTS segment_summaries (
+    book_id INTEGER NOT NULL,
+    start_page INTEGER NOT NULL,
+    end_page INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    max_chars_per_page INTEGER NOT NULL,
+    text_digest TEXT NOT NULL,
+    segment_pages INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (book_id, start_page, model, prompt_version, max_chars_per_page, text_digest, segment_pages, end_page)
+);
+CREATE INDEX IF NOT EXISTS segment_summaries_accessed_at ON segment_summaries (accessed_at);
+"""
+
+_TABLES = ("summaries", "content_starts", "segment_summaries")
+
+
+class SummaryCache:
+    """
+    Persistent SQLite cache of generated summaries
+
+    The database runs in WAL mode so readers never block the writer. Along
+    with summaries it stores the resolved content start page of each book,
+    so a repeated request can be answered without calling the LLM at all.
+    In each table, entries older than max_age seconds (0 disables expiry)
+    are dropped and the least recently used entries are evicted beyond
+    max_entries.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = SUMMARY_CACHE_MAX_ENTRIES,
+        max_age: float = SUMMARY_CACHE_TTL_SECONDS,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                for table in _TABLES:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A short-lived connection per operation keeps the cache safe to use
+        # from worker threads and from several processes at once
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[stat] += amount
+
+    def _expired_before(self) -> float:
+        return time.time() - self.max_age if self.max_age > 0 else float("-inf")
+
+    def _prune(self, conn: sqlite3.Connection, table: str) -> None:
+        # Drop expired entries, then the least recently used beyond max_entries
+        evicted = conn.execute(f"DELETE FROM {table} WHERE created_at < ?", (self._expired_before(),)).rowcount
+        evicted += conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN ("
+            f" SELECT rowid FROM {table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if evicted:
+            self._count("evictions", evicted)
+
+    def get(self, key: SummaryKey) -> Optional[str]:
+        """
+        Look up a cached summary
+
+        Args:
+            key: The summary key
+
+        Returns:
+            The cached summary, or None on a miss
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT summary, created_at FROM summaries WHERE book_id = ? AND start_page = ? AND page_number = ?"
+                " AND model = ? AND prompt_version = ? AND max_chars_per_page = ? AND text_digest = ? AND mode = ?",
+                key,
+            ).fetchone()
+            if row is None or row[1] < self._expired_before():
+                self._count("misses")
+                return None
+            conn.execute(
+                "UPDATE summaries SET accessed_at = ? WHERE book_id = ? AND start_page = ? AND page_number = ?"
+                " AND model = ? AND prompt_version = ? AND max_chars_per_page = ? AND text_digest = ? AND mode = ?",
+                (time.time(), *key),
+            )
+        self._count("hits")
+        return row[0]
+
+    def put(self, key: SummaryKey, summary: str) -> None:
+        """
+        Store a summary and evict old entries
+
+        Args:
+            key: The summary key
+            summary: The generated summary
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, summary, now, now),
+            )
+            self._prune(conn, "summaries")
+
+    def get_content_start(
+        self, book_id: int, model: str, prompt_version: str, max_chars_per_page: int, text_digest: str
+    ) -> Optional[int]:
+        """
+        Look up the cached first page of important text for a book
+
+        Args:
+            book_id: The book ID
+            model: LLM model that resolved the start page
+            prompt_version: Prompt version used to resolve it
+            max_chars_per_page: Page size the page number refers to
+            text_digest: Content digest of the book text (see SummaryKey)
+
+        Returns:
+            The start page, or None if it has not been resolved yet
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT start_page FROM content_starts WHERE book_id = ? AND model = ? AND prompt_version = ?"
+                " AND max_chars_per_page = ? AND text_digest = ? AND created_at >= ?",
+                (book_id, model, prompt_version, max_chars_per_page, text_digest, self._expired_before()),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE content_starts SET accessed_at = ? WHERE book_id = ? AND model = ? AND prompt_version = ?"
+                " AND max_chars_per_page = ? AND text_digest = ?",
+                (time.time(), book_id, model, prompt_version, max_chars_per_page, text_digest),
+            )
+        return row[0]
+
+    def set_content_start(
+        self,
+        book_id: int,
+        model: str,
+        prompt_version: str,
+        max_chars_per_page: int,
+        text_digest: str,
+        start_page: int,
+        start_offset: Optional[int] = None,
+        method: Optional[str] = None,
+    ) -> None:
+        """Store the resolved first page (and character offset) of important text for a book, evicting old entries"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO content_starts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (book_id, model, prompt_version, max_chars_per_page, text_digest, start_page, start_offset, method, now, now),
+            )
+            self._prune(conn, "content_starts")
+
+    def get_latest_segment(self, key: SummaryKey, segment_pages: int) -> Optional[Tuple[int, str]]:
+        """
+        Find the furthest stored rolling summary that ends at or before key.page_number
+
+        Args:
+            key: Key of the requested summary
+            segment_pages: Number of pages per segment
+
+        Returns:
+            (end page, rolling summary from key.start_page to that page), or None
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT rowid, end_page, summary FROM segment_summaries WHERE book_id = ? AND start_page = ?"
+                " AND model = ? AND prompt_version = ? AND max_chars_per_page = ? AND text_digest = ?"
+                " AND segment_pages = ? AND end_page <= ? AND created_at >= ? ORDER BY end_page DESC LIMIT 1",
+                (key.book_id, key.start_page, key.model, key.prompt_version, key.max_chars_per_page,
+                 key.text_digest, segment_pages, key.page_number, self._expired_before()),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE segment_summaries SET accessed_at = ? WHERE rowid = ?", (time.time(), row[0]))
+        return row[1], row[2]
+
+    def put_segment(self, key: SummaryKey, segment_pages: int, end_page: int, summary: str) -> None:
+        """
+        Store the rolling summary from key.start_page up to end_page and evict old segments
+
+        Args:
+            key: Key of the summary being built
+            segment_pages: Number of pages per segment
+            end_page: Last page covered by the rolling summary
+            summary: The rolling summary
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO segment_summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key.book_id, key.start_page, end_page, key.model, key.prompt_version, key.max_chars_per_page,
+                 key.text_digest, segment_pages, summary, now, now),
+            )
+            self._prune(conn, "segment_summaries")
+
+    def invalidate(self, book_id: Optional[int] = None) -> int:
+        """
+        Delete cached summaries, segment summaries and start pages
+
+        Args:
+            book_id: Only invalidate this book; everything when None
+
+        Returns:
+            Number of summaries deleted
+        """
+        with self._connect() as conn:
+            if book_id is None:
+                deleted = conn.execute("DELETE FROM summaries").rowcount
+                conn.execute("DELETE FROM content_starts")
+                conn.execute("DELETE FROM segment_summaries")
+            else:
+                deleted = conn.execute("DELETE FROM summaries WHERE book_id = ?", (book_id,)).rowcount
+                conn.execute("DELETE FROM content_starts WHERE book_id = ?", (book_id,))
+                conn.execute("DELETE FROM segment_summaries WHERE book_id = ?", (book_id,))
+        return deleted
+
+
+_summary_cache: Optional[SummaryCache] = None
+
+
+def get_summary_cache() -> Optional[SummaryCache]:
+    """
+    Get the process-wide summary cache
+
+    Returns:
+        The SummaryCache, or None when SUMMARY_CACHE_ENABLED is off
+    """
+    global _summary_cache
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    if _summary_cache is None:
+        _summary_cache = SummaryCache(os.path.join(CACHE_DIR, "summaries.sqlite3"))
+    return _summary_cache
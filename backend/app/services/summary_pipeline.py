@@ -0,0 +1,462 @@
+import asyncio
+import hashlib
+import logging
+from contextlib import nullcontext
+from urllib.parse import urlencode
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import (
+    INCREMENTAL_SEGMENT_PAGES,
+    MAP_REDUCE_CHUNK_TOKENS,
+    MAX_CHARS_PER_PAGE,
+    PROMPT_COMPACTION_ENABLED,
+    REQUEST_MEMORY_LIMIT_BYTES,
+    RETRIEVAL_TOP_K,
+)
+from app.services.book_service import BookService
+from app.services.book_text import BookText, MappedText
+from app.services.chapter_summarizer import ChapterSummarizer
+from app.services.embeddings import get_embedder
+from app.services.front_matter import index_chapters, resolve_content_start
+from app.services.incremental_summarizer import IncrementalSummarizer
+from app.services.leases import get_lease_store
+from app.services.llm_service import (
+    CHUNK_SUMMARY_PROMPT,
+    PROMPT_VERSION,
+    ROLLING_SUMMARY_PROMPT,
+    SUMMARY_PROMPT,
+    LLMService,
+)
+from app.services.map_reduce import MapReduceSummarizer
+from app.services.metrics import record_cache, record_size, timed
+from app.services.page_index import PageIndex
+from app.services.retrieval_summarizer import RetrievalSummarizer
+from app.services.search_index import get_search_index
+from app.services.summary_cache import SummaryKey, get_summary_cache
+from app.services.text_cache import get_text_cache
+from app.services.tokens import count_page_tokens, get_tokenizer
+
+logger = logging.getLogger(__name__)
+
+# Called with a stage name and stage details as each pipeline stage completes
+ProgressCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+# Called with each piece of the summary as it is generated
+TokenCallback = Callable[[str], Awaitable[None]]
+
+
+class NoPlainTextError(Exception):
+    """The book has no plain text format to summarize"""
+
+
+class ChapterRangeError(Exception):
+    """The requested chapters are not in the book's chapter index"""
+
+
+class SummaryPipeline:
+    """
+    The stages of summarizing a book up to a page
+
+    metadata -> download -> pagination -> front_matter -> summary. Each stage
+    reports completion through the optional progress callback, so the same
+    pipeline serves the plain, streaming and background-job endpoints.
+
+    A request for a range of chapters replaces front_matter with a chapters
+    stage that looks the range up in the chapter index, and is summarized
+    chapter by chapter with ChapterSummarizer.
+
+    Retrieval mode answers a question from the pages most relevant to it
+    (RetrievalSummarizer) instead of summarizing every page.
+
+    Prompts are built from the compacted book text (app.services.compaction)
+    when PROMPT_COMPACTION_ENABLED is on. It has the same pages as the
+    original, which is still what front-matter detection reads and what
+    responses return.
+    """
+
+    def __init__(
+        self,
+        book_id: int,
+        page_number: Optional[int],
+        text_url: Optional[str] = None,
+        mode: str = "full",
+        progress: Optional[ProgressCallback] = None,
+        chapters: Optional[Tuple[int, int]] = None,
+        question: Optional[str] = None,
+    ):
+        self.book_id = book_id
+        # Set from the chapter range when chapters are requested
+        self.page_number = page_number
+        self.chapters = chapters
+        self.question = question
+        self.text_url = text_url
+        self.mode = mode
+        self.progress = progress
+        self.llm_service = LLMService()
+        self.summary_cache = get_summary_cache()
+
+        self.book_data: Dict[str, Any] = {}
+        self.book_text: BookText = ""
+        # Text cache digest of book_text (None when the text cache is off)
+        self.text_digest: Optional[str] = None
+        # URL book_text was downloaded from
+        self.source_url: Optional[str] = None
+        self.page_index: Optional[PageIndex] = None
+        # The compacted text and its page index, when prompt compaction is on
+        self.prompt_text: Optional[BookText] = None
+        self.prompt_index: Optional[PageIndex] = None
+        self.start_page = 1
+
+    async def _report(self, stage: str, **details: Any) -> None:
+        if self.progress is not None:
+            await self.progress(stage, details)
+
+    async def load_book(self) -> Tuple[str, str]:
+        """
+        Fetch the book metadata and pick the plain text URL
+
+        Returns:
+            Tuple of the text URL and its format type
+        """
+        with timed("metadata"):
+            self.book_data = await BookService.get_book_by_id(self.book_id)
+        await self._report("metadata", title=self.book_data.get("title", "Unknown"))
+
+        # Find text URL if not provided
+        if self.text_url:
+            for format_type, url in self.book_data.get("formats", {}).items():
+                if url == self.text_url:
+                    return url, format_type
+            return self.text_url, "text/plain"
+        # Try to find a text/plain format in the book formats
+        for format_type, url in self.book_data.get("formats", {}).items():
+            if "text/plain" in format_type:
+                return url, format_type
+        raise NoPlainTextError("No plain text format available for this book")
+
+    async def load_text(self, text_url: str, text_format: str) -> None:
+        """Download (or read from cache) the book text and its page index"""
+        # Download book text (served from the text cache when possible)
+        # A caller-supplied URL is cached apart from the book's own text
+        custom_url = text_url not in self.book_data.get("formats", {}).values()
+        with timed("download"):
+            self.book_text, self.text_digest = await BookService.fetch_book_text(
+                text_url, self.book_id, text_format, custom_url
+            )
+        self.source_url = text_url
+        await self._report("download", chars=len(self.book_text))
+
+        # Index the pages of book_text (CPU-bound, so keep it off the event loop)
+        with timed("pagination"):
+            self.page_index = await asyncio.to_thread(BookService.get_page_index, self.book_text, MAX_CHARS_PER_PAGE, self.text_digest)
+            tokenizer = get_tokenizer()
+            if not self.page_index.has_tokens(tokenizer.name):
+                page_tokens = await asyncio.to_thread(count_page_tokens, self.book_text, self.page_index, tokenizer)
+                self.page_index.set_page_tokens(page_tokens, tokenizer.name)
+            # The chapter index is stored with the page index, so it is built once per text
+            if self.page_index.chapters is None:
+                chapters, content_end = await asyncio.to_thread(index_chapters, self.book_text)
+                self.page_index.set_chapters(chapters, content_end)
+                text_cache = get_text_cache()
+                if text_cache is not None and self.text_digest is not None:
+                    await asyncio.to_thread(text_cache.store_page_index, self.text_digest, self.page_index)
+            await self.compact_text()
+        record_size("book_pages", len(self.page_index))
+        await self._report(
+            "pagination", pages=len(self.page_index), chapters=len(self.page_index.chapters), **self.compaction_stats()
+        )
+
+        # Index the page texts for local search (once per version of the text)
+        search_index = get_search_index()
+        if search_index is not None and search_index.full_text:
+            with timed("search_index"):
+                await asyncio.to_thread(search_index.add_text, self.book_id, self.book_text, self.page_index, self.text_digest)
+
+    async def compact_text(self) -> None:
+        """Get the compacted text for prompts (compacted once per book and stored with the page index)"""
+        if not PROMPT_COMPACTION_ENABLED:
+            return
+        self.prompt_text, self.prompt_index = await asyncio.to_thread(
+            BookService.get_compacted_text, self.book_text, self.page_index, self.text_digest
+        )
+
+    def compaction_stats(self) -> Dict[str, int]:
+        """Get the bytes and estimated tokens compaction removed from the whole book (empty when it is off)"""
+        if self.prompt_index is None:
+            return {}
+        return {
+            "compaction_bytes_saved": self.page_index.compaction_bytes_saved,
+            "compaction_tokens_saved": self.page_index.page_tokens(1, len(self.page_index))
+            - self.prompt_index.page_tokens(1, len(self.prompt_index)),
+        }
+
+    def prompt_pages(self) -> Tuple[BookText, PageIndex]:
+        """Get the text and page index summarization prompts are built from"""
+        if self.prompt_index is not None:
+            return self.prompt_text, self.prompt_index
+        return self.book_text, self.page_index
+
+    def _record_prompt_tokens(self) -> None:
+        _, prompt_index = self.prompt_pages()
+        tokens = prompt_index.page_tokens(self.start_page, self.page_number)
+        record_size("tokens", tokens)
+        if prompt_index is not self.page_index:
+            record_size("tokens_saved", self.page_index.page_tokens(self.start_page, self.page_number) - tokens)
+
+    def text_key(self) -> str:
+        """Identify the summarized text: its content digest, or a hash of its URL when the text cache is off"""
+        if self.text_digest is not None:
+            return self.text_digest
+        return "url-" + hashlib.sha256((self.source_url or "").encode("utf-8")).hexdigest()
+
+    def _start_key(self) -> Tuple[int, str, str, int, str]:
+        # Summaries and start pages are only reused for the same text
+        return (self.book_id, self.llm_service.model, PROMPT_VERSION, MAX_CHARS_PER_PAGE, self.text_key())
+
+    async def resolve_start(self) -> int:
+        """
+        Get page number of first important text (resolved once per book)
+
+        Returns:
+            The first page of important text
+        """
+        start_page, method = None, "cache"
+        with timed("front_matter"):
+            if self.summary_cache is not None:
+                start_page = await asyncio.to_thread(self.summary_cache.get_content_start, *self._start_key())
+            record_cache("content_start", "hit" if start_page is not None else "miss", stage="front_matter")
+            if start_page is None:
+                # Deterministic detection first; the LLM only sees the leading pages when unsure
+                start_page, content_start = await resolve_content_start(self.book_text, self.page_index, self.llm_service)
+                method = content_start.method
+                if self.summary_cache is not None:
+                    await asyncio.to_thread(
+                        self.summary_cache.set_content_start, *self._start_key(), start_page,
+                        content_start.offset, content_start.method
+                    )
+        self.start_page = start_page
+        await self._report("front_matter", start_page=start_page, method=method)
+        return start_page
+
+    async def resolve_chapters(self) -> Tuple[int, int]:
+        """
+        Get the pages of the requested chapters from the chapter index
+
+        Returns:
+            The first and last page of the chapters
+
+        Raises:
+            ChapterRangeError: If the book does not have those chapters
+        """
+        first_chapter, last_chapter = self.chapters
+        try:
+            self.start_page, self.page_number = self.page_index.chapter_page_range(first_chapter, last_chapter)
+        except ValueError as e:
+            raise ChapterRangeError(str(e)) from e
+        await self._report("chapters", start_page=self.start_page, page_number=self.page_number)
+        return self.start_page, self.page_number
+
+    def fits_in_prompt(self) -> bool:
+        """Check whether the pages to summarize fit in a single summary prompt"""
+        budget = self.llm_service.prompt_budget(SUMMARY_PROMPT)
+        return self.prompt_pages()[1].page_tokens(self.start_page, self.page_number) <= budget
+
+    def segment_pages(self) -> int:
+        """Get the number of pages per incremental segment (checkpoints fall at their ends)"""
+        # A segment plus the rolling summary must fit in one prompt; the segment size only
+        # depends on the book and model, so checkpoints stay shareable between requests
+        budget = self.llm_service.prompt_budget(ROLLING_SUMMARY_PROMPT) - 500
+        return max(1, min(INCREMENTAL_SEGMENT_PAGES, budget // max(self.prompt_pages()[1].max_page_tokens(), 1)))
+
+    def summary_key(self) -> SummaryKey:
+        mode = self.mode
+        if self.question is not None:
+            # Answers depend on the question and on which pages the embeddings select
+            retrieval = f"{self.question.strip()}\0{get_embedder().name}\0{RETRIEVAL_TOP_K}"
+            mode = f"{mode}:{hashlib.sha256(retrieval.encode('utf-8')).hexdigest()[:16]}"
+        return SummaryKey(self.book_id, self.start_page, self.page_number, *self._start_key()[1:], mode)
+
+    async def summarize(self, on_token: Optional[TokenCallback] = None) -> Tuple[str, bool, Optional[List[Dict]]]:
+        """
+        Generate summary, reusing a cached one for identical requests
+
+        Args:
+            on_token: Receives summary pieces as they are generated. Only full
+                mode streams token by token; other modes and cache hits deliver
+                the whole summary in one piece.
+
+        Returns:
+            Tuple of the summary, whether it came from cache, and map-reduce or retrieval stage stats
+        """
+        with timed("summary"):
+            return await self._summarize(on_token)
+
+    async def _summarize(self, on_token: Optional[TokenCallback]) -> Tuple[str, bool, Optional[List[Dict]]]:
+        if self.chapters is not None:
+            return await self._summarize_chapters(on_token)
+        if self.mode == "full" and not self.fits_in_prompt():
+            # Too long for the model's context window: summarize in chunks instead of truncating
+            logger.info(
+                "Pages do not fit in one prompt, using map-reduce",
+                extra={"book_id": self.book_id, "start_page": self.start_page, "page_number": self.page_number},
+            )
+            self.mode = "map_reduce"
+        summary_key = self.summary_key()
+        summary = await self._cached_summary(summary_key)
+        cached = summary is not None
+        record_cache("summary", "hit" if cached else "miss", stage="summary")
+        record_size("pages", self.page_number - self.start_page + 1)
+        self._record_prompt_tokens()
+        await self._report("summary", mode=self.mode, cached=cached)
+
+        stages: Optional[List[Dict]] = None
+        streamed = False
+        if not cached:
+            async def generate() -> str:
+                nonlocal stages, streamed
+                summary, stages, streamed = await self._generate(summary_key, on_token)
+                if self.summary_cache is not None:
+                    await asyncio.to_thread(self.summary_cache.put, summary_key, summary)
+                return summary
+
+            lease_store = get_lease_store()
+            if lease_store is not None and self.summary_cache is not None:
+                # Another worker may be generating this summary; wait for it rather than generate it twice
+                summary, generated = await lease_store.single_flight(
+                    f"summary:{':'.join(map(str, summary_key))}", lambda: self._cached_summary(summary_key), generate
+                )
+                cached = not generated
+            else:
+                summary = await generate()
+
+        if on_token is not None and not streamed:
+            await on_token(summary)
+        return summary, cached, stages
+
+    async def _cached_summary(self, summary_key: SummaryKey) -> Optional[str]:
+        if self.summary_cache is None:
+            return None
+        return await asyncio.to_thread(self.summary_cache.get, summary_key)
+
+    async def _generate(
+        self, summary_key: SummaryKey, on_token: Optional[TokenCallback]
+    ) -> Tuple[str, Optional[List[Dict]], bool]:
+        # Returns the summary, map-reduce or retrieval stage stats and whether it was streamed to on_token
+        prompt_text, prompt_index = self.prompt_pages()
+        if self.mode == "map_reduce":
+            chunk_tokens = min(MAP_REDUCE_CHUNK_TOKENS, self.llm_service.prompt_budget(CHUNK_SUMMARY_PROMPT))
+            map_reduce_summarizer = MapReduceSummarizer(self.llm_service, chunk_tokens=chunk_tokens)
+            summary, stages = await map_reduce_summarizer.summarize(
+                prompt_text, prompt_index, self.start_page, self.page_number
+            )
+            return summary, stages, False
+        if self.mode == "retrieval":
+            retrieval_summarizer = RetrievalSummarizer(self.llm_service)
+            compaction_version = self.page_index.compaction_version if self.prompt_text is not None else None
+            summary, stages = await retrieval_summarizer.summarize(
+                self.question, prompt_text, prompt_index, self.text_digest, self.start_page, self.page_number,
+                compaction_version,
+            )
+            return summary, stages, False
+        if self.mode == "incremental":
+            incremental_summarizer = IncrementalSummarizer(self.llm_service, self.summary_cache, self.segment_pages())
+            return await incremental_summarizer.summarize(summary_key, prompt_text, prompt_index), None, False
+        if on_token is not None:
+            pieces = []
+            async for piece in self.llm_service.stream_summary(self.text_to_summarize()):
+                pieces.append(piece)
+                await on_token(piece)
+            return "".join(pieces), None, True
+        return await self.llm_service.summarize_text(self.text_to_summarize()), None, False
+
+    async def _summarize_chapters(self, on_token: Optional[TokenCallback]) -> Tuple[str, bool, Optional[List[Dict]]]:
+        self.mode = "chapters"
+        record_size("pages", self.page_number - self.start_page + 1)
+        self._record_prompt_tokens()
+        chapter_summarizer = ChapterSummarizer(self.llm_service, self.summary_cache)
+        summary, cached, stages = await chapter_summarizer.summarize(
+            self.summary_key(), *self.prompt_pages(), *self.chapters
+        )
+        record_cache("summary", "hit" if cached else "miss", stage="summary")
+        await self._report("summary", mode=self.mode, cached=cached)
+        if on_token is not None:
+            await on_token(summary)
+        return summary, cached, stages or None
+
+    def text_to_summarize(self) -> str:
+        """Extract only the important text for the prompt (compacted when prompt compaction is on)"""
+        prompt_text, prompt_index = self.prompt_pages()
+        return prompt_index.extract(prompt_text, self.start_page, self.page_number)
+
+    def original_text(self) -> Tuple[str, bool]:
+        """
+        Get the summarized text for the response, cut to the request memory limit
+
+        Returns:
+            Tuple of the text (its end when cut, nearest the requested page) and whether it was cut
+        """
+        if self.chapters is not None:
+            start, end = self.page_index.chapter_span(*self.chapters)
+        else:
+            start, end = self.page_index.page_span(self.start_page, self.page_number)
+        if end - start <= REQUEST_MEMORY_LIMIT_BYTES:
+            return self.book_text[start:end], False
+        return self.book_text[end - REQUEST_MEMORY_LIMIT_BYTES:end], True
+
+    def close(self) -> None:
+        """Unmap the book text and compacted text, when they are memory-mapped"""
+        for text in (self.book_text, self.prompt_text):
+            if isinstance(text, MappedText):
+                text.close()
+
+    def pages_url(self) -> str:
+        """Get the URL of GET /api/books/{id}/pages serving the summarized pages"""
+        params: Dict[str, Any] = {"from": self.start_page, "to": self.page_number}
+        if self.text_url:
+            params["text_url"] = self.text_url
+        return f"/api/books/{self.book_id}/pages?{urlencode(params)}"
+
+    async def run(
+        self,
+        on_token: Optional[TokenCallback] = None,
+        llm_slot: Optional[AsyncContextManager] = None,
+        include_original_text: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Run every stage of the pipeline
+
+        Args:
+            on_token: Optional callback receiving the summary as it is generated
+            llm_slot: Optional context manager (e.g. a semaphore) held only while
+                the stages that may call the LLM run
+            include_original_text: Return the summarized text itself, not only
+                the URL it can be fetched from
+
+        Returns:
+            Dict with the fields of SummaryResponse; memory-mapped texts are
+            closed by then
+        """
+        try:
+            text_url, text_format = await self.load_book()
+            await self.load_text(text_url, text_format)
+            if self.chapters is not None:
+                await self.resolve_chapters()
+            async with llm_slot if llm_slot is not None else nullcontext():
+                if self.chapters is None:
+                    await self.resolve_start()
+                summary, cached, stages = await self.summarize(on_token)
+            original_text, truncated = self.original_text() if include_original_text else (None, False)
+        finally:
+            self.close()
+        return {
+            "summary": summary,
+            "book_title": self.book_data.get("title", "Unknown"),
+            "author": self.book_data.get("authors", [{"name": "Unknown"}])[0].get("name", "Unknown"),
+            "page_number": self.page_number,
+            "start_page": self.start_page,
+            "original_text": original_text,
+            "original_text_truncated": truncated,
+            "original_text_url": self.pages_url(),
+            "chapter_start": self.chapters[0] if self.chapters is not None else None,
+            "chapter_end": self.chapters[1] if self.chapters is not None else None,
+            "cached": cached,
+            "stages": stages,
+        }
@@ -0,0 +1,482 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+import httpx
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from app.core.config import (
+    CACHE_DIR,
+    REQUEST_MEMORY_LIMIT_BYTES,
+    TEXT_CACHE_ENABLED,
+    TEXT_CACHE_MAX_BYTES,
+    TEXT_CACHE_REVALIDATE_SECONDS,
+)
+from app.services.book_text import BookText, MappedText
+from app.services.compaction import COMPACTION_VERSION
+from app.services.leases import LeaseStore, get_lease_store
+from app.services.page_index import PageIndex
+from app.services.vector_index import VectorIndex
+
+
+def cache_key(book_id: Optional[int], format_type: str, url: str, custom_url: bool = False) -> str:
+    """
+    Build the cache key for a book text
+
+    Args:
+        book_id: Gutenberg book id, or None when only the URL is known
+        format_type: MIME type of the format, e.g. "text/plain; charset=utf-8"
+        url: URL of the text, used as the key when book_id is None
+        custom_url: Whether the URL is not the one in the book's gutendex
+            formats; its hash is then part of the key, so a caller-supplied
+            URL never reads or replaces the book's Gutenberg text
+
+    Returns:
+        A filesystem-safe cache key
+    """
+    url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    if book_id is None:
+        return f"url-{url_hash}"
+    format_slug = re.sub(r"[^a-z0-9]+", "-", format_type.lower()).strip("-") or "text"
+    if custom_url:
+        return f"{book_id}-{format_slug}-url-{url_hash}"
+    return f"{book_id}-{format_slug}"
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _replace(tmp_path: str, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+
+
+class CachedText:
+    """Read-only memory-mapped view of a cached book text"""
+
+    def __init__(self, path: str, digest: str, charset: str, cache_status: str):
+        self.path = path
+        self.digest = digest
+        self.charset = charset
+        self.cache_status = cache_status
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # Empty files cannot be memory-mapped
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def decode(self) -> str:
+        return self.data[:].decode(self.charset, errors="replace")
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def __enter__(self) -> "CachedText":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class TextCache:
+    """
+    On-disk cache of downloaded book texts
+
+    Blobs are content-addressed by SHA-256 (identical texts served under
+    several formats are stored once) and entries map a cache key to a blob
+    along with its ETag/Last-Modified validators. Blob mtimes track recency
+    for size-bounded LRU eviction.
+
+    Several processes can share one cache directory: every file is written
+    atomically, and with a lease store only one of them downloads a given
+    text at a time while the others wait for it.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = TEXT_CACHE_MAX_BYTES,
+        revalidate_after: float = TEXT_CACHE_REVALIDATE_SECONDS,
+        leases: Optional[LeaseStore] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.leases = leases
+        self.stats: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "stale_served": 0,
+            "evictions": 0,
+        }
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "entries", f"{key}.json")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", digest[:2], digest)
+
+    def _page_index_path(self, digest: str, max_chars_per_page: int) -> str:
+        return f"{self._blob_path(digest)}.pages-{max_chars_per_page}"
+
+    def _vector_index_path(
+        self, digest: str, max_chars_per_page: int, embedder: str, compaction_version: Optional[int] = None
+    ) -> str:
+        embedder_slug = re.sub(r"[^a-z0-9]+", "-", embedder.lower()).strip("-")
+        # Vectors of the compacted text are kept apart from those of the original, per compaction version
+        compacted = f"-compact-v{compaction_version}" if compaction_version is not None else ""
+        return f"{self._blob_path(digest)}.vectors-{max_chars_per_page}-{embedder_slug}{compacted}"
+
+    def _compacted_text_path(self, digest: str, max_chars_per_page: int) -> str:
+        return f"{self._blob_path(digest)}.compact-{max_chars_per_page}-v{COMPACTION_VERSION}"
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _load_entry(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._entry_path(key), "rb") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._blob_path(entry["digest"])):
+            return None
+        return entry
+
+    def _open(self, entry: Dict, cache_status: str) -> CachedText:
+        blob_path = self._blob_path(entry["digest"])
+        # Touch the blob so it counts as recently used for eviction
+        os.utime(blob_path)
+        return CachedText(blob_path, entry["digest"], entry.get("charset") or "utf-8", cache_status)
+
+    def get(self, key: str) -> Optional[CachedText]:
+        """
+        Open a cached text without touching the network
+
+        Args:
+            key: Cache key from cache_key()
+
+        Returns:
+            The cached text, or None if it is not cached
+        """
+        entry = self._load_entry(key)
+        if entry is None:
+            return None
+        self._count("hits")
+        return self._open(entry, "hit")
+
+    async def fetch(self, key: str, url: str, client: httpx.AsyncClient) -> CachedText:
+        """
+        Get a book text from the cache, downloading or revalidating it if needed
+
+        Args:
+            key: Cache key from cache_key()
+            url: URL of the text
+            client: Client used for the download
+
+        Returns:
+            The cached text; cache_status is "hit", "revalidated", "stale" or "miss"
+        """
+        cached_text = await self._fresh(key)
+        if cached_text is not None:
+            return cached_text
+        if self.leases is None:
+            return await self._download(key, url, client)
+        # Another process may be downloading the same text; wait for its copy
+        cached_text, _ = await self.leases.single_flight(
+            f"text:{key}", lambda: self._fresh(key), lambda: self._download(key, url, client)
+        )
+        return cached_text
+
+    async def _fresh(self, key: str) -> Optional[CachedText]:
+        entry = self._load_entry(key)
+        if entry is None or time.time() - entry["fetched_at"] >= self.revalidate_after:
+            return None
+        self._count("hits")
+        return self._open(entry, "hit")
+
+    async def _download(self, key: str, url: str, client: httpx.AsyncClient) -> CachedText:
+        entry = self._load_entry(key)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            async with client.stream("GET", url, headers=headers, timeout=30.0) as response:
+                if entry is not None and response.status_code == 304:
+                    entry["fetched_at"] = time.time()
+                    await asyncio.to_thread(_atomic_write, self._entry_path(key), json.dumps(entry).encode("utf-8"))
+                    self._count("revalidated")
+                    return self._open(entry, "revalidated")
+                response.raise_for_status()
+                entry = await self._store(key, url, response)
+        except httpx.HTTPError:
+            if entry is None:
+                raise
+            # Upstream is unavailable; a stale copy beats failing the request
+            self._count("stale_served")
+            return self._open(entry, "stale")
+
+        self._count("misses")
+        return self._open(entry, "miss")
+
+    async def _store(self, key: str, url: str, response: httpx.Response) -> Dict:
+        # File writes and eviction block, so they run in worker threads, off the event loop
+        blobs_dir = os.path.join(self.cache_dir, "blobs")
+        await asyncio.to_thread(os.makedirs, blobs_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=blobs_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in response.aiter_bytes(64 * 1024):
+                    await asyncio.to_thread(f.write, chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            blob_path = self._blob_path(digest.hexdigest())
+            await asyncio.to_thread(_replace, tmp_path, blob_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        entry = {
+            "url": url,
+            "digest": digest.hexdigest(),
+            "size": size,
+            "charset": response.charset_encoding,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+        }
+        await asyncio.to_thread(_atomic_write, self._entry_path(key), json.dumps(entry).encode("utf-8"))
+        await asyncio.to_thread(self.evict, entry["digest"])
+        return entry
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Remove least recently used blobs until the cache fits in max_bytes
+
+        A blob's size includes its derived files, which are removed with it.
+
+        Workers sharing the cache may evict at the same time; a blob another
+        worker removed first is not counted.
+
+        Args:
+            keep: Digest of a blob that must not be evicted
+
+        Returns:
+            Number of blobs removed
+        """
+        blobs = []
+        total = 0
+        for root, _, files in os.walk(os.path.join(self.cache_dir, "blobs")):
+            # Blob name -> (mtime, size); derived files (page and vector indexes,
+            # compacted text) count toward their blob's size
+            sizes: Dict[str, Tuple[float, int]] = {}
+            derived_sizes: Dict[str, int] = {}
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if "." in name:
+                    blob = name.split(".", 1)[0]
+                    derived_sizes[blob] = derived_sizes.get(blob, 0) + stat.st_size
+                else:
+                    sizes[name] = (stat.st_mtime, stat.st_size)
+            for name, (mtime, size) in sizes.items():
+                size += derived_sizes.get(name, 0)
+                blobs.append((mtime, size, name, os.path.join(root, name)))
+                total += size
+
+        removed = 0
+        for _, size, name, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            total -= size
+            # Derived files (page and vector indexes) go with their blob
+            directory = os.path.dirname(path)
+            try:
+                derived_files = [derived for derived in os.listdir(directory) if derived.startswith(f"{name}.")]
+            except FileNotFoundError:
+                derived_files = []
+            for derived in derived_files:
+                try:
+                    os.unlink(os.path.join(directory, derived))
+                except FileNotFoundError:
+                    pass
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Another worker evicted it first
+                continue
+            removed += 1
+            self._count("evictions")
+        return removed
+
+    def load_page_index(self, digest: str, max_chars_per_page: int) -> Optional[PageIndex]:
+        """
+        Load the page index stored next to a cached text
+
+        Args:
+            digest: Digest of the cached text
+            max_chars_per_page: Page size the index was built with
+
+        Returns:
+            The stored PageIndex, or None if there is none
+        """
+        try:
+            with open(self._page_index_path(digest, max_chars_per_page), "rb") as f:
+                return PageIndex.from_bytes(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def store_page_index(self, digest: str, page_index: PageIndex) -> None:
+        """
+        Store a page index next to a cached text
+
+        Args:
+            digest: Digest of the cached text
+            page_index: Index built from the text
+        """
+        _atomic_write(self._page_index_path(digest, page_index.max_chars_per_page), page_index.to_bytes())
+
+    def load_vector_index(
+        self, digest: str, max_chars_per_page: int, embedder: str, compaction_version: Optional[int] = None
+    ) -> Optional[VectorIndex]:
+        """
+        Memory-map the page embeddings stored next to a cached text
+
+        Args:
+            digest: Digest of the cached text
+            max_chars_per_page: Page size the pages were embedded with
+            embedder: Name of the embedder that produced the vectors
+            compaction_version: Version of the compaction rules, when the
+                compacted text was embedded rather than the original
+
+        Returns:
+            The stored VectorIndex, or None if there is none
+        """
+        try:
+            return VectorIndex.open(self._vector_index_path(digest, max_chars_per_page, embedder, compaction_version))
+        except (OSError, ValueError):
+            return None
+
+    def store_vector_index(
+        self,
+        digest: str,
+        max_chars_per_page: int,
+        embedder: str,
+        vector_index: VectorIndex,
+        compaction_version: Optional[int] = None,
+    ) -> None:
+        """
+        Store page embeddings next to a cached text
+
+        Args:
+            digest: Digest of the cached text
+            max_chars_per_page: Page size the pages were embedded with
+            embedder: Name of the embedder that produced the vectors
+            vector_index: One vector per page of the text
+            compaction_version: Version of the compaction rules, when the
+                compacted text was embedded rather than the original
+        """
+        _atomic_write(
+            self._vector_index_path(digest, max_chars_per_page, embedder, compaction_version), vector_index.to_bytes()
+        )
+
+    def load_compacted_text(self, digest: str, max_chars_per_page: int) -> Optional[BookText]:
+        """
+        Load the prompt-compacted text stored next to a cached text
+
+        Texts larger than REQUEST_MEMORY_LIMIT_BYTES are memory-mapped.
+
+        Args:
+            digest: Digest of the cached text
+            max_chars_per_page: Page size the text was compacted page by page with
+
+        Returns:
+            The compacted text, or None if there is none
+        """
+        path = self._compacted_text_path(digest, max_chars_per_page)
+        try:
+            if os.path.getsize(path) > REQUEST_MEMORY_LIMIT_BYTES:
+                return MappedText.open(path)
+            with open(path, "rb") as f:
+                return f.read().decode("utf-8", errors="surrogateescape")
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def compacted_text_writer(self, digest: str, max_chars_per_page: int) -> Iterator[Callable[[str], None]]:
+        """
+        Store a prompt-compacted text next to a cached text, written piece by piece
+
+        The text replaces the stored one only when the block exits without an error.
+
+        Args:
+            digest: Digest of the cached text
+            max_chars_per_page: Page size the text is compacted page by page with
+
+        Yields:
+            A function writing the next piece of the compacted text
+        """
+        path = self._compacted_text_path(digest, max_chars_per_page)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", errors="surrogateescape", newline="") as f:
+                yield f.write
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+_text_cache: Optional[TextCache] = None
+
+
+def get_text_cache() -> Optional[TextCache]:
+    """
+    Get the process-wide text cache
+
+    Returns:
+        The TextCache, or None when TEXT_CACHE_ENABLED is off
+    """
+    global _text_cache
+    if not TEXT_CACHE_ENABLED:
+        return None
+    if _text_cache is None:
+        _text_cache = TextCache(os.path.join(CACHE_DIR, "texts"), leases=get_lease_store())
+    return _text_cache
@@ -0,0 +1,134 @@
+import logging
+import math
+from typing import Dict, List, Optional
+from app.core.config import LLM_CONTEXT_TOKENS, LLM_TOKENIZER
+
+logger = logging.getLogger(__name__)
+
+# Context windows of common local models, in tokens. Names are matched on the
+# longest prefix of the model name without its tag ("llama3.1:8b" -> "llama3.1").
+MODEL_CONTEXT_TOKENS: Dict[str, int] = {
+    "llama2": 4096,
+    "llama3": 8192,
+    "llama3.1": 131072,
+    "llama3.2": 131072,
+    "llama3.3": 131072,
+    "mistral": 32768,
+    "mixtral": 32768,
+    "gemma": 8192,
+    "gemma2": 8192,
+    "gemma3": 131072,
+    "phi3": 4096,
+    "qwen2": 32768,
+    "qwen2.5": 32768,
+    "fake": 4096,
+}
+DEFAULT_CONTEXT_TOKENS = 4096
+
+# Punctuation that SentencePiece/BPE vocabularies usually split into separate tokens
+_PUNCTUATION = ".,;:!?\"'()-"
+
+
+class HeuristicTokenizer:
+    """
+    Fast token estimate for English prose, tuned for Llama-family tokenizers
+
+    Counts whitespace-separated words (about 1.35 tokens each, since longer
+    words split into several pieces) plus punctuation marks. Only uses
+    str.split and str.count, so it runs at C speed on whole books. Prompt
+    budgets keep a margin on top for books where it runs low.
+    """
+
+    name = "heuristic-v1"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        words = len(text.split())
+        punctuation = sum(text.count(mark) for mark in _PUNCTUATION)
+        return math.ceil(words * 1.35) + punctuation
+
+
+class TiktokenTokenizer:
+    """Exact counts from tiktoken's cl100k_base encoding (needs the optional tiktoken package)"""
+
+    name = "tiktoken-cl100k"
+
+    def __init__(self):
+        import tiktoken
+
+        self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text: str) -> int:
+        return len(self._encoding.encode_ordinary(text))
+
+
+_tokenizer = None
+
+
+def get_tokenizer():
+    """
+    Get the process-wide tokenizer selected by LLM_TOKENIZER
+
+    Falls back to the heuristic estimator when tiktoken is requested but not installed.
+
+    Returns:
+        An object with a name and a count(text) method
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        if LLM_TOKENIZER == "tiktoken":
+            try:
+                _tokenizer = TiktokenTokenizer()
+            except ImportError:
+                logger.warning("tiktoken is not installed, using the heuristic token estimator")
+                _tokenizer = HeuristicTokenizer()
+        else:
+            _tokenizer = HeuristicTokenizer()
+    return _tokenizer
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in text with the configured tokenizer"""
+    return get_tokenizer().count(text)
+
+
+def _base_model_name(model: str) -> str:
+    return model.strip().lower().rsplit("/", 1)[-1].split(":", 1)[0]
+
+
+def context_window(model: str, override: int = LLM_CONTEXT_TOKENS) -> int:
+    """
+    Get the context window of a model
+
+    Args:
+        model: Model name; a comma-separated list of replicas gets the smallest window
+        override: Context size to use for every model (0 uses the built-in table)
+
+    Returns:
+        Context window in tokens
+    """
+    if override > 0:
+        return override
+    windows: List[int] = []
+    for name in model.split(","):
+        base = _base_model_name(name)
+        matches = [prefix for prefix in MODEL_CONTEXT_TOKENS if base.startswith(prefix)]
+        windows.append(MODEL_CONTEXT_TOKENS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_TOKENS)
+    return min(windows) if windows else DEFAULT_CONTEXT_TOKENS
+
+
+def count_page_tokens(text: str, page_index, tokenizer: Optional[object] = None) -> List[int]:
+    """
+    Estimate the tokens of every page of a book
+
+    Args:
+        text: The text the page index was built from
+        page_index: PageIndex of the text
+        tokenizer: Tokenizer to use (defaults to the configured one)
+
+    Returns:
+        Token count of each page, in page order
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    return [tokenizer.count(page_index.extract(text, page, page)) for page in range(1, len(page_index) + 1)]
@@ -0,0 +1,151 @@
+import heapq
+import math
+import mmap
+import operator
+import struct
+from array import array
+from typing import Any, List, Optional, Sequence, Tuple
+
+# Bump VECTOR_INDEX_VERSION whenever the file layout changes; older files are rebuilt
+VECTOR_INDEX_VERSION = 1
+_MAGIC = b"BSVI"
+# magic, version, page count, dimensions; 16 bytes keep the float32 rows aligned
+_HEADER = struct.Struct("<4sIII")
+
+# NumPy, once imported; False when it is not installed
+_numpy: Any = None
+
+
+def _load_numpy() -> Optional[Any]:
+    # NumPy is optional and slow to import, so it is only imported when vectors are first used
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def _normalized(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class VectorIndex:
+    """
+    One unit-length embedding per page, searched by cosine similarity
+
+    Stored as a small header followed by little-endian float32 rows, next to
+    the page index in the text cache. Opened from a file the rows are
+    memory-mapped (as a NumPy memmap when NumPy is installed), so the vectors
+    of a book stay in the OS page cache, shared by every request and worker,
+    instead of being loaded per request. Scoring is one matrix-vector product
+    with NumPy, or a pure-Python loop over the same mapping without it.
+    """
+
+    def __init__(self, rows, pages: int, dimensions: int):
+        # rows: a (pages, dimensions) NumPy array, or a flat sequence of floats
+        self.rows = rows
+        self.pages = pages
+        self.dimensions = dimensions
+
+    def __len__(self) -> int:
+        return self.pages
+
+    @classmethod
+    def build(cls, embeddings: Sequence[Sequence[float]]) -> "VectorIndex":
+        """
+        Build an index from one embedding per page, in page order
+
+        Args:
+            embeddings: The page embeddings (normalized here)
+
+        Returns:
+            The VectorIndex
+        """
+        dimensions = len(embeddings[0]) if embeddings else 0
+        rows = array("f")
+        for embedding in embeddings:
+            if len(embedding) != dimensions:
+                raise ValueError("Every embedding must have the same number of dimensions")
+            rows.extend(_normalized(embedding))
+        numpy = _load_numpy()
+        if numpy is not None:
+            return cls(numpy.frombuffer(rows, dtype=numpy.float32).reshape(len(embeddings), dimensions), len(embeddings), dimensions)
+        return cls(rows, len(embeddings), dimensions)
+
+    def to_bytes(self) -> bytes:
+        """Serialise the index (header and float32 rows)"""
+        numpy = _load_numpy()
+        if numpy is not None and isinstance(self.rows, numpy.ndarray):
+            data = self.rows.astype("<f4").tobytes()
+        else:
+            rows = array("f", self.rows)
+            if struct.pack("=f", 1.0) != struct.pack("<f", 1.0):
+                rows.byteswap()
+            data = rows.tobytes()
+        return _HEADER.pack(_MAGIC, VECTOR_INDEX_VERSION, self.pages, self.dimensions) + data
+
+    @classmethod
+    def open(cls, path: str) -> "VectorIndex":
+        """
+        Memory-map a stored index
+
+        Raises:
+            OSError: If the file cannot be read
+            ValueError: If it is not a current vector index
+        """
+        numpy = _load_numpy()
+        with open(path, "rb") as f:
+            magic, version, pages, dimensions = _HEADER.unpack(f.read(_HEADER.size).ljust(_HEADER.size, b"\0"))
+            if magic != _MAGIC or version != VECTOR_INDEX_VERSION:
+                raise ValueError(f"Not a version {VECTOR_INDEX_VERSION} vector index: {path}")
+            if numpy is not None:
+                rows = numpy.memmap(f, dtype="<f4", mode="r", offset=_HEADER.size, shape=(pages, dimensions))
+                return cls(rows, pages, dimensions)
+            # The mapping stays valid after the file is closed
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        rows = memoryview(mapped)[_HEADER.size:_HEADER.size + pages * dimensions * 4].cast("f")
+        if struct.pack("=f", 1.0) != struct.pack("<f", 1.0):
+            rows = array("f", rows)
+            rows.byteswap()
+        return cls(rows, pages, dimensions)
+
+    def scores(self, query: Sequence[float], first_page: int, last_page: int) -> List[float]:
+        """
+        Cosine similarity of the query to pages first_page..last_page
+
+        Args:
+            query: The query embedding (normalized here)
+            first_page: First page to score (1-based)
+            last_page: Last page to score (1-based, inclusive)
+
+        Returns:
+            One score per page, in page order
+        """
+        if len(query) != self.dimensions:
+            raise ValueError(f"Query has {len(query)} dimensions, the index {self.dimensions}")
+        first, last = max(first_page, 1) - 1, min(last_page, self.pages)
+        query = _normalized(query)
+        numpy = _load_numpy()
+        if numpy is not None and isinstance(self.rows, numpy.ndarray):
+            return (self.rows[first:last] @ numpy.asarray(query, dtype=numpy.float32)).tolist()
+        dimensions = self.dimensions
+        return [
+            sum(map(operator.mul, query, self.rows[row * dimensions:(row + 1) * dimensions]))
+            for row in range(first, last)
+        ]
+
+    def top_pages(self, query: Sequence[float], first_page: int, last_page: int, k: int) -> List[Tuple[int, float]]:
+        """
+        Find the k pages in first_page..last_page most similar to the query
+
+        Returns:
+            (page number, score) pairs, most similar first
+        """
+        scores = self.scores(query, first_page, last_page)
+        first = max(first_page, 1)
+        return heapq.nlargest(k, ((first + i, score) for i, score in enumerate(scores)), key=lambda pair: pair[1])
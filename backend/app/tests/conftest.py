@@ -0,0 +1,21 @@
+import pytest
+from app.services import leases, search_index, summary_cache, text_cache
+from app.services.metadata_cache import get_metadata_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_metadata_cache():
+    """Start every test with an empty in-process metadata cache."""
+    get_metadata_cache().invalidate()
+    yield
+    get_metadata_cache().invalidate()
+
+
+@pytest.fixture(autouse=True)
+def isolated_disk_caches(tmp_path, monkeypatch):
+    """Keep the on-disk caches, search index and leases of each test in its own temporary directory."""
+    lease_store = leases.LeaseStore(str(tmp_path / "leases.sqlite3"))
+    monkeypatch.setattr(leases, "_lease_store", lease_store)
+    monkeypatch.setattr(text_cache, "_text_cache", text_cache.TextCache(str(tmp_path / "texts"), leases=lease_store))
+    monkeypatch.setattr(summary_cache, "_summary_cache", summary_cache.SummaryCache(str(tmp_path / "summaries.sqlite3")))
+    monkeypatch.setattr(search_index, "_search_index", search_index.SearchIndex(str(tmp_path / "search.sqlite3")))
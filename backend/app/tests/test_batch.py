@@ -0,0 +1,92 @@
+import json
+import re
+import httpx
+from unittest.mock import patch
+from app import batch
+from app.core.config import MAX_CHARS_PER_PAGE
+from app.services import text_cache
+from app.services.llm_backends import FakeBackend, ReplicaPool
+from app.services.llm_service import PROMPT_VERSION
+from app.services.summary_cache import SummaryKey, get_summary_cache
+
+BOOK_TEXT = (
+    "*** START OF THE PROJECT GUTENBERG EBOOK TEST ***\n\nPREFACE\n\nA few words first.\n\n"
+    + "".join(
+        f"CHAPTER {n}.\n\n" + "It was a dark and stormy night, and the rain fell in torrents upon the town.\n" * 150
+        for n in ("I", "II", "III")
+    )
+)
+
+
+def fake_gutendex(request: httpx.Request) -> httpx.Response:
+    """Local stand-in for gutendex and the Gutenberg text mirror"""
+    path = request.url.path
+    if path.endswith(".txt"):
+        if "/404" in path:
+            return httpx.Response(404)
+        return httpx.Response(200, text=BOOK_TEXT)
+    match = re.search(r"/books/(\d+)/$", path)
+    if match:
+        book_id = int(match.group(1))
+        return httpx.Response(200, json={
+            "id": book_id,
+            "title": f"Book {book_id}",
+            "authors": [{"name": "Author"}],
+            "formats": {"text/plain; charset=us-ascii": f"http://mirror/{book_id}.txt"},
+        })
+    return httpx.Response(200, json={"results": [], "next": None})
+
+
+def run_batch_cli(tmp_path, *args):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake_gutendex))
+    llm = ReplicaPool([FakeBackend("llama2")])
+    with patch("app.services.book_service.get_gutenberg_client", return_value=client), \
+            patch("app.services.llm_service.get_llm_backend", return_value=llm), \
+            patch("app.batch.get_llm_backend", return_value=llm):
+        return batch.main(["--workers", "0", "--state", str(tmp_path / "state.jsonl"), *args])
+
+
+def test_batch_warms_caches_and_resumes(tmp_path):
+    """Test that a batch run fills the caches the API reads and skips finished books when rerun."""
+    stats = run_batch_cli(tmp_path, "--ids", "1", "2", "404", "--checkpoints", "3", "6", "--mode", "full")
+
+    assert stats["books"] == 2 and stats["failed"] == 1
+    assert stats["summaries"] == 4
+    assert stats["pages_per_second"] > 0
+
+    cached = text_cache.get_text_cache().get(text_cache.cache_key(1, "text/plain; charset=us-ascii", "http://mirror/1.txt"))
+    with cached:
+        digest = cached.digest
+        page_index = text_cache.get_text_cache().load_page_index(digest, MAX_CHARS_PER_PAGE)
+    assert page_index is not None and page_index.has_tokens()
+
+    summary_cache = get_summary_cache()
+    start_page = summary_cache.get_content_start(1, "llama2", PROMPT_VERSION, MAX_CHARS_PER_PAGE, digest)
+    assert start_page == 1
+    assert summary_cache.get(SummaryKey(1, start_page, 3, "llama2", PROMPT_VERSION, MAX_CHARS_PER_PAGE, digest, "full"))
+    # Six pages do not fit in llama2's context, so that checkpoint was chunked
+    assert summary_cache.get(SummaryKey(1, start_page, 6, "llama2", PROMPT_VERSION, MAX_CHARS_PER_PAGE, digest, "map_reduce"))
+
+    records = [json.loads(line) for line in (tmp_path / "state.jsonl").read_text().splitlines()]
+    assert sorted((record["book_id"], record["status"]) for record in records) == [(1, "done"), (2, "done"), (404, "failed")]
+
+    # Rerunning skips finished books and retries the failed one
+    stats = run_batch_cli(tmp_path, "--ids", "1", "2", "404", "--checkpoints", "3", "6", "--mode", "full")
+    assert stats["skipped"] == 2 and stats["failed"] == 1 and stats["books"] == 0
+
+    # Different settings are a different run
+    stats = run_batch_cli(tmp_path, "--ids", "1")
+    assert stats["books"] == 1 and stats["summaries"] == 0
+
+
+def test_prepare_text_in_worker_process():
+    """Test that the CPU stages can run in a separate process."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(1) as executor:
+        index_bytes, content_start = executor.submit(batch.prepare_text, BOOK_TEXT, 500).result()
+
+    page_index = batch.PageIndex.from_bytes(index_bytes)
+    assert page_index.has_tokens()
+    assert BOOK_TEXT[content_start.offset:].startswith("CHAPTER I.")
+    assert content_start.method == "first-heading"
@@ -0,0 +1,130 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from app.main import app
+from app.services.book_service import BookService
+from app.services.chapter_summarizer import ChapterSummarizer
+from app.services.front_matter import index_chapters
+from app.services.llm_backends import FakeBackend
+from app.services.llm_service import LLMService
+from app.services.page_index import PageIndex
+from app.services.summary_cache import SummaryKey, get_summary_cache
+
+PROSE = "The crew kept their watch on deck while the ship ran before the wind.\n" * 40
+
+BOOK_TEXT = (
+    "*** START OF THE PROJECT GUTENBERG EBOOK SEA TALES ***\n\nSEA TALES\n\n\n"
+    + "".join(f"CHAPTER {n}. Voyage {n}.\n\n{PROSE}\n\n" for n in range(1, 5))
+    + "*** END OF THE PROJECT GUTENBERG EBOOK SEA TALES ***\nLicense text.\n"
+)
+
+BOOK = {"id": 7, "title": "Sea Tales", "authors": [{"name": "Doe, Jane"}], "formats": {"text/plain": "http://x/7.txt"}}
+
+KEY = SummaryKey(7, 1, 1, "fake", "v1", 3000, "ab12")
+
+
+def indexed(max_chars_per_page: int = 1000) -> PageIndex:
+    page_index = BookService.build_page_index(BOOK_TEXT, max_chars_per_page)
+    page_index.set_chapters(*index_chapters(BOOK_TEXT))
+    return page_index
+
+
+class CountingBackend(FakeBackend):
+    """FakeBackend that tracks how many calls are in flight at once"""
+
+    def __init__(self):
+        super().__init__("fake", latency=0.01)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate(self, prompt, system, max_tokens, temperature):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super().generate(prompt, system, max_tokens, temperature)
+        finally:
+            self.in_flight -= 1
+
+
+class TestChapterIndex:
+    def test_chapter_spans_and_serialisation(self):
+        """Test chapter spans end at the next chapter or the body, and survive serialisation."""
+        page_index = indexed()
+        assert len(page_index.chapters) == 4
+        start, end = page_index.chapter_span(4, 4)
+        assert BOOK_TEXT[start:end].startswith("CHAPTER 4. Voyage 4.")
+        assert "*** END" not in BOOK_TEXT[start:end]
+        first_page, last_page = page_index.chapter_page_range(2, 3)
+        assert page_index.page_for_offset(page_index.chapters[1][0]) == first_page
+
+        restored = PageIndex.from_bytes(page_index.to_bytes())
+        assert restored.chapters == page_index.chapters
+        assert restored.chapter_span(4, 4) == (start, end)
+        with pytest.raises(ValueError):
+            restored.chapter_span(3, 5)
+
+
+class TestChapterSummarizer:
+    @pytest.mark.asyncio
+    async def test_chapter_summaries_are_reused_across_ranges(self):
+        """Test that a range reuses cached chapter summaries and only summarizes new chapters."""
+        backend = FakeBackend("fake")
+        with patch("app.services.llm_service.get_llm_backend", return_value=backend):
+            summarizer = ChapterSummarizer(LLMService(), get_summary_cache())
+            page_index = indexed()
+
+            first, cached, stages = await summarizer.summarize(KEY, BOOK_TEXT, page_index, 1, 3)
+            assert not cached and stages[0]["cached"] == 0
+            calls = len(backend.prompts)
+
+            again, cached, _ = await summarizer.summarize(KEY, BOOK_TEXT, page_index, 1, 3)
+            assert again == first and cached
+            assert len(backend.prompts) == calls
+
+            _, cached, stages = await summarizer.summarize(KEY, BOOK_TEXT, page_index, 2, 4)
+            assert not cached
+            assert stages[0]["cached"] == 2
+            # One prompt for chapter 4, one to combine the three chapter summaries
+            assert len(backend.prompts) == calls + 2
+            assert "CHAPTER 4. Voyage 4." in backend.prompts[calls]
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded_across_chapters(self):
+        """Test that the chapters of a range share one concurrency limit for their map calls."""
+        backend = CountingBackend()
+        with patch("app.services.llm_service.get_llm_backend", return_value=backend):
+            summarizer = ChapterSummarizer(LLMService(), None, chunk_tokens=200, max_concurrency=2)
+            await summarizer.summarize(KEY, BOOK_TEXT, indexed(), 1, 4)
+        # Several chunks per chapter, four chapters, but never more than two calls at once
+        assert len(backend.prompts) > 8
+        assert backend.max_in_flight == 2
+
+
+@patch("app.services.book_service.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(BOOK_TEXT, None))
+@patch("app.services.book_service.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+class TestChapterEndpoints:
+    def test_list_chapters(self, mock_get_book, mock_fetch_text):
+        """Test GET /api/books/{id}/chapters lists chapter titles and page ranges."""
+        response = TestClient(app).get("/api/books/7/chapters")
+        assert response.status_code == 200
+        body = response.json()
+        assert [chapter["title"] for chapter in body["chapters"]] == [f"CHAPTER {n}. Voyage {n}." for n in range(1, 5)]
+        assert body["chapters"][0]["start_page"] == 1
+        assert body["chapters"][-1]["end_page"] == body["total_pages"]
+
+    def test_summarize_chapter_range(self, mock_get_book, mock_fetch_text):
+        """Test summarizing a chapter range, and rejecting unknown or malformed ranges."""
+        client = TestClient(app)
+        with patch("app.services.llm_service.get_llm_backend", return_value=FakeBackend("fake")):
+            response = client.post("/api/summarize", json={
+                "book_id": 7, "chapter_start": 2, "chapter_end": 3, "include_original_text": True,
+            })
+        assert response.status_code == 200
+        body = response.json()
+        assert body["chapter_start"] == 2 and body["chapter_end"] == 3
+        assert body["original_text"].startswith("CHAPTER 2. Voyage 2.")
+        assert "CHAPTER 4" not in body["original_text"]
+
+        assert client.post("/api/summarize", json={"book_id": 7, "chapter_start": 9}).status_code == 400
+        assert client.post("/api/summarize", json={"book_id": 7, "chapter_start": 3, "chapter_end": 2}).status_code == 422
+        assert client.post("/api/summarize", json={"book_id": 7}).status_code == 422
@@ -0,0 +1,122 @@
+import textwrap
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services import book_service, summary_pipeline
+from app.services.book_service import BookService
+from app.services.compaction import COMPACTION_VERSION, compact_book, compact_text
+from app.services.front_matter import index_chapters
+from app.services.llm_backends import FakeBackend
+from app.services.summary_pipeline import SummaryPipeline
+from app.services.text_cache import get_text_cache
+from app.services.tokens import HeuristicTokenizer, count_page_tokens
+
+PARAGRAPH = (
+    "It was a bright cold day in April, and the clocks were striking thirteen. The crew kept "
+    "their watch on deck while the ship ran before the wind, and the _mate_ swore at the gulls.[1]"
+)
+
+
+def gutenberg_text(chapters: int = 6, paragraphs: int = 8) -> str:
+    """Hard-wrapped chapters with illustrations, footnote markers and decoration, like a Gutenberg text."""
+    parts = []
+    for chapter in range(1, chapters + 1):
+        parts.append(f"CHAPTER {chapter}\n\n")
+        for paragraph in range(paragraphs):
+            parts.append(textwrap.fill(PARAGRAPH, 70) + "\n\n")
+            if paragraph == 3:
+                parts.append("[Illustration: The ship\n    at anchor]\n\n       *       *       *       *       *\n\n")
+    return "".join(parts)
+
+
+BOOK = {"id": 7, "title": "Sea Tales", "authors": [{"name": "Doe, Jane"}], "formats": {"text/plain": "http://x/7.txt"}}
+
+
+class TestCompactText:
+    def test_drops_decoration_and_unwraps_lines(self):
+        """Test that decoration goes, paragraphs are unwrapped and paragraph breaks are kept."""
+        text = (
+            "Page 3\n\n----------------------------------------\n\n"
+            "The  rain fell\nin torrents [12] on the\r\n_old_ house.{45}\n\n"
+            "[Illustration]\n\n[Illustration: A long caption\nover two lines]\n\n"
+            "  *  *  *  \n\n\n\nHe said_ snake_case_names_ [Pg 9]stay.\n"
+        )
+        assert compact_text(text) == "The rain fell in torrents on the old house.\n\nHe said_ snake_case_names_ stay."
+        assert compact_text("  \n\n [Illustration] \n") == ""
+
+
+class TestCompactBook:
+    def test_pages_and_chapters_stay_aligned(self):
+        """Test that page N of the compacted text is compacted page N, and chapters start at their headings."""
+        text = gutenberg_text()
+        page_index = BookService.build_page_index(text, 1000)
+        page_index.set_chapters(*index_chapters(text))
+        page_index.set_page_tokens(count_page_tokens(text, page_index, HeuristicTokenizer()), HeuristicTokenizer.name)
+        pieces = []
+        compacted_index, bytes_saved = compact_book(text, page_index, pieces.append, HeuristicTokenizer())
+        compacted = "".join(pieces)
+
+        assert len(compacted_index) == len(page_index)
+        assert bytes_saved == len(text) - len(compacted) > 0.05 * len(text)
+        for page in range(1, len(page_index) + 1):
+            assert compacted_index.extract(compacted, page, page).strip() == compact_text(page_index.extract(text, page, page))
+        assert compacted_index.extract(compacted, 1, len(page_index)) == compacted
+        assert compacted_index.page_tokens(1, len(page_index)) < page_index.page_tokens(1, len(page_index))
+
+        assert len(compacted_index.chapters) == len(page_index.chapters) == 6
+        for (offset, title), (compacted_offset, compacted_title) in zip(page_index.chapters, compacted_index.chapters):
+            assert compacted_title == title
+            assert compacted[compacted_offset:].startswith(text[offset:offset + 9])
+        start, end = compacted_index.chapter_span(2, 2)
+        assert compacted[start:end].startswith("CHAPTER 2\n\nIt was a bright cold day")
+        assert compacted[start:end].count("CHAPTER") == 1
+
+    def test_compacted_once_per_book(self):
+        """Test that the compacted text is stored with the page index and reused."""
+        text = gutenberg_text()
+        digest = "cd" * 32
+        text_cache = get_text_cache()
+        page_index = BookService.get_page_index(text, 1000, digest)
+        page_index.set_chapters(*index_chapters(text))
+        with patch("app.services.book_service.compact_book", wraps=compact_book) as compact:
+            compacted, compacted_index = BookService.get_compacted_text(text, page_index, digest)
+            stored_index = text_cache.load_page_index(digest, 1000)
+            assert stored_index.compaction_version == COMPACTION_VERSION
+            assert stored_index.compaction_bytes_saved == len(text) - len(compacted)
+            again, again_index = BookService.get_compacted_text(text, stored_index, digest)
+        assert compact.call_count == 1
+        assert again == compacted and list(again_index.offsets) == list(compacted_index.offsets)
+        assert again_index.chapters == compacted_index.chapters
+
+        # Rules of another version compact the book again
+        with patch.object(book_service, "COMPACTION_VERSION", COMPACTION_VERSION + 1), \
+                patch("app.services.book_service.compact_book", wraps=compact_book) as compact:
+            BookService.get_compacted_text(text, stored_index, digest)
+        assert compact.call_count == 1
+
+
+@patch("app.services.book_service.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(gutenberg_text(2), None))
+@patch("app.services.book_service.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+class TestCompactedPrompts:
+    @pytest.mark.asyncio
+    async def test_prompts_use_compacted_text(self, mock_get_book, mock_fetch_text, monkeypatch):
+        """Test that the summary prompt gets the compacted pages and the savings are reported."""
+        progress = {}
+
+        async def on_progress(stage, details):
+            progress[stage] = details
+
+        backend = FakeBackend("fake")
+        with patch("app.services.llm_service.get_llm_backend", return_value=backend):
+            result = await SummaryPipeline(7, 3, progress=on_progress).run(include_original_text=True)
+            prompt = backend.prompts[-1]
+            assert "Illustration" not in prompt and "[1]" not in prompt and "* *" not in prompt
+            assert "the clocks were striking thirteen. The crew kept their watch" in prompt
+            assert "[Illustration" in result["original_text"]
+            assert progress["pagination"]["compaction_bytes_saved"] > 0
+            assert progress["pagination"]["compaction_tokens_saved"] > 0
+
+            monkeypatch.setattr(summary_pipeline, "PROMPT_COMPACTION_ENABLED", False)
+            pipeline = SummaryPipeline(7, 3, progress=on_progress)
+            await pipeline.run()
+            assert "[Illustration" in pipeline.text_to_summarize()
+            assert "compaction_bytes_saved" not in progress["pagination"]
@@ -0,0 +1,110 @@
+import textwrap
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.services.book_service import BookService
+from app.services.front_matter import (
+    detect_content_start,
+    index_chapters,
+    resolve_content_start,
+    strip_gutenberg_boilerplate,
+)
+
+PROSE = "It was a dark and stormy night; the rain fell in torrents, except at occasional intervals.\n" * 30
+
+GUTENBERG_BOOK = textwrap.dedent("""\
+    The Project Gutenberg eBook of Moby Dick
+
+    *** START OF THE PROJECT GUTENBERG EBOOK MOBY DICK ***
+
+    MOBY DICK
+
+    CONTENTS
+
+    CHAPTER 1. Loomings.
+    CHAPTER 2. The Carpet-Bag.
+    CHAPTER 3. The Spouter-Inn.
+
+
+    CHAPTER 1. Loomings.
+
+    Call me Ishmael. Some years ago, never mind how long precisely, having little money.
+""") + PROSE + textwrap.dedent("""\
+
+    CHAPTER 2. The Carpet-Bag.
+
+""") + PROSE + "\n*** END OF THE PROJECT GUTENBERG EBOOK MOBY DICK ***\nLicense text.\n"
+
+
+class TestFrontMatter:
+    def test_strip_gutenberg_boilerplate(self):
+        """Test that the body lies between the START and END markers."""
+        start, end = strip_gutenberg_boilerplate(GUTENBERG_BOOK)
+        assert GUTENBERG_BOOK[start:end].strip().startswith("MOBY DICK")
+        assert "License" not in GUTENBERG_BOOK[start:end]
+        assert strip_gutenberg_boilerplate("no markers") == (0, len("no markers"))
+
+    def test_skips_table_of_contents(self):
+        """Test that the first chapter heading after the TOC is chosen."""
+        result = detect_content_start(GUTENBERG_BOOK)
+        assert result.method == "first-heading"
+        assert result.confidence >= 0.9
+        assert GUTENBERG_BOOK[result.offset:].startswith("CHAPTER 1. Loomings.\n\nCall me Ishmael")
+
+    def test_roman_numeral_heading(self):
+        """Test a bare roman numeral heading after a preface."""
+        text = "PREFACE\n\nA short note.\n\n\nI\n\n" + PROSE + "\n\nII\n\n" + PROSE
+        result = detect_content_start(text)
+        assert text[result.offset:].startswith("I\n\nIt was a dark")
+
+    def test_low_confidence_without_headings(self):
+        """Test that books without headings fall back to the first prose paragraph."""
+        text = "A TITLE\n\nBy Someone\n\n\n" + PROSE
+        result = detect_content_start(text)
+        assert result.method == "first-prose"
+        assert result.confidence < 0.6
+        assert text[result.offset:].startswith("It was a dark")
+
+    def test_index_chapters_skips_table_of_contents(self):
+        """Test that chapters are the body's headings, not the TOC entries, and end with the body."""
+        chapters, content_end = index_chapters(GUTENBERG_BOOK)
+        assert [title for _, title in chapters] == ["CHAPTER 1. Loomings.", "CHAPTER 2. The Carpet-Bag."]
+        assert GUTENBERG_BOOK[chapters[0][0]:].startswith("CHAPTER 1. Loomings.\n\nCall me Ishmael")
+        assert GUTENBERG_BOOK[content_end:].startswith("*** END OF THE PROJECT GUTENBERG")
+
+    def test_index_chapters_roman_numerals(self):
+        """Test bare roman numeral headings, and that books without headings have no chapters."""
+        text = "PREFACE\n\nA short note.\n\n\nI\n\n" + PROSE + "\n\nII\n\n" + PROSE
+        chapters, _ = index_chapters(text)
+        assert [title for _, title in chapters] == ["I", "II"]
+        assert index_chapters("A TITLE\n\n" + PROSE)[0] == []
+
+    @pytest.mark.asyncio
+    async def test_llm_only_consulted_on_leading_pages_when_unsure(self):
+        """Test that the LLM fallback is skipped when confident and bounded otherwise."""
+        llm = MagicMock()
+        llm.get_page_number = AsyncMock(return_value="Page 2")
+
+        confident_index = BookService.build_page_index(GUTENBERG_BOOK, 500)
+        page, result = await resolve_content_start(GUTENBERG_BOOK, confident_index, llm)
+        assert page == confident_index.page_for_offset(result.offset)
+        llm.get_page_number.assert_not_awaited()
+
+        unsure_text = "A TITLE\n\n\n" + PROSE * 5
+        unsure_index = BookService.build_page_index(unsure_text, 500)
+        page, result = await resolve_content_start(unsure_text, unsure_index, llm, llm_pages=3)
+        assert (page, result.method) == (2, "llm")
+        prompt_text = llm.get_page_number.await_args.args[0]
+        assert "Page 3" in prompt_text and "Page 4" not in prompt_text
+
+    @pytest.mark.asyncio
+    async def test_llm_failure_falls_back_to_detector(self):
+        """Test that an LLM error does not fail the request."""
+        llm = MagicMock()
+        llm.get_page_number = AsyncMock(side_effect=Exception("Ollama down"))
+        text = "A TITLE\n\n\n" + PROSE
+        page_index = BookService.build_page_index(text, 500)
+
+        page, result = await resolve_content_start(text, page_index, llm)
+
+        assert result.method == "first-prose"
+        assert page == 1
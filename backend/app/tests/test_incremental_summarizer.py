@@ -0,0 +1,62 @@
+import pytest
+from app.services.book_service import BookService
+from app.services.incremental_summarizer import IncrementalSummarizer
+from app.services.summary_cache import SummaryCache, SummaryKey
+
+BOOK_TEXT = "".join(f"Page marker {i:03d}. " + "Words of the story. " * 20 + "\n\n" for i in range(200))
+
+
+class FakeLLM:
+    """Records the text sent in each call instead of calling Ollama"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def summarize_text(self, text):
+        self.calls.append(("summarize", text))
+        return f"summary of {len(text)} chars"
+
+    async def update_summary(self, previous_summary, text):
+        self.calls.append(("update", text))
+        return f"{previous_summary} + {len(text)} chars"
+
+
+def make_key(page_number):
+    return SummaryKey(1, 3, page_number, "llama2", "v1", 500, "ab12", "incremental")
+
+
+class TestIncrementalSummarizer:
+    @pytest.mark.asyncio
+    async def test_later_pages_reuse_stored_segments(self, tmp_path):
+        """Test that moving forward only summarizes the pages after the last checkpoint."""
+        page_index = BookService.build_page_index(BOOK_TEXT, 500)
+        cache = SummaryCache(str(tmp_path / "s.sqlite3"))
+        llm = FakeLLM()
+        summarizer = IncrementalSummarizer(llm, cache, segment_pages=10)
+
+        await summarizer.summarize(make_key(25), BOOK_TEXT, page_index)
+        # Pages 3-12, 13-22 and the partial tail 23-25
+        assert [kind for kind, _ in llm.calls] == ["summarize", "update", "update"]
+        assert llm.calls[0][1] == page_index.extract(BOOK_TEXT, 3, 12)
+        assert llm.calls[2][1] == page_index.extract(BOOK_TEXT, 23, 25)
+
+        llm.calls.clear()
+        await summarizer.summarize(make_key(35), BOOK_TEXT, page_index)
+        # Resumes from the page 22 checkpoint: 23-32 then 33-35
+        assert [text for _, text in llm.calls] == [
+            page_index.extract(BOOK_TEXT, 23, 32),
+            page_index.extract(BOOK_TEXT, 33, 35),
+        ]
+        assert all(kind == "update" for kind, _ in llm.calls)
+
+        assert cache.get_latest_segment(make_key(35), 10)[0] == 32
+
+    @pytest.mark.asyncio
+    async def test_works_without_cache(self):
+        """Test that the summarizer still covers the whole range with no cache."""
+        page_index = BookService.build_page_index(BOOK_TEXT, 500)
+        llm = FakeLLM()
+
+        await IncrementalSummarizer(llm, None, segment_pages=10).summarize(make_key(14), BOOK_TEXT, page_index)
+
+        assert "".join(text for _, text in llm.calls) == page_index.extract(BOOK_TEXT, 3, 14)
@@ -0,0 +1,161 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import job_queue, metrics
+from app.services.job_queue import JobQueueFullError, SummaryJobQueue
+from app.services.llm_backends import FakeBackend
+
+
+class SlowRunner:
+    """Stand-in pipeline that records how many jobs hold a model slot at once"""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = 0
+        self.in_llm = 0
+        self.max_in_llm = 0
+
+    async def __call__(self, job, llm_slot):
+        self.calls += 1
+        job.stage = "pagination"
+        async with llm_slot:
+            self.in_llm += 1
+            self.max_in_llm = max(self.max_in_llm, self.in_llm)
+            await asyncio.sleep(self.delay)
+            self.in_llm -= 1
+        if job.key[1] < 0:
+            raise ValueError("bad page")
+        return {"summary": f"summary of {job.key[1]}"}
+
+
+async def wait_finished(jobs, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not all(job.finished for job in jobs):
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+class TestSummaryJobQueue:
+    @pytest.mark.asyncio
+    async def test_identical_requests_share_a_job(self):
+        runner = SlowRunner()
+        queue = SummaryJobQueue(workers=2, runner=runner)
+        first, created = queue.submit(1, 10)
+        second, second_created = queue.submit(1, 10)
+        other, _ = queue.submit(1, 10, mode="incremental")
+
+        assert created and not second_created
+        assert second is first
+        assert other is not first
+        await wait_finished([first, other])
+        assert runner.calls == 2
+        assert first.status == "done"
+        assert first.result == {"summary": "summary of 10"}
+        assert queue.stats["deduplicated"] == 1
+
+        # Once finished, the same request runs again (the summary cache makes that cheap)
+        again, created = queue.submit(1, 10)
+        assert created and again is not first
+        await queue.close()
+
+    @pytest.mark.asyncio
+    async def test_model_concurrency_limit(self):
+        runner = SlowRunner()
+        queue = SummaryJobQueue(workers=8, model_concurrency=2, runner=runner)
+        jobs = [queue.submit(1, page)[0] for page in range(1, 7)]
+        jobs.append(queue.submit(1, 1, model="other-model")[0])
+        await wait_finished(jobs)
+
+        # Two slots for the default model plus one for the other model
+        assert runner.max_in_llm == 3
+        assert all(job.status == "done" for job in jobs)
+        await queue.close()
+
+    @pytest.mark.asyncio
+    async def test_default_model_is_the_served_one(self):
+        """Test that jobs without a model use the slot of the models the LLM backend serves."""
+        queue = SummaryJobQueue(workers=1, runner=SlowRunner(delay=0))
+        with patch.object(job_queue, "get_llm_backend", return_value=FakeBackend("llama3,mistral")):
+            job, _ = queue.submit(1, 10)
+        assert job.model == "llama3,mistral"
+        await wait_finished([job])
+        await queue.close()
+
+    @pytest.mark.asyncio
+    async def test_jobs_do_not_record_into_the_submitting_request(self):
+        """Test that workers started from a request do not add the jobs' timings to that request."""
+        async def runner(job, llm_slot):
+            metrics.record_stage("summary", 0.01)
+            metrics.record_size("bytes", 100)
+            return {"summary": "done"}
+
+        queue = SummaryJobQueue(workers=2, runner=runner)
+        timings = metrics.RequestTimings()
+        token = metrics._current.set(timings)
+        try:
+            jobs = [queue.submit(1, page)[0] for page in range(1, 6)]
+        finally:
+            metrics._current.reset(token)
+        await wait_finished(jobs)
+        assert all(job.status == "done" for job in jobs)
+        assert timings.stages == [] and timings.counts == {}
+        await queue.close()
+
+    @pytest.mark.asyncio
+    async def test_failed_job_reports_error(self):
+        queue = SummaryJobQueue(workers=1, runner=SlowRunner(delay=0))
+        job, _ = queue.submit(1, -1)
+        await wait_finished([job])
+        assert job.status == "failed"
+        assert "bad page" in job.error
+        assert job.finished_at >= job.started_at
+        await queue.close()
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_and_finished_jobs_are_dropped(self):
+        queue = SummaryJobQueue(workers=1, max_queued=2, max_finished=1, runner=SlowRunner(delay=0.02))
+        jobs = [queue.submit(1, page)[0] for page in (1, 2)]
+        with pytest.raises(JobQueueFullError):
+            queue.submit(1, 3)
+        await wait_finished(jobs)
+        assert queue.get(jobs[0].id) is None
+        assert queue.get(jobs[1].id) is jobs[1]
+        await queue.close()
+
+
+BOOK = {
+    "id": 7,
+    "title": "Queued Book",
+    "authors": [{"name": "Test Author"}],
+    "formats": {"text/plain": "http://example.com/7.txt"},
+}
+BOOK_TEXT = "CHAPTER 1. The Start\n\n" + "It was a dark and stormy night, and the rain fell in torrents.\n" * 200
+
+
+@patch("app.services.summary_pipeline.LLMService.summarize_text", new_callable=AsyncMock, return_value="Queued summary")
+@patch("app.services.summary_pipeline.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(BOOK_TEXT, None))
+@patch("app.services.summary_pipeline.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+def test_submit_and_poll_summary_job(mock_book, mock_text, mock_summarize, monkeypatch):
+    """Test that a job is accepted right away and its result can be polled."""
+    monkeypatch.setattr(job_queue, "_job_queue", SummaryJobQueue(workers=2))
+    with TestClient(app) as client:
+        response = client.post("/api/summarize/jobs", json={"book_id": 7, "page_number": 3})
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running", "done")
+
+        deadline = time.monotonic() + 5
+        while job["status"] not in ("done", "failed"):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+            job = client.get(f"/api/summarize/jobs/{job['job_id']}").json()
+
+        assert job["status"] == "done"
+        assert job["result"]["summary"] == "Queued summary"
+        assert job["result"]["book_title"] == "Queued Book"
+        assert [step["stage"] for step in job["progress"]] == ["metadata", "download", "pagination", "front_matter", "summary"]
+
+        assert client.get("/api/summarize/jobs/unknown").status_code == 404
@@ -0,0 +1,165 @@
+import os
+import pickle
+import subprocess
+import sys
+import textwrap
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.book_service import BookService
+from app.services.book_text import MappedText, download_text
+from app.services.llm_backends import FakeBackend
+from app.services.summary_pipeline import SummaryPipeline
+
+BOOK_TEXT = (
+    "CHAPTER 1. Café\n\nThe naïve captain — an old hand — watched the sea.\n\n"
+    + "Ships sailed past the pier. Nobody spoke of the whale. " * 400
+    + "\n\nCHAPTER 2. Ça va\n\n"
+    + "Le bateau était déjà loin. « Adieu », dit-il. " * 400
+)
+
+
+def mapped(tmp_path, text: str = BOOK_TEXT, charset: str = "utf-8") -> MappedText:
+    path = tmp_path / "book.txt"
+    path.write_bytes(text.encode(charset))
+    return MappedText.open(str(path), charset)
+
+
+class TestMappedText:
+    def test_matches_decoded_text(self, tmp_path):
+        """Test that a mapped UTF-8 text has the offsets, slices and searches of the decoded str."""
+        with mapped(tmp_path) as text:
+            assert len(text) == len(BOOK_TEXT)
+            for start, end in [(0, 20), (10, 5000), (len(BOOK_TEXT) - 100, None), (-50, -10)]:
+                assert text[start:end] == BOOK_TEXT[start:end]
+            assert text[15] == BOOK_TEXT[15]
+            for sub in ["CHAPTER 2", "«", "whale", "missing"]:
+                assert text.find(sub) == BOOK_TEXT.find(sub)
+                assert text.rfind(sub, 0, 20000) == BOOK_TEXT.rfind(sub, 0, 20000)
+            assert list(BookService.iter_page_bounds(text, 500)) == list(BookService.iter_page_bounds(BOOK_TEXT, 500))
+
+    def test_single_byte_charset_and_pickling(self, tmp_path):
+        """Test Latin-1 texts and that pickling reopens the file instead of copying the text."""
+        latin = "Déjà vu. " * 100
+        with mapped(tmp_path, latin, "latin-1") as text:
+            assert text[:] == latin
+            copy = pickle.loads(pickle.dumps(text))
+            assert isinstance(copy, MappedText) and copy[5:20] == latin[5:20]
+            copy.close()
+
+    @pytest.mark.asyncio
+    async def test_download_spills_to_disk(self):
+        """Test that downloads over the memory limit are mapped from a temporary file."""
+        body = BOOK_TEXT.encode("utf-8")
+
+        def handler(request):
+            return httpx.Response(200, content=body, headers={"Content-Type": "text/plain; charset=utf-8"})
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            small, size = await download_text(client, "http://example.com/1.txt", memory_limit=len(body))
+            assert small == BOOK_TEXT and size == len(body)
+            large, _ = await download_text(client, "http://example.com/1.txt", memory_limit=1024)
+            with large:
+                assert isinstance(large, MappedText) and large[:] == BOOK_TEXT
+
+
+class TestPipelineTexts:
+    @pytest.mark.asyncio
+    async def test_run_closes_mapped_texts(self):
+        """Test that the memory-mapped book and compacted texts are closed once the pipeline has run."""
+        book = {"id": 1, "title": "Large", "authors": [{"name": "A"}], "formats": {"text/plain": "http://example.com/1.txt"}}
+        gutenberg = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, text=BOOK_TEXT, headers={"Content-Type": "text/plain; charset=utf-8"})
+        ))
+        opened = []
+        open_mapped = MappedText.open
+
+        def record_open(path, charset="utf-8"):
+            opened.append(open_mapped(path, charset))
+            return opened[-1]
+
+        with patch("app.services.book_service.get_gutenberg_client", return_value=gutenberg), \
+                patch("app.services.book_service.BookService.get_book_by_id", new_callable=AsyncMock, return_value=book), \
+                patch("app.services.llm_service.get_llm_backend", return_value=FakeBackend("fake")), \
+                patch("app.services.book_service.REQUEST_MEMORY_LIMIT_BYTES", 1024), \
+                patch("app.services.text_cache.REQUEST_MEMORY_LIMIT_BYTES", 1024), \
+                patch("app.services.summary_pipeline.PROMPT_COMPACTION_ENABLED", True), \
+                patch.object(MappedText, "open", side_effect=record_open):
+            pipeline = SummaryPipeline(1, 3)
+            result = await pipeline.run()
+
+        assert result["summary"]
+        assert pipeline.book_text in opened and pipeline.prompt_text in opened
+        assert all(text.data.closed and text._file.closed for text in opened)
+
+
+# Run in a fresh interpreter so the traced peak belongs to this scenario alone
+PEAK_SCRIPT = textwrap.dedent('''
+    import asyncio, os, sys, tracemalloc
+    from unittest.mock import patch
+    import httpx
+    from app.services import summary_cache, text_cache
+    from app.services.llm_backends import FakeBackend
+    from app.services.summary_pipeline import SummaryPipeline
+
+    BOOK_SIZE = 100 * 1024 * 1024
+    PARAGRAPH = ("The crew of the Pequod kept their watch on deck. Caf\\u00e9 talk was rare. " * 20 + "\\n\\n").encode("utf-8")
+
+    def write_book(path):
+        with open(path, "wb") as f:
+            f.write(b"*** START OF THE PROJECT GUTENBERG EBOOK ***\\n\\n\\nCHAPTER 1. Loomings\\n\\n")
+            written, chapter = 0, 1
+            while written < BOOK_SIZE:
+                if written // (5 * 1024 * 1024) >= chapter:
+                    chapter += 1
+                    f.write(f"\\n\\nCHAPTER {chapter}.\\n\\n".encode())
+                f.write(PARAGRAPH)
+                written += len(PARAGRAPH)
+
+    class FileStream(httpx.AsyncByteStream):
+        def __init__(self, path):
+            self.path = path
+
+        async def __aiter__(self):
+            with open(self.path, "rb") as f:
+                while chunk := f.read(1024 * 1024):
+                    yield chunk
+
+    async def main(cache_dir, book_path):
+        def handler(request):
+            return httpx.Response(200, stream=FileStream(book_path), headers={"Content-Type": "text/plain; charset=utf-8"})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        book = {"id": 1, "title": "Large", "authors": [{"name": "A"}], "formats": {"text/plain": "http://example.com/1.txt"}}
+        with patch.object(text_cache, "_text_cache", text_cache.TextCache(os.path.join(cache_dir, "texts"))), \\
+                patch.object(summary_cache, "_summary_cache", summary_cache.SummaryCache(os.path.join(cache_dir, "s.sqlite3"))), \\
+                patch("app.services.book_service.get_gutenberg_client", return_value=client), \\
+                patch("app.services.book_service.BookService.get_book_by_id", return_value=book), \\
+                patch("app.services.llm_service.get_llm_backend", return_value=FakeBackend("llama2")):
+            tracemalloc.start()
+            result = await SummaryPipeline(1, 400, mode="map_reduce").run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        assert result["summary"]
+        print(peak // (1024 * 1024))
+
+    cache_dir = sys.argv[1]
+    book_path = os.path.join(cache_dir, "book.txt")
+    write_book(book_path)
+    asyncio.run(main(cache_dir, book_path))
+''')
+
+
+class TestLargeTextMemory:
+    def test_peak_memory_bounded_for_100mb_book(self, tmp_path):
+        """Test that summarizing a 100MB book allocates far less than the book's size at any one time."""
+        backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        result = subprocess.run(
+            [sys.executable, "-c", PEAK_SCRIPT, str(tmp_path)],
+            cwd=backend_dir, capture_output=True, text=True, timeout=600,
+        )
+        assert result.returncode == 0, result.stderr
+        # Traced allocations leave out the mapped pages, which the kernel may drop at any time,
+        # so unlike RSS the peak does not depend on memory pressure or the allocator
+        peak_mb = int(result.stdout.split()[-1])
+        assert peak_mb < 64, f"allocations peaked at {peak_mb}MB"
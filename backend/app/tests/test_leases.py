@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+from app.services.leases import LeaseStore
+
+
+class TestLeaseStore:
+    def test_acquire_release_and_expiry(self, tmp_path):
+        """Test that a lease has one owner at a time and expires unless renewed."""
+        store = LeaseStore(str(tmp_path / "leases.sqlite3"), lease_seconds=60)
+        assert store.acquire("summary:1", "a")
+        assert not store.acquire("summary:1", "b")
+        assert store.acquire("summary:2", "b")
+        store.release("summary:1", "b")
+        assert store.is_held("summary:1")
+        store.release("summary:1", "a")
+        assert not store.is_held("summary:1")
+
+        expiring = LeaseStore(str(tmp_path / "leases.sqlite3"), lease_seconds=-1)
+        assert expiring.acquire("summary:3", "dead worker")
+        assert expiring.acquire("summary:3", "b")
+        assert expiring.stats["expired"] == 1
+        assert not expiring.renew("summary:3", "dead worker")
+
+    @pytest.mark.asyncio
+    async def test_single_flight_computes_once(self, tmp_path):
+        """Test that concurrent callers wait for one computation, and take over after a failure."""
+        store = LeaseStore(str(tmp_path / "leases.sqlite3"), poll_interval=0.01)
+        cache = {}
+        calls = []
+
+        async def check():
+            return cache.get("key")
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            if len(calls) == 1:
+                raise RuntimeError("LLM unavailable")
+            cache["key"] = "summary"
+            return "summary"
+
+        async def request():
+            try:
+                return await store.single_flight("summary:key", check, compute)
+            except RuntimeError:
+                return None
+
+        results = await asyncio.gather(*(request() for _ in range(5)))
+        assert results.count(None) == 1
+        assert results.count(("summary", True)) == 1
+        assert results.count(("summary", False)) == 3
+        assert len(calls) == 2
+        assert not store.is_held("summary:key")
+
+
+# One worker process: runs every request at once against the shared CACHE_DIR
+WORKER_SCRIPT = textwrap.dedent('''
+    import asyncio, json, os, sys, time
+    cache_dir, worker, workers = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    os.environ["CACHE_DIR"] = cache_dir
+    from unittest.mock import patch
+    import httpx
+    from app.services.llm_backends import FakeBackend
+    from app.services.summary_pipeline import SummaryPipeline
+
+    PROSE = "The crew kept their watch on deck while the ship ran before the wind.\\n" * 40
+    REQUESTS = [(book_id, page) for book_id in (1, 2) for page in (2, 4)]
+    CHAPTERS = (1, 2)
+    downloads = []
+
+    async def handler(request):
+        downloads.append(str(request.url))
+        await asyncio.sleep(0.2)
+        book_id = request.url.path.strip("/").split(".")[0]
+        text = f"*** START OF THE PROJECT GUTENBERG EBOOK {book_id} ***\\n\\n" + "".join(
+            f"CHAPTER {n}.\\n\\n{PROSE}\\n\\n" for n in range(1, 4)
+        )
+        return httpx.Response(200, text=text, headers={"Content-Type": "text/plain; charset=utf-8"})
+
+    async def get_book(book_id):
+        return {"id": book_id, "title": f"Book {book_id}", "authors": [{"name": "A"}],
+                "formats": {"text/plain; charset=utf-8": f"http://example.com/{book_id}.txt"}}
+
+    async def main():
+        backend = FakeBackend("llama2", latency=0.2)
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch("app.services.book_service.get_gutenberg_client", return_value=client), \\
+                patch("app.services.book_service.BookService.get_book_by_id", side_effect=get_book), \\
+                patch("app.services.llm_service.get_llm_backend", return_value=backend):
+            # Start together so the workers race for the same work
+            open(os.path.join(cache_dir, f"ready-{worker}"), "w").close()
+            while sum(name.startswith("ready-") for name in os.listdir(cache_dir)) < workers:
+                time.sleep(0.01)
+            results = await asyncio.gather(
+                *(SummaryPipeline(book_id, page).run() for book_id, page in REQUESTS),
+                SummaryPipeline(1, None, chapters=CHAPTERS).run(),
+            )
+        summaries = [prompt for prompt in backend.prompts if "first page of important text" not in prompt]
+        print(json.dumps({
+            "downloads": len(downloads),
+            "summaries": len(summaries),
+            "results": {
+                **{f"{book_id}-{page}": result["summary"] for (book_id, page), result in zip(REQUESTS, results)},
+                "1-chapters": results[-1]["summary"],
+            },
+        }))
+
+    asyncio.run(main())
+''')
+
+
+class TestMultiWorker:
+    def test_each_summary_is_computed_once_across_workers(self, tmp_path):
+        """Test that workers sharing CACHE_DIR download each book and generate each page and chapter summary once."""
+        backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        workers = 4
+        processes = [
+            subprocess.Popen(
+                [sys.executable, "-c", WORKER_SCRIPT, str(tmp_path), str(worker), str(workers)],
+                cwd=backend_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            )
+            for worker in range(workers)
+        ]
+        outputs = []
+        for process in processes:
+            stdout, stderr = process.communicate(timeout=120)
+            assert process.returncode == 0, stderr
+            outputs.append(json.loads(stdout.splitlines()[-1]))
+
+        # Two books, two pages each, plus chapters 1 and 2 of the first book and their combination
+        assert sum(output["downloads"] for output in outputs) == 2
+        assert sum(output["summaries"] for output in outputs) == 4 + 3
+        # Every worker answered every request with the one generated summary
+        assert all(output["results"] == outputs[0]["results"] for output in outputs)
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import httpx
+import pytest
+from unittest.mock import patch
+from app.services import http_clients
+from app.services.llm_backends import (
+    AIMDLimiter,
+    FakeBackend,
+    LLMBackendError,
+    OllamaBackend,
+    OpenAICompatibleBackend,
+    ReplicaPool,
+    _pair_replicas,
+)
+from app.services.llm_service import LLMService
+
+
+class FlakyOllama:
+    """Local stand-in for Ollama replicas; the first calls to "busy" return 503"""
+
+    def __init__(self, busy_failures: int = 1, status_code: int = 503):
+        self.busy_failures = busy_failures
+        self.status_code = status_code
+        self.hosts = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.hosts.append(request.url.host)
+        if request.url.host == "busy" and self.busy_failures > 0:
+            self.busy_failures -= 1
+            return httpx.Response(self.status_code, text="server busy")
+        return httpx.Response(200, json={"response": f"from {request.url.host}", "prompt_eval_count": 5, "eval_count": 2})
+
+
+def pool(replicas, **kwargs):
+    kwargs.setdefault("retry_base_delay", 0)
+    return ReplicaPool(replicas, **kwargs)
+
+
+class TestReplicaPool:
+    @pytest.mark.asyncio
+    async def test_retries_overloaded_replica_on_another(self):
+        """Test that a 503 is retried on the other replica and backs off the limiter."""
+        fake = FlakyOllama()
+        llm_pool = pool([OllamaBackend("http://busy", "llama2"), OllamaBackend("http://idle", "llama2")])
+        llm_pool._round_robin = iter([0] * 10)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)) as client:
+            with patch("app.services.llm_backends.get_ollama_client", return_value=client):
+                result = await llm_pool.generate("prompt", "system", 10, 0.7)
+
+        assert fake.hosts == ["busy", "idle"]
+        assert result == {"response": "from idle", "prompt_tokens": 5, "completion_tokens": 2}
+        assert llm_pool.limiters[0].limit < llm_pool.limiters[1].limit
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self):
+        """Test that a 4xx other than 429 fails right away."""
+        fake = FlakyOllama(status_code=404)
+        llm_pool = pool([OllamaBackend("http://busy", "llama2")])
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)) as client:
+            with patch("app.services.llm_backends.get_ollama_client", return_value=client):
+                with pytest.raises(LLMBackendError, match="404"):
+                    await llm_pool.generate("prompt", "system", 10, 0.7)
+
+        assert fake.hosts == ["busy"]
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_retries(self):
+        fake = FlakyOllama(busy_failures=10)
+        llm_pool = pool([OllamaBackend("http://busy", "llama2")], max_retries=2)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)) as client:
+            with patch("app.services.llm_backends.get_ollama_client", return_value=client):
+                with pytest.raises(LLMBackendError, match="503"):
+                    await llm_pool.generate("prompt", "system", 10, 0.7)
+
+        assert len(fake.hosts) == 3
+
+    @pytest.mark.asyncio
+    async def test_balances_across_replicas(self):
+        replicas = [FakeBackend(latency=0.01), FakeBackend(latency=0.01)]
+        llm_pool = pool(replicas, batch_size=1)
+
+        await asyncio.gather(*(llm_pool.generate(f"prompt {i}", "system", 10, 0.7) for i in range(8)))
+
+        assert [len(replica.prompts) for replica in replicas] == [4, 4]
+
+    @pytest.mark.asyncio
+    async def test_small_prompts_are_batched(self):
+        """Test that concurrent small prompts go out as one batch and large ones alone."""
+        fake = FakeBackend()
+        llm_pool = pool([fake], batch_size=4, batch_max_prompt_tokens=100)
+
+        results = await asyncio.gather(*(llm_pool.generate(f"prompt {i}", "system", 10, 0.7) for i in range(6)))
+        await llm_pool.generate("word " * 500, "system", 10, 0.7)
+
+        assert fake.batches == [4, 2]
+        assert len(fake.prompts) == 7
+        assert results[0] == await FakeBackend().generate("prompt 0", "system", 10, 0.7)
+
+    @pytest.mark.asyncio
+    async def test_llm_service_with_fake_backend(self):
+        service = LLMService(FakeBackend())
+        assert await service.get_page_number("some pages") == "Page 1"
+        summary = await service.summarize_text("text")
+        assert summary == await service.summarize_text("text")
+        assert "".join([piece async for piece in service.stream_summary("text")]).strip() == summary
+
+
+class TestAIMDLimiter:
+    @pytest.mark.asyncio
+    async def test_additive_increase_multiplicative_decrease(self):
+        now = [0.0]
+        limiter = AIMDLimiter(initial=4, minimum=1, maximum=5, latency_target=1.0, clock=lambda: now[0])
+        for _ in range(8):
+            await limiter.acquire()
+            await limiter.release(0.1)
+        assert 4.9 < limiter.limit <= 5
+
+        await limiter.acquire()
+        await limiter.release(None, overloaded=True)
+        assert limiter.limit == pytest.approx(2.5)
+
+        now[0] += 1.0
+        await limiter.acquire()
+        await limiter.release(5.0)
+        assert limiter.limit == pytest.approx(1.25)
+        for _ in range(3):
+            now[0] += 1.0
+            await limiter.acquire()
+            await limiter.release(None, overloaded=True)
+        assert limiter.limit == 1
+
+    @pytest.mark.asyncio
+    async def test_one_decrease_per_latency_target(self):
+        """Test that the calls in flight during one slowdown decrease the limit once."""
+        now = [0.0]
+        limiter = AIMDLimiter(initial=32, minimum=1, maximum=32, latency_target=1.0, clock=lambda: now[0])
+        for _ in range(32):
+            await limiter.acquire()
+        for _ in range(32):
+            now[0] += 0.01
+            await limiter.release(5.0)
+        assert limiter.limit == pytest.approx(16)
+
+        now[0] += 1.0
+        await limiter.acquire()
+        await limiter.release(None, overloaded=True)
+        assert limiter.limit == pytest.approx(8)
+
+    @pytest.mark.asyncio
+    async def test_acquire_waits_for_a_free_slot(self):
+        limiter = AIMDLimiter(initial=1, minimum=1, maximum=1, latency_target=1.0)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await limiter.release(0.1)
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_flight == 1
+
+
+class TestOpenAICompatibleBackend:
+    @staticmethod
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        assert request.headers["Authorization"] == "Bearer secret"
+        if request.url.path == "/v1/completions":
+            choices = [{"index": i, "text": f"answer {i}"} for i in reversed(range(len(payload["prompt"])))]
+            return httpx.Response(200, json={"choices": choices})
+        if payload.get("stream"):
+            lines = [f"data: {json.dumps({'choices': [{'delta': {'content': piece}}]})}" for piece in ("Key ", "points")]
+            return httpx.Response(200, text="\n\n".join(lines + ["data: [DONE]"]) + "\n\n")
+        assert payload["messages"][0]["role"] == "system"
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "chat answer"}}],
+            "usage": {"prompt_tokens": 7, "completion_tokens": 2},
+        })
+
+    @pytest.mark.asyncio
+    async def test_chat_stream_and_batch(self):
+        backend = OpenAICompatibleBackend("http://llama-cpp:8080/", "local", api_key="secret")
+        async with httpx.AsyncClient(transport=httpx.MockTransport(self.handler)) as client:
+            with patch("app.services.llm_backends.get_ollama_client", return_value=client):
+                result = await backend.generate("prompt", "system", 10, 0.7)
+                pieces = [piece async for piece in backend.stream("prompt", "system", 10, 0.7)]
+                batch = await backend.generate_batch(["a", "b", "c"], "system", 10, 0.7)
+
+        assert result == {"response": "chat answer", "prompt_tokens": 7, "completion_tokens": 2}
+        assert pieces == ["Key ", "points"]
+        assert [item["response"] for item in batch] == ["answer 0", "answer 1", "answer 2"]
+
+
+def test_pair_replicas():
+    assert _pair_replicas(["a", "b"], ["m"]) == [("a", "m"), ("b", "m")]
+    assert _pair_replicas(["a"], ["m", "n"]) == [("a", "m"), ("a", "n")]
+    assert _pair_replicas(["a", "b"], ["m", "n"]) == [("a", "m"), ("b", "n")]
+    with pytest.raises(ValueError):
+        _pair_replicas(["a", "b", "c"], ["m", "n"])
+
+
+def test_llm_client_fits_every_replica_limit(monkeypatch):
+    """Test that the LLM client pool holds LLM_CONCURRENCY_MAX connections per replica."""
+    monkeypatch.setattr(http_clients, "LLM_BACKEND", "ollama")
+    monkeypatch.setattr(http_clients, "LLM_MODELS", ["llama2"])
+    monkeypatch.setattr(http_clients, "OLLAMA_HOSTS", ["http://a:11434", "http://b:11434", "http://c:11434"])
+    monkeypatch.setattr(http_clients, "LLM_CONCURRENCY_MAX", 32)
+    assert http_clients._llm_limits().max_connections == 96
@@ -0,0 +1,35 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from app.services.llm_service import LLMService
+
+class TestLLMService:
+    @pytest.mark.asyncio
+    @patch("httpx.AsyncClient.post")
+    async def test_summarize_text(self, mock_post):
+        """Test that summaries are requested through the shared async client."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.raise_for_status = MagicMock()
+        mock_response.json.return_value = {"response": "A short summary."}
+        mock_post.return_value = mock_response
+
+        result = await LLMService().summarize_text("Some book text")
+
+        assert result == "A short summary."
+        mock_post.assert_called_once()
+        args, kwargs = mock_post.call_args
+        assert args[0].endswith("/api/generate")
+        assert kwargs["json"]["stream"] is False
+        assert "Some book text" in kwargs["json"]["prompt"]
+
+    @pytest.mark.asyncio
+    @patch("httpx.AsyncClient.post")
+    async def test_get_page_number_error(self, mock_post):
+        """Test that Ollama error responses are surfaced as exceptions."""
+        mock_response = MagicMock()
+        mock_response.status_code = 500
+        mock_response.text = "model not found"
+        mock_post.return_value = mock_response
+
+        with pytest.raises(Exception, match="model not found"):
+            await LLMService().get_page_number("Page 1\n\nSome text")
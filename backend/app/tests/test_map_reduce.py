@@ -0,0 +1,79 @@
+import asyncio
+import json
+import httpx
+import pytest
+from unittest.mock import patch
+from app.services.book_service import BookService
+from app.services.llm_service import LLMService
+from app.services.map_reduce import MapReduceSummarizer, estimate_tokens
+
+BOOK_TEXT = "".join(f"Chapter event {i}. " + "The crew sailed on. " * 30 + "\n\n" for i in range(120))
+
+
+class FakeOllama:
+    """Local stand-in for Ollama's /api/generate that tracks concurrent calls"""
+
+    def __init__(self):
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        self.prompts.append(payload["prompt"])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return httpx.Response(200, json={
+            "response": f"summary {len(self.prompts)}",
+            "prompt_eval_count": len(payload["prompt"]) // 4,
+            "eval_count": 3,
+        })
+
+
+class TestMapReduceSummarizer:
+    def test_chunks_respect_token_budget(self):
+        """Test that chunks are whole pages within the budget and cover the range exactly."""
+        page_index = BookService.build_page_index(BOOK_TEXT, 600)
+        summarizer = MapReduceSummarizer(LLMService(), chunk_tokens=400)
+
+        chunks = summarizer.chunk_pages(BOOK_TEXT, page_index, 2, 40)
+
+        assert "".join(chunks) == page_index.extract(BOOK_TEXT, 2, 40)
+        assert all(estimate_tokens(chunk) <= 400 for chunk in chunks)
+        assert len(chunks) > 1
+
+    @pytest.mark.asyncio
+    async def test_map_reduce_against_fake_ollama(self):
+        """Test bounded parallel map calls followed by recursive reduction to one summary."""
+        fake = FakeOllama()
+        page_index = BookService.build_page_index(BOOK_TEXT, 600)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)) as client:
+            with patch("app.services.llm_backends.get_ollama_client", return_value=client):
+                summarizer = MapReduceSummarizer(LLMService(), chunk_tokens=400, max_concurrency=3)
+                chunks = summarizer.chunk_pages(BOOK_TEXT, page_index, 1, len(page_index))
+                summary, stages = await summarizer.summarize(BOOK_TEXT, page_index, 1, len(page_index))
+
+        assert summary == f"summary {len(fake.prompts)}"
+        assert fake.max_in_flight == 3
+        assert stages[0]["stage"] == "map"
+        assert stages[0]["calls"] == len(chunks)
+        assert stages[-1]["calls"] == 1
+        assert sum(stage["calls"] for stage in stages) == len(fake.prompts)
+        assert all(stage["completion_tokens"] == 3 * stage["calls"] for stage in stages)
+        assert all(len(prompt) // 4 <= 400 + 200 for prompt in fake.prompts)
+
+    @pytest.mark.asyncio
+    async def test_short_range_uses_single_call(self):
+        """Test that a range that fits the budget is summarized in one call."""
+        fake = FakeOllama()
+        page_index = BookService.build_page_index(BOOK_TEXT, 600)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)) as client:
+            with patch("app.services.llm_backends.get_ollama_client", return_value=client):
+                _, stages = await MapReduceSummarizer(LLMService(), chunk_tokens=4000).summarize(BOOK_TEXT, page_index, 1, 3)
+
+        assert len(fake.prompts) == 1
+        assert [stage["stage"] for stage in stages] == ["map"]
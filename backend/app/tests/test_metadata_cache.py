@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock
+from app.services.book_service import BookService
+from app.services.metadata_cache import AsyncTTLCache
+
+class TestAsyncTTLCache:
+    @pytest.mark.asyncio
+    async def test_concurrent_loads_are_coalesced(self):
+        """Test that N concurrent misses for one key run the loader once."""
+        cache = AsyncTTLCache(max_entries=10, ttl=60)
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"id": 1}
+
+        results = await asyncio.gather(*(cache.get_or_load(("book", 1), load) for _ in range(10)))
+
+        assert calls == 1
+        assert all(result == {"id": 1} for result in results)
+        assert cache.stats == {"hits": 0, "misses": 1, "coalesced": 9, "evictions": 0}
+        assert await cache.get_or_load(("book", 1), load) == {"id": 1}
+        assert cache.stats["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failures_are_not_cached(self):
+        """Test that a failed load propagates to all waiters and is retried later."""
+        cache = AsyncTTLCache(max_entries=10, ttl=60)
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("gutendex unavailable")
+
+        results = await asyncio.gather(*(cache.get_or_load("k", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+        async def succeed():
+            return "ok"
+
+        assert await cache.get_or_load("k", succeed) == "ok"
+
+    def test_ttl_and_lru_eviction(self):
+        """Test expiry and least-recently-used eviction."""
+        cache = AsyncTTLCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats["evictions"] == 1
+
+        expired = AsyncTTLCache(max_entries=2, ttl=0)
+        expired.set("a", 1)
+        assert expired.get("a") is None
+
+    @pytest.mark.asyncio
+    @patch("httpx.AsyncClient.get")
+    async def test_book_lookups_are_cached(self, mock_get):
+        """Test that repeated get_book_by_id calls hit gutendex once."""
+        mock_response = MagicMock()
+        mock_response.raise_for_status = MagicMock()
+        mock_response.json.return_value = {"id": 7, "title": "Cached Book"}
+        mock_get.return_value = mock_response
+
+        for _ in range(3):
+            result = await BookService.get_book_by_id(7)
+
+        assert result["title"] == "Cached Book"
+        mock_get.assert_called_once()
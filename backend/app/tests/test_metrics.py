@@ -0,0 +1,81 @@
+import re
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.routes import router
+from app.main import app
+from app.services.llm_backends import FakeBackend
+from app.services.metrics import Histogram, MetricsMiddleware, RequestTimings, _current, record_stage, timed
+
+BOOK = {
+    "id": 21,
+    "title": "Timed Book",
+    "authors": [{"name": "Test Author"}],
+    "formats": {"text/plain": "http://example.com/21.txt"},
+}
+BOOK_TEXT = "CHAPTER 1. The Start\n\n" + "It was a dark and stormy night, and the rain fell in torrents.\n" * 200
+
+
+class TestHistogram:
+    def test_render_is_cumulative(self):
+        histogram = Histogram("test_seconds", "Test histogram", ("stage",), buckets=(0.1, 1))
+        histogram.observe(0.05, "a")
+        histogram.observe(0.5, "a")
+        histogram.observe(5, "a")
+        lines = list(histogram.render())
+
+        assert lines[:2] == ["# HELP test_seconds Test histogram", "# TYPE test_seconds histogram"]
+        assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+        assert 'test_seconds_bucket{stage="a",le="1"} 2' in lines
+        assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+        assert 'test_seconds_sum{stage="a"} 5.55' in lines
+        assert 'test_seconds_count{stage="a"} 3' in lines
+
+    @pytest.mark.asyncio
+    async def test_stages_are_collected_per_request(self):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            with timed("pagination"):
+                pass
+            async with timed("summary"):
+                pass
+            record_stage("download", 0.25)
+        finally:
+            _current.reset(token)
+        record_stage("outside", 1.0)
+
+        assert [stage for stage, _ in timings.stages] == ["pagination", "summary", "download"]
+        assert "download;dur=250.0" in timings.server_timing()
+
+
+@patch("app.services.summary_pipeline.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(BOOK_TEXT, None))
+@patch("app.services.summary_pipeline.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+def test_summarize_is_timed_and_exported(mock_book, mock_text):
+    """Test that a summary request shows up in the Server-Timing header and on /metrics."""
+    timed_app = FastAPI()
+    timed_app.add_middleware(MetricsMiddleware, server_timing=True)
+    timed_app.include_router(router)
+
+    with patch("app.services.llm_service.get_llm_backend", return_value=FakeBackend("llama2")):
+        response = TestClient(timed_app).post("/api/summarize", json={"book_id": 21, "page_number": 2})
+        cached = TestClient(timed_app).post("/api/summarize", json={"book_id": 21, "page_number": 2})
+
+    assert response.status_code == 200
+    server_timing = response.headers["server-timing"]
+    for stage in ("metadata", "download", "pagination", "front_matter", "summary", "total"):
+        assert f"{stage};dur=" in server_timing
+    assert re.search(r'summary;dur=[\d.]+;desc="miss"', server_timing)
+    assert re.search(r'summary;dur=[\d.]+;desc="hit"', cached.headers["server-timing"])
+
+    metrics = TestClient(app).get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    body = metrics.text
+    assert 'book_summarizer_stage_duration_seconds_count{stage="summary"}' in body
+    assert 'book_summarizer_http_request_duration_seconds_count{method="POST",route="/api/summarize",status="200"}' in body
+    assert 'book_summarizer_llm_call_duration_seconds_count{operation="summarize_text"}' in body
+    assert 'book_summarizer_cache_lookups_total{cache="summary",result="hit"}' in body
+    assert 'book_summarizer_request_size_count{kind="pages"}' in body
+    assert 'book_summarizer_cache_stats{cache="metadata",stat="hits"}' in body
@@ -0,0 +1,50 @@
+from app.services.book_service import BookService
+from app.services.page_index import PageIndex
+
+SAMPLE_TEXT = ("The rain fell in torrents. " * 40 + "\n\n") * 30
+
+
+class TestPageIndex:
+    def test_pages_match_paginator(self):
+        """Test that indexed pages are exactly the pages produced by the paginator."""
+        index = BookService.build_page_index(SAMPLE_TEXT, 500)
+        pages = list(BookService.iter_pages(SAMPLE_TEXT, 500))
+
+        assert len(index) == len(pages)
+        for page_num, page in enumerate(pages, start=1):
+            assert index.extract(SAMPLE_TEXT, page_num, page_num).strip() == page
+        assert BookService.paginate_text(SAMPLE_TEXT, 500, index) == BookService.paginate_text(SAMPLE_TEXT, 500)
+
+    def test_extract_page_range_does_not_drift(self):
+        """Test that late page ranges map to the original text, without page headers."""
+        index = BookService.build_page_index(SAMPLE_TEXT, 500)
+        last = len(index)
+
+        start, end = index.page_span(last - 2, last)
+        assert end == len(SAMPLE_TEXT)
+        assert index.extract(SAMPLE_TEXT, last - 2, last) == SAMPLE_TEXT[start:]
+        assert "Page" not in index.extract(SAMPLE_TEXT, 1, last)
+
+        view = index.extract(memoryview(SAMPLE_TEXT.encode("ascii")), 2, 3)
+        assert isinstance(view, memoryview)
+        assert bytes(view).decode("ascii") == index.extract(SAMPLE_TEXT, 2, 3)
+
+    def test_out_of_range_pages(self):
+        """Test that page numbers outside the book are clamped."""
+        index = BookService.build_page_index(SAMPLE_TEXT, 500)
+
+        assert index.extract(SAMPLE_TEXT, 1, 10_000) == SAMPLE_TEXT
+        assert index.extract(SAMPLE_TEXT, 10_000, 10_001) == ""
+        assert index.extract(SAMPLE_TEXT, 5, 2) == ""
+        assert len(BookService.build_page_index("", 500)) == 0
+
+    def test_serialisation_roundtrip(self):
+        """Test that the index survives to_bytes/from_bytes with chapter markers."""
+        index = BookService.build_page_index(SAMPLE_TEXT, 500)
+        index.chapters = [(0, "CHAPTER I"), (index.offsets[3] + 10, "CHAPTER II")]
+
+        restored = PageIndex.from_bytes(index.to_bytes())
+
+        assert list(restored.offsets) == list(index.offsets)
+        assert restored.max_chars_per_page == 500
+        assert restored.chapter_pages() == [(1, "CHAPTER I"), (4, "CHAPTER II")]
@@ -0,0 +1,90 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from app.main import app
+from app.services.book_service import BookService
+from app.services.llm_backends import FakeBackend
+
+PROSE = "The crew kept their watch on deck while the ship ran before the wind.\n" * 60
+
+BOOK_TEXT = (
+    "*** START OF THE PROJECT GUTENBERG EBOOK SEA TALES ***\n\nSEA TALES\n\n\n"
+    + "".join(f"CHAPTER {n}. Voyage {n}.\n\n{PROSE}\n\n" for n in range(1, 6))
+)
+
+BOOK = {"id": 7, "title": "Sea Tales", "authors": [{"name": "Doe, Jane"}],
+        "formats": {"text/plain; charset=utf-8": "http://example.com/7.txt"}}
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, text=BOOK_TEXT, headers={"Content-Type": "text/plain; charset=utf-8"})
+
+
+@pytest.fixture
+def client():
+    """API client for a book whose text is downloaded into the (test) text cache."""
+    gutenberg = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.book_service.get_gutenberg_client", return_value=gutenberg), \
+            patch("app.services.book_service.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK), \
+            patch("app.services.llm_service.get_llm_backend", return_value=FakeBackend("fake")):
+        yield TestClient(app)
+
+
+class TestSummaryPayload:
+    def test_original_text_is_opt_in(self, client):
+        """Test that summaries link to their pages and only inline the text when asked."""
+        body = client.post("/api/summarize", json={"book_id": 7, "page_number": 3}).json()
+        assert body["original_text"] is None
+        assert body["original_text_url"] == f"/api/books/7/pages?from={body['start_page']}&to=3"
+
+        pages = client.get(body["original_text_url"])
+        assert pages.status_code == 200
+        assert pages.headers["content-type"] == "text/plain; charset=utf-8"
+
+        full = client.post("/api/summarize", json={"book_id": 7, "page_number": 3, "include_original_text": True}).json()
+        assert full["cached"] is True
+        assert full["original_text"] == pages.text
+
+
+class TestPagesEndpoint:
+    def test_pages_match_page_index(self, client):
+        """Test that pages are served from the page index, with the page count in a header."""
+        response = client.get("/api/books/7/pages", params={"from": 2, "to": 3})
+        page_index = BookService.build_page_index(BOOK_TEXT, 3000)
+        assert response.text == page_index.extract(BOOK_TEXT, 2, 3)
+        assert response.headers["x-total-pages"] == str(len(page_index))
+        assert client.get("/api/books/7/pages", params={"from": 2}).text == page_index.extract(BOOK_TEXT, 2, 2)
+        assert client.get("/api/books/7/pages", params={"from": 99}).status_code == 400
+        assert client.get("/api/books/7/pages", params={"from": 3, "to": 2}).status_code == 400
+
+    def test_conditional_and_range_requests(self, client):
+        """Test ETag revalidation and byte ranges of the page text."""
+        response = client.get("/api/books/7/pages", params={"from": 1, "to": 2})
+        etag = response.headers["etag"]
+        body = response.content
+
+        not_modified = client.get("/api/books/7/pages", params={"from": 1, "to": 2}, headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304 and not_modified.content == b""
+        assert client.get("/api/books/7/pages", params={"from": 1, "to": 3}).headers["etag"] != etag
+
+        partial = client.get("/api/books/7/pages", params={"from": 1, "to": 2}, headers={"Range": "bytes=10-19"})
+        assert partial.status_code == 206
+        assert partial.content == body[10:20]
+        assert partial.headers["content-range"] == f"bytes 10-19/{len(body)}"
+        suffix = client.get("/api/books/7/pages", params={"from": 1, "to": 2}, headers={"Range": "bytes=-5"})
+        assert suffix.content == body[-5:]
+        stale = client.get("/api/books/7/pages", params={"from": 1, "to": 2},
+                           headers={"Range": "bytes=10-19", "If-Range": '"old"'})
+        assert stale.status_code == 200 and stale.content == body
+        outside = client.get("/api/books/7/pages", params={"from": 1, "to": 2}, headers={"Range": f"bytes={len(body)}-"})
+        assert outside.status_code == 416
+
+    def test_responses_are_gzipped(self, client):
+        """Test that large responses are gzip-compressed for clients accepting it."""
+        response = client.get("/api/books/7/pages", params={"from": 1, "to": 2}, headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert int(response.headers["content-length"]) < len(response.content) / 5
+        raw = client.get("/api/books/7/pages", params={"from": 1, "to": 2}, headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in raw.headers
+        assert raw.content == response.content
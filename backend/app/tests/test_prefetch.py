@@ -0,0 +1,139 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+from app.services import metrics, prefetch
+from app.services.llm_backends import FakeBackend
+from app.services.prefetch import Prefetcher, run_foreground
+from app.services.summary_pipeline import SummaryPipeline
+
+PROSE = "The crew kept their watch on deck while the ship ran before the wind.\n"
+BOOK_TEXT = "".join(f"Page {page}. " + PROSE * 42 + "\n" for page in range(1, 41))
+BOOK = {"id": 7, "title": "Sea Tales", "authors": [{"name": "Doe, Jane"}], "formats": {"text/plain": "http://x/7.txt"}}
+
+
+def served(page_number: int, mode: str = "incremental", book_id: int = 7):
+    """Stand-in for a pipeline that served a request (10-page segments from page 1, 100 pages)."""
+    return SimpleNamespace(
+        book_id=book_id, text_url=None, page_number=page_number, start_page=1, mode=mode, chapters=None,
+        page_index=[None] * 100, segment_pages=lambda: 10,
+    )
+
+
+class RecordingRunner:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.targets = []
+
+    async def __call__(self, book_id, page_number, text_url):
+        await asyncio.sleep(self.delay)
+        self.targets.append((book_id, page_number))
+        return True
+
+
+class TestPrefetcher:
+    def test_next_checkpoints(self):
+        """Test that checkpoints fall at segment ends counted from the start page, within the book."""
+        assert Prefetcher.next_checkpoints(1, 10, 10, 100, 2) == [20, 30]
+        assert Prefetcher.next_checkpoints(1, 14, 10, 100, 2) == [20, 30]
+        assert Prefetcher.next_checkpoints(3, 14, 10, 100, 2) == [22, 32]
+        assert Prefetcher.next_checkpoints(1, 85, 10, 95, 2) == [90]
+
+    @pytest.mark.asyncio
+    async def test_prefetched_checkpoints_are_counted_used_or_wasted(self):
+        """Test scheduling after incremental summaries and the used/wasted accounting."""
+        runner = RecordingRunner()
+        prefetcher = Prefetcher(runner=runner)
+        prefetcher.after_summary(served(10, mode="full"))
+        await prefetcher.idle()
+        assert runner.targets == []
+
+        prefetcher.after_summary(served(10))
+        await prefetcher.idle()
+        assert runner.targets == [(7, 20), (7, 30)]
+
+        prefetcher.after_summary(served(23))
+        await prefetcher.idle()
+        # Checkpoint 30 is already prefetched; 40 is new
+        assert runner.targets == [(7, 20), (7, 30), (7, 40)]
+        assert prefetcher.stats["used"] == 1 and prefetcher.stats["hits"] == 1
+
+        prefetcher.waste_after = 0
+        snapshot = prefetcher.snapshot()
+        assert snapshot["prefetched"] == 3 and snapshot["wasted"] == 2
+        assert snapshot["hit_rate"] == pytest.approx(1 / 3, abs=0.001)
+        await prefetcher.close()
+
+    @pytest.mark.asyncio
+    async def test_foreground_requests_preempt_prefetching(self):
+        """Test that prefetching waits for foreground requests and yields to new ones."""
+        runner = RecordingRunner(delay=0.05)
+        prefetcher = Prefetcher(checkpoints_ahead=1, runner=runner)
+        async with prefetcher.foreground():
+            prefetcher.after_summary(served(10))
+            await asyncio.sleep(0.1)
+            assert runner.targets == []
+
+        await asyncio.sleep(0.01)
+        async with prefetcher.foreground():
+            await asyncio.sleep(0.1)
+            assert runner.targets == []
+        assert prefetcher.stats["preempted"] == 1
+        await prefetcher.idle()
+        assert runner.targets == [(7, 20)]
+        await prefetcher.close()
+
+    @pytest.mark.asyncio
+    async def test_prefetches_do_not_record_into_the_request(self):
+        """Test that prefetches scheduled from a request do not add their timings to that request."""
+        async def runner(book_id, page_number, text_url):
+            metrics.record_stage("summary", 0.01)
+            metrics.record_size("tokens", 100)
+            return True
+
+        prefetcher = Prefetcher(runner=runner)
+        timings = metrics.RequestTimings()
+        token = metrics._current.set(timings)
+        try:
+            prefetcher.after_summary(served(10))
+        finally:
+            metrics._current.reset(token)
+        await prefetcher.idle()
+        assert prefetcher.stats["prefetched"] == 2
+        assert timings.stages == [] and timings.counts == {}
+        await prefetcher.close()
+
+    @pytest.mark.asyncio
+    async def test_queue_is_bounded(self):
+        """Test that prefetches beyond max_pending are dropped."""
+        prefetcher = Prefetcher(max_pending=3, runner=RecordingRunner())
+        async with prefetcher.foreground():
+            for book_id in (1, 2, 3):
+                prefetcher.after_summary(served(10, book_id=book_id))
+        assert prefetcher.stats["scheduled"] == 3 and prefetcher.stats["dropped"] == 3
+        await prefetcher.close()
+
+
+@patch("app.services.book_service.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(BOOK_TEXT, None))
+@patch("app.services.book_service.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+class TestPrefetchedSummaries:
+    @pytest.mark.asyncio
+    async def test_next_request_hits_prefetched_checkpoint(self, mock_get_book, mock_fetch_text, monkeypatch):
+        """Test that after reading up to page N, the summary for the next checkpoint is served without LLM calls."""
+        prefetcher = Prefetcher()
+        monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", True)
+        monkeypatch.setattr(prefetch, "_prefetcher", prefetcher)
+        backend = FakeBackend("fake")
+        with patch("app.services.llm_service.get_llm_backend", return_value=backend):
+            first = SummaryPipeline(7, 10, mode="incremental")
+            await run_foreground(first)
+            await prefetcher.idle()
+            assert prefetcher.stats["prefetched"] == 2
+            calls = len(backend.prompts)
+
+            next_checkpoint = Prefetcher.next_checkpoints(first.start_page, 10, first.segment_pages(), len(first.page_index), 1)[0]
+            result = await run_foreground(SummaryPipeline(7, next_checkpoint, mode="incremental"))
+            assert result["cached"] is True
+            assert len(backend.prompts) == calls
+            assert prefetcher.stats["hits"] == 1 and prefetcher.stats["used"] == 1
+        await prefetcher.close()
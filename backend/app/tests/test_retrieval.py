@@ -0,0 +1,173 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, patch
+from app.main import app
+from app.services import embeddings, vector_index
+from app.services.book_service import BookService
+from app.services.embeddings import FakeEmbedder, OllamaEmbedder
+from app.services.llm_backends import FakeBackend
+from app.services.llm_service import LLMService
+from app.services.retrieval_summarizer import RetrievalSummarizer
+from app.services.text_cache import get_text_cache
+from app.services.vector_index import VectorIndex
+
+FILLER = "The crew kept their watch on deck while the ship ran before the wind.\n" * 13
+HARPOON = "Captain Ahab sharpened the harpoon and swore to hunt the white whale.\n" * 13
+
+
+def book_text(pages: int, harpoon_pages=(5, 17)) -> str:
+    return "".join((HARPOON if page in harpoon_pages else FILLER) + "\n" for page in range(1, pages + 1))
+
+
+BOOK = {"id": 7, "title": "Sea Tales", "authors": [{"name": "Doe, Jane"}], "formats": {"text/plain": "http://x/7.txt"}}
+
+
+@pytest.fixture(autouse=True)
+def fake_embedder(monkeypatch):
+    """Embed with the deterministic fake instead of Ollama."""
+    embedder = FakeEmbedder()
+    monkeypatch.setattr(embeddings, "_embedder", embedder)
+    return embedder
+
+
+class TestVectorIndex:
+    def test_ranking_and_roundtrip(self, tmp_path):
+        """Test that pages rank by cosine similarity, within the page limit, and survive a file roundtrip."""
+        index = VectorIndex.build([[1.0, 0.0], [0.0, 2.0], [3.0, 3.0], [1.0, 0.1]])
+        assert [page for page, _ in index.top_pages([1.0, 0.0], 1, 4, 2)] == [1, 4]
+        assert [page for page, _ in index.top_pages([1.0, 0.0], 2, 3, 5)] == [3, 2]
+
+        path = tmp_path / "vectors"
+        path.write_bytes(index.to_bytes())
+        restored = VectorIndex.open(str(path))
+        assert len(restored) == 4
+        assert restored.scores([0.0, 1.0], 1, 4) == pytest.approx(index.scores([0.0, 1.0], 1, 4))
+        with pytest.raises(ValueError):
+            restored.scores([1.0, 0.0, 0.0], 1, 4)
+
+        path.write_bytes(b"not an index")
+        with pytest.raises(ValueError):
+            VectorIndex.open(str(path))
+
+    def test_numpy_matches_pure_python(self, tmp_path, monkeypatch):
+        """Test that the NumPy memmap path and the pure-Python fallback score alike."""
+        pytest.importorskip("numpy")
+        path = tmp_path / "vectors"
+        path.write_bytes(VectorIndex.build([[1.0, 2.0, 3.0], [3.0, 2.0, 1.0], [0.0, 1.0, 0.0]]).to_bytes())
+        with_numpy = VectorIndex.open(str(path)).scores([1.0, 1.0, 0.0], 1, 3)
+        monkeypatch.setattr(vector_index, "_numpy", False)
+        assert VectorIndex.open(str(path)).scores([1.0, 1.0, 0.0], 1, 3) == pytest.approx(with_numpy, abs=1e-6)
+
+
+class TestEmbedders:
+    @pytest.mark.asyncio
+    async def test_fake_embedder_is_deterministic(self):
+        """Test that the fake embedder is stable and puts texts sharing words close together."""
+        embedder = FakeEmbedder()
+        harpoon, filler, question = await embedder.embed([HARPOON, FILLER, "What did Ahab do with the harpoon?"])
+        assert (await FakeEmbedder().embed([HARPOON]))[0] == harpoon
+        index = VectorIndex.build([harpoon, filler])
+        assert index.top_pages(question, 1, 2, 1)[0][0] == 1
+
+    @pytest.mark.asyncio
+    async def test_ollama_embedder(self):
+        """Test the Ollama /api/embed request and response handling."""
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200, json={"embeddings": [[0.1, 0.2], [0.3, 0.4]]})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch("app.services.embeddings.get_ollama_client", return_value=client):
+            vectors = await OllamaEmbedder("http://ollama:11434", "nomic-embed-text").embed(["a", "b"])
+        assert vectors == [[0.1, 0.2], [0.3, 0.4]]
+        assert requests[0].url == "http://ollama:11434/api/embed"
+        assert b'"input":["a","b"]' in requests[0].content.replace(b" ", b"")
+
+
+class TestRetrievalSummarizer:
+    @pytest.mark.asyncio
+    async def test_selects_relevant_pages_and_embeds_once(self, fake_embedder):
+        """Test that the relevant pages are selected and page embeddings are stored and reused."""
+        text = book_text(30)
+        page_index = BookService.build_page_index(text, 1000)
+        digest = "ab" * 32
+        backend = FakeBackend("fake")
+        with patch("app.services.llm_service.get_llm_backend", return_value=backend):
+            summarizer = RetrievalSummarizer(LLMService(), top_k=3, batch_size=8)
+            _, stages = await summarizer.summarize("What did Ahab do with the harpoon?", text, page_index, digest, 1, 30)
+            assert stages[0]["embedded_pages"] == len(page_index)
+            assert {5, 17} <= set(stages[0]["selected_pages"])
+            assert stages[0]["selected_pages"] == sorted(stages[0]["selected_pages"])
+            assert "[Page 5]" in backend.prompts[-1] and "Captain Ahab" in backend.prompts[-1]
+            # Four batches of pages, then the question
+            assert fake_embedder.calls == 5
+
+            # Pages up to 10 only: page 17 is beyond the limit
+            _, stages = await RetrievalSummarizer(LLMService(), top_k=3).summarize(
+                "What did Ahab do with the harpoon?", text, page_index, digest, 1, 10
+            )
+            assert stages[0]["embedded_pages"] == 0
+            assert 5 in stages[0]["selected_pages"] and max(stages[0]["selected_pages"]) <= 10
+            assert fake_embedder.calls == 6
+        assert get_text_cache().load_vector_index(digest, 1000, fake_embedder.name) is not None
+
+    @pytest.mark.asyncio
+    async def test_vectors_are_kept_per_compaction_version(self, fake_embedder):
+        """Test that vectors of a compacted text are not reused for the original or another compaction version."""
+        text = book_text(10)
+        page_index = BookService.build_page_index(text, 1000)
+        with patch("app.services.llm_service.get_llm_backend", return_value=FakeBackend("fake")):
+            summarizer = RetrievalSummarizer(LLMService(), top_k=3)
+            embedded = []
+            for compaction_version in (1, 2, None, 1):
+                _, stages = await summarizer.summarize("Who kept watch?", text, page_index, "ef" * 32, 1, 10, compaction_version)
+                embedded.append(stages[0]["embedded_pages"])
+        assert embedded == [len(page_index)] * 3 + [0]
+
+    @pytest.mark.asyncio
+    async def test_prompt_size_is_constant(self):
+        """Test that the prompt does not grow with the page the reader is on."""
+        text = book_text(200)
+        page_index = BookService.build_page_index(text, 1000)
+        backend = FakeBackend("fake")
+        with patch("app.services.llm_service.get_llm_backend", return_value=backend):
+            summarizer = RetrievalSummarizer(LLMService(), top_k=4)
+            sizes = []
+            for last_page in (20, 80, 200):
+                _, stages = await summarizer.summarize("Who kept watch on deck?", text, page_index, "cd" * 32, 1, last_page)
+                assert len(stages[0]["selected_pages"]) == 4
+                sizes.append(len(backend.prompts[-1]))
+        assert max(sizes) - min(sizes) < 200
+
+
+@patch("app.services.book_service.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(book_text(30), None))
+@patch("app.services.book_service.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+class TestRetrievalEndpoint:
+    def test_retrieval_mode(self, mock_get_book, mock_fetch_text):
+        """Test answering a question in retrieval mode, cached per question."""
+        client = TestClient(app)
+        backend = FakeBackend("fake")
+        request = {"book_id": 7, "page_number": 8, "mode": "retrieval", "question": "What did Ahab do with the harpoon?"}
+        with patch("app.services.llm_service.get_llm_backend", return_value=backend):
+            response = client.post("/api/summarize", json=request)
+            assert response.status_code == 200
+            body = response.json()
+            assert body["cached"] is False
+            assert body["stages"][0]["stage"] == "retrieval"
+            assert "Question: What did Ahab do with the harpoon?" in backend.prompts[-1]
+
+            assert client.post("/api/summarize", json=request).json()["cached"] is True
+            other = client.post("/api/summarize", json={**request, "question": "Who kept watch?"}).json()
+            assert other["cached"] is False
+
+    def test_question_requires_retrieval_mode(self, mock_get_book, mock_fetch_text):
+        """Test that retrieval mode needs a question and other modes reject one."""
+        client = TestClient(app)
+        assert client.post("/api/summarize", json={"book_id": 7, "page_number": 8, "mode": "retrieval"}).status_code == 422
+        assert client.post("/api/summarize", json={"book_id": 7, "page_number": 8, "question": "Why?"}).status_code == 422
+        assert client.post("/api/summarize", json={
+            "book_id": 7, "chapter_start": 1, "mode": "retrieval", "question": "Why?",
+        }).status_code == 422
@@ -0,0 +1,213 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.main import app
+from app.services.book_service import BookService
+from app.services.book_text import MappedText
+from app.services.search_index import SearchIndex, find_phrase, fts_query, get_search_index
+
+BOOKS = [
+    {"id": 2701, "title": "Moby Dick; Or, The Whale", "authors": [{"name": "Melville, Herman"}],
+     "subjects": ["Whaling -- Fiction", "Sea stories"], "bookshelves": ["Best Books Ever Listings"], "download_count": 90},
+    {"id": 1342, "title": "Pride and Prejudice", "authors": [{"name": "Austen, Jane"}],
+     "subjects": ["Courtship -- Fiction"], "bookshelves": [], "download_count": 120},
+    {"id": 8118, "title": "The Whale and the Sea", "authors": [{"name": "Anonymous"}],
+     "subjects": [], "bookshelves": [], "download_count": 5},
+]
+
+BOOK_TEXT = (
+    "CHAPTER 1. Loomings\n\nCall me Ishmael. Some years ago, never mind how long\n"
+    "precisely, having little money in my purse, I thought I would sail about.\n\n"
+    + "The sea was calm. " * 300
+    + "\n\nCHAPTER 2. The Carpet-Bag\n\nThe White\nWhale was spoken of in New Bedford.\n"
+)
+
+
+class TestSearchIndex:
+    def test_fts_query(self):
+        """Test that searches become all-words queries with a prefix match on the last word."""
+        assert fts_query("moby di") == '"moby" "di"*'
+        assert fts_query("  ;; ") is None
+
+    def test_ranking_and_pagination(self, tmp_path):
+        """Test that title matches rank first, then popularity, and results are paginated."""
+        index = SearchIndex(str(tmp_path / "search.sqlite3"))
+        index.add_books(BOOKS)
+
+        result = index.search("whale", page=1, limit=1)
+        assert result["count"] == 2
+        assert [book["id"] for book in result["results"]] == [2701]
+        assert result["next"] == 2 and result["previous"] is None
+        assert [book["id"] for book in index.search("whale", page=2, limit=1)["results"]] == [8118]
+        # Diacritics, case and a partially typed last word
+        assert index.search("AUSTÉN pri")["results"][0]["id"] == 1342
+        assert index.search("tolstoy") is None
+        assert index.stats["hits"] == 3 and index.stats["misses"] == 1
+
+    def test_complete_only(self, tmp_path):
+        """Test that complete_only answers only searches with as many indexed matches as gutendex reported."""
+        index = SearchIndex(str(tmp_path / "search.sqlite3"))
+        index.add_books(BOOKS)
+        assert index.search("whale", complete_only=True) is None
+        index.record_search("whale", 3)
+        assert index.search("whale", complete_only=True) is None
+        index.record_search("  WHALE ", 2)
+        assert index.search("Whale", complete_only=True)["count"] == 2
+        assert index.search("whal", complete_only=True) is None
+        # Only whole words of titles and authors count towards gutendex's number
+        index.record_search("whal", 2)
+        assert index.search("whal", complete_only=True) is None
+        index.record_search("sea", 2)
+        assert index.search("sea")["count"] == 2
+        assert index.search("sea", complete_only=True) is None
+
+    def test_recorded_counts_expire(self, tmp_path):
+        """Test that gutendex's count for a search stops vouching for the index after max_age."""
+        index = SearchIndex(str(tmp_path / "search.sqlite3"), max_age=60)
+        index.add_books(BOOKS)
+        now = [1000.0]
+        with patch.object(time, "time", lambda: now[0]):
+            index.record_search("whale", 2)
+            assert index.search("whale", complete_only=True)["count"] == 2
+            now[0] += 61
+            assert index.search("whale", complete_only=True) is None
+            index.record_search("whale", 2)
+            assert index.search("whale", complete_only=True)["count"] == 2
+
+    def test_updates_replace_books(self, tmp_path):
+        """Test that re-adding a book replaces its indexed metadata."""
+        index = SearchIndex(str(tmp_path / "search.sqlite3"))
+        index.add_books(BOOKS)
+        index.add_books([{**BOOKS[1], "title": "Emma"}])
+        assert index.search("prejudice") is None
+        assert index.search("emma")["results"][0]["title"] == "Emma"
+        assert index.size() == {"books": 3, "texts": 0}
+
+    def test_full_text(self, tmp_path):
+        """Test that indexed page texts make books findable by their contents."""
+        index = SearchIndex(str(tmp_path / "search.sqlite3"), full_text=True)
+        index.add_books(BOOKS)
+        page_index = BookService.build_page_index(BOOK_TEXT, 1000)
+        assert index.add_text(1342, BOOK_TEXT, page_index, "v1")
+        assert not index.add_text(1342, BOOK_TEXT, page_index, "v1")
+
+        result = index.search("ishmael")
+        assert [book["id"] for book in result["results"]] == [1342]
+        # Metadata matches rank before text-only matches
+        assert [book["id"] for book in index.search("whale")["results"]] == [2701, 8118, 1342]
+
+    def test_search_is_fast(self, tmp_path):
+        """Test that a search over a few thousand books takes milliseconds."""
+        index = SearchIndex(str(tmp_path / "search.sqlite3"))
+        index.add_books(
+            {"id": i, "title": f"Voyage number {i}", "authors": [{"name": f"Author {i % 97}"}], "subjects": ["Sea stories"]}
+            for i in range(1, 5001)
+        )
+        start = time.perf_counter()
+        result = index.search("voyage 42")
+        assert result["count"] >= 1
+        assert time.perf_counter() - start < 0.05
+
+
+class TestFindPhrase:
+    def test_finds_pages_across_line_breaks(self, tmp_path):
+        """Test phrase lookup ignoring case and line breaks, on str and mapped texts."""
+        page_index = BookService.build_page_index(BOOK_TEXT, 1000)
+        matches = find_phrase(BOOK_TEXT, page_index, "white whale")
+        assert [match["page"] for match in matches] == [len(page_index)]
+        assert "The White Whale was spoken of" in matches[0]["snippet"]
+        assert find_phrase(BOOK_TEXT, page_index, "call me ishmael")[0]["page"] == 1
+        assert len(find_phrase(BOOK_TEXT, page_index, "the sea was calm", limit=5)) == 5
+
+        path = tmp_path / "book.txt"
+        path.write_text(BOOK_TEXT, encoding="utf-8")
+        with MappedText.open(str(path)) as mapped:
+            assert find_phrase(mapped, page_index, "white whale") == matches
+
+
+class TestGetBooksFromIndex:
+    @pytest.mark.asyncio
+    @patch("httpx.AsyncClient.get")
+    async def test_falls_back_to_gutendex_on_local_miss(self, mock_get):
+        """Test that gutendex results are indexed and later searches are answered locally."""
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"count": 2, "next": None, "previous": None, "results": [BOOKS[0], BOOKS[2]]}
+        mock_response.raise_for_status = MagicMock()
+        mock_get.return_value = mock_response
+
+        first = await BookService.get_books(search_query="whale")
+        assert first["count"] == 2 and "source" not in first
+        assert mock_get.call_count == 1
+
+        second = await BookService.get_books(search_query="Whale!")
+        assert second["source"] == "local"
+        assert [book["id"] for book in second["results"]] == [2701, 8118]
+        assert mock_get.call_count == 1
+        assert get_search_index().stats["hits"] == 1
+
+        # Matches indexed for another search do not make this one complete
+        third = await BookService.get_books(search_query="whal")
+        assert "source" not in third
+        assert mock_get.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("httpx.AsyncClient.get")
+    async def test_partial_index_goes_upstream(self, mock_get):
+        """Test that a search is not answered locally while the index has fewer books than gutendex reported."""
+        pages = {
+            1: {"count": 3, "next": "page=2", "previous": None, "results": [BOOKS[0], BOOKS[2]]},
+            2: {"count": 3, "next": None, "previous": "page=1", "results": [{**BOOKS[1], "title": "A Whale of a Time"}]},
+        }
+
+        async def get(url, params, **kwargs):
+            response = MagicMock()
+            response.json.return_value = pages[params["page"]]
+            response.raise_for_status = MagicMock()
+            return response
+
+        mock_get.side_effect = get
+        search_index = get_search_index()
+        await BookService.get_books(search_query="whale", page=1)
+        assert search_index.search("whale", complete_only=True) is None
+
+        # The second page is past what is indexed: it comes from gutendex, not an empty local page
+        second = await BookService.get_books(search_query="whale", page=2)
+        assert "source" not in second and [book["id"] for book in second["results"]] == [1342]
+        assert mock_get.call_count == 2
+
+        # Every match is indexed now, so later pages are answered locally
+        local = await BookService.get_books(search_query="whale", page=1, limit=2)
+        assert local["source"] == "local" and local["count"] == 3
+        assert mock_get.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch("httpx.AsyncClient.get")
+    async def test_local_pages_line_up_with_gutendex(self, mock_get):
+        """Test that local pages hold as many books as gutendex's, whatever limit is asked for."""
+        books = [{"id": i, "title": f"Whale tale {i}", "authors": [], "download_count": 100 - i} for i in range(1, 41)]
+        pages = {1: books[:32], 2: books[32:]}
+
+        async def get(url, params, **kwargs):
+            response = MagicMock()
+            response.json.return_value = {"count": 40, "results": pages[params["page"]]}
+            response.raise_for_status = MagicMock()
+            return response
+
+        mock_get.side_effect = get
+        upstream = [await BookService.get_books(search_query="whale", page=page) for page in (1, 2)]
+        local = [await BookService.get_books(search_query="whale", page=page, limit=20) for page in (1, 2)]
+        assert all(result["source"] == "local" for result in local)
+        assert [[book["id"] for book in result["results"]] for result in local] == \
+            [[book["id"] for book in result["results"]] for result in upstream]
+        assert mock_get.call_count == 2
+
+    @patch("app.services.book_service.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(BOOK_TEXT, None))
+    @patch("app.services.book_service.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOKS[0])
+    def test_phrase_endpoint(self, mock_get_book, mock_fetch_text):
+        """Test GET /api/books/{id}/search returns the pages containing a phrase."""
+        response = TestClient(app).get("/api/books/2701/search", params={"phrase": "white whale", "text_url": "http://x/1.txt"})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["total_pages"] == len(BookService.build_page_index(BOOK_TEXT, 3000))
+        assert [match["page"] for match in body["matches"]] == [body["total_pages"]]
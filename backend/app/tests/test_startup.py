@@ -0,0 +1,93 @@
+import subprocess
+import sys
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app.core import config
+from app.core.config import Settings
+from app.main import app
+from app.services.readiness import Readiness
+from benchmarks.bench_startup import BACKEND_DIR, _environment, measure_startup, over_budget
+
+
+class TestSettings:
+    def test_from_env(self):
+        """Test that variables are parsed as their setting's type and unset ones keep their defaults."""
+        settings = Settings.from_env({
+            "LLM_BACKEND": "OpenAI", "LLM_MAX_RETRIES": "5", "LLM_RETRY_BASE_DELAY": "0.25",
+            "TEXT_CACHE_ENABLED": "no", "OLLAMA_HOST": "http://a:11434, http://b:11434",
+        })
+        assert settings.llm_backend == "openai"
+        assert settings.llm_max_retries == 5 and settings.llm_retry_base_delay == 0.25
+        assert settings.text_cache_enabled is False and settings.summary_cache_enabled is True
+        assert settings.ollama_hosts == ["http://a:11434", "http://b:11434"]
+        assert settings.llm_model == "llama2"
+
+    def test_invalid_values_and_constants(self):
+        """Test that unparsable values name their variable and settings read as module constants."""
+        with pytest.raises(ValueError, match="LLM_MAX_RETRIES must be int"):
+            Settings.from_env({"LLM_MAX_RETRIES": "many"})
+        assert config.LLM_MAX_RETRIES == config.get_settings().llm_max_retries
+        with pytest.raises(AttributeError):
+            config.NOT_A_SETTING
+
+
+class TestReadiness:
+    def test_ready_endpoint(self):
+        """Test that /ready answers 200 once warm, separately from /health, and 503 after shutdown."""
+        with TestClient(app) as client:
+            assert client.get("/health").status_code == 200
+            deadline = time.monotonic() + 10
+            response = client.get("/ready")
+            while response.status_code == 503 and time.monotonic() < deadline:
+                time.sleep(0.01)
+                response = client.get("/ready")
+            assert response.status_code == 200
+            body = response.json()
+            assert body["status"] == "ready" and body["seconds"] is not None
+            assert body["checks"]["summary_cache"] == "ok" and body["checks"]["http_clients"] == "ok"
+        response = TestClient(app).get("/ready")
+        assert response.status_code == 503 and response.json()["status"] == "stopping"
+
+    @pytest.mark.asyncio
+    async def test_failed_and_disabled_steps(self):
+        """Test that a failing step keeps the process unready and a disabled component does not."""
+        def broken():
+            raise OSError("disk full")
+
+        readiness = Readiness([("summary_cache", lambda: None), ("search_index", broken)])
+        readiness.start()
+        assert not readiness.ready
+        await readiness._task
+        assert readiness.status == "failed"
+        assert readiness.checks == {"summary_cache": "disabled", "search_index": "failed: disk full", "http_clients": "ok"}
+
+        readiness = Readiness([("summary_cache", lambda: None)])
+        readiness.start()
+        await readiness._task
+        assert readiness.ready
+        await readiness.stop()
+        assert not readiness.ready
+
+
+class TestStartupBudget:
+    def test_import_is_lazy(self, tmp_path):
+        """Test that importing the app opens no caches and loads no optional heavy packages."""
+        script = (
+            "import sys, app.main\n"
+            "from app.services import leases, search_index, summary_cache, text_cache, tokens, llm_backends\n"
+            "print([m for m in ('numpy', 'tiktoken') if m in sys.modules])\n"
+            "print([s for s in (leases._lease_store, search_index._search_index, summary_cache._summary_cache,"
+            " text_cache._text_cache, tokens._tokenizer, llm_backends._llm_backend) if s is not None])\n"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script], cwd=BACKEND_DIR, env=_environment(str(tmp_path)),
+            capture_output=True, text=True, check=True,
+        ).stdout
+        assert output.splitlines() == ["[]", "[]"]
+
+    def test_startup_within_budget(self):
+        """Test the import and warm-up times against the budgets of benchmarks.bench_startup."""
+        result = measure_startup(repeat=2)
+        assert over_budget(result) == []
+        assert set(result["checks"].values()) == {"ok"}
@@ -0,0 +1,68 @@
+import json
+import httpx
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+BOOK = {
+    "id": 12,
+    "title": "Streamed Book",
+    "authors": [{"name": "Test Author"}],
+    "formats": {"text/plain": "http://example.com/12.txt"},
+}
+BOOK_TEXT = "CHAPTER 1. The Start\n\n" + "It was a dark and stormy night, and the rain fell in torrents.\n" * 200
+TOKENS = ["Key plot ", "points: ", "a storm."]
+
+
+def fake_ollama(request: httpx.Request) -> httpx.Response:
+    """Local stand-in for Ollama's streaming /api/generate"""
+    payload = json.loads(request.content)
+    assert payload["stream"] is True
+    lines = [json.dumps({"response": token, "done": False}) for token in TOKENS]
+    lines.append(json.dumps({"response": "", "done": True}))
+    return httpx.Response(200, content="\n".join(lines).encode())
+
+
+def parse_events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@patch("app.services.summary_pipeline.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(BOOK_TEXT, None))
+@patch("app.services.summary_pipeline.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+def test_stream_summary_emits_progress_then_tokens(mock_book, mock_text):
+    """Test that progress events come first, then tokens, then the full response."""
+    ollama_client = httpx.AsyncClient(transport=httpx.MockTransport(fake_ollama))
+    with patch("app.services.llm_backends.get_ollama_client", return_value=ollama_client):
+        response = client.post("/api/summarize/stream", json={"book_id": 12, "page_number": 3})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    kinds = [kind for kind, _ in events]
+
+    progress_stages = [data["stage"] for kind, data in events if kind == "progress"]
+    assert progress_stages == ["metadata", "download", "pagination", "front_matter", "summary"]
+    assert kinds.index("token") > kinds.index("progress")
+    assert [data["text"] for kind, data in events if kind == "token"] == TOKENS
+    assert events[-1][0] == "done"
+    assert events[-1][1]["summary"] == "".join(TOKENS)
+    assert events[-1][1]["book_title"] == "Streamed Book"
+
+    # The streamed summary is cached like any other
+    cached = parse_events(client.post("/api/summarize/stream", json={"book_id": 12, "page_number": 3}).text)
+    assert cached[-1][1]["cached"] is True
+    assert [data["text"] for kind, data in cached if kind == "token"] == ["".join(TOKENS)]
+
+
+@patch("app.services.summary_pipeline.BookService.get_book_by_id", new_callable=AsyncMock, return_value={"id": 13, "formats": {}})
+def test_stream_summary_reports_errors(mock_book):
+    """Test that pipeline failures end the stream with an error event."""
+    events = parse_events(client.post("/api/summarize/stream", json={"book_id": 13, "page_number": 3}).text)
+    assert events[-1][0] == "error"
+    assert "No plain text format" in events[-1][1]["detail"]
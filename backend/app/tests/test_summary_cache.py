@@ -0,0 +1,151 @@
+import time
+import httpx
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services.llm_backends import FakeBackend
+from app.services.summary_cache import SummaryCache, SummaryKey
+from app.services.summary_pipeline import SummaryPipeline
+from app.services.text_cache import get_text_cache
+
+client = TestClient(app)
+
+BOOK = {
+    "id": 11,
+    "title": "Test Book",
+    "authors": [{"name": "Test Author"}],
+    "formats": {"text/plain": "http://example.com/11.txt"},
+}
+BOOK_TEXT = "PREFACE\n\n" + "It was a dark and stormy night. " * 400
+
+
+def make_key(**overrides):
+    fields = dict(book_id=1, start_page=2, page_number=10, model="llama2", prompt_version="abc", max_chars_per_page=3000,
+                  text_digest="ab12")
+    fields.update(overrides)
+    return SummaryKey(**fields)
+
+
+class TestSummaryCache:
+    def test_put_get_and_key_fields(self, tmp_path):
+        """Test that every key field distinguishes cached summaries."""
+        cache = SummaryCache(str(tmp_path / "s.sqlite3"))
+        cache.put(make_key(), "summary")
+
+        assert cache.get(make_key()) == "summary"
+        assert cache.get(make_key(model="llama3")) is None
+        assert cache.get(make_key(prompt_version="def")) is None
+        assert cache.get(make_key(page_number=11)) is None
+        assert cache.stats == {"hits": 1, "misses": 3, "evictions": 0}
+
+    def test_lru_eviction_and_expiry(self, tmp_path):
+        """Test that the least recently used summary is evicted beyond max_entries."""
+        cache = SummaryCache(str(tmp_path / "s.sqlite3"), max_entries=2)
+        cache.put(make_key(page_number=1), "one")
+        cache.put(make_key(page_number=2), "two")
+        cache.get(make_key(page_number=1))
+        cache.put(make_key(page_number=3), "three")
+
+        assert cache.get(make_key(page_number=2)) is None
+        assert cache.get(make_key(page_number=1)) == "one"
+        assert cache.stats["evictions"] == 1
+
+        expiring = SummaryCache(str(tmp_path / "e.sqlite3"), max_age=0.001)
+        expiring.put(make_key(), "old")
+        time.sleep(0.01)
+        assert expiring.get(make_key()) is None
+
+    def test_segments_and_content_starts_are_pruned(self, tmp_path):
+        """Test that segment summaries and start pages get the same LRU eviction and expiry as summaries."""
+        cache = SummaryCache(str(tmp_path / "s.sqlite3"), max_entries=2)
+        cache.put_segment(make_key(), 5, 5, "to 5")
+        cache.put_segment(make_key(), 5, 10, "to 10")
+        cache.get_latest_segment(make_key(page_number=7), 5)
+        cache.put_segment(make_key(), 5, 15, "to 15")
+        assert cache.get_latest_segment(make_key(page_number=14), 5) == (5, "to 5")
+        assert cache.get_latest_segment(make_key(page_number=20), 5) == (15, "to 15")
+
+        for book_id in (1, 2):
+            cache.set_content_start(book_id, "llama2", "abc", 3000, "ab12", book_id + 1)
+        cache.get_content_start(1, "llama2", "abc", 3000, "ab12")
+        cache.set_content_start(3, "llama2", "abc", 3000, "ab12", 4)
+        assert cache.get_content_start(2, "llama2", "abc", 3000, "ab12") is None
+        assert cache.get_content_start(1, "llama2", "abc", 3000, "ab12") == 2
+        assert cache.stats["evictions"] == 2
+
+        # A fixed clock, so the new entries cannot expire before the count is checked
+        now = [1000.0]
+        with patch.object(time, "time", lambda: now[0]):
+            expiring = SummaryCache(str(tmp_path / "e.sqlite3"), max_age=60)
+            expiring.put_segment(make_key(), 5, 5, "old")
+            expiring.set_content_start(1, "llama2", "abc", 3000, "ab12", 2)
+            now[0] += 61
+            assert expiring.get_latest_segment(make_key(), 5) is None
+            assert expiring.get_content_start(1, "llama2", "abc", 3000, "ab12") is None
+            expiring.put_segment(make_key(book_id=2), 5, 5, "new")
+            expiring.set_content_start(2, "llama2", "abc", 3000, "ab12", 2)
+        assert expiring.stats["evictions"] == 2
+
+    def test_invalidate_by_book(self, tmp_path):
+        """Test that invalidation only removes the requested book."""
+        cache = SummaryCache(str(tmp_path / "s.sqlite3"))
+        cache.put(make_key(book_id=1), "one")
+        cache.put(make_key(book_id=2), "two")
+        cache.set_content_start(1, "llama2", "abc", 3000, "ab12", 4)
+
+        assert cache.invalidate(book_id=1) == 1
+        assert cache.get(make_key(book_id=1)) is None
+        assert cache.get(make_key(book_id=2)) == "two"
+        assert cache.get_content_start(1, "llama2", "abc", 3000, "ab12") is None
+
+
+@patch("app.services.summary_pipeline.LLMService.summarize_text", new_callable=AsyncMock, return_value="A summary.")
+@patch("app.services.summary_pipeline.LLMService.get_page_number", new_callable=AsyncMock, return_value="Page 2")
+@patch("app.services.summary_pipeline.BookService.fetch_book_text", new_callable=AsyncMock, return_value=(BOOK_TEXT, None))
+@patch("app.services.summary_pipeline.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+def test_repeated_summarize_is_served_from_cache(mock_book, mock_text, mock_page_number, mock_summarize):
+    """Test that an identical request skips both LLM calls and reports cached=True."""
+    request = {"book_id": 11, "page_number": 4, "include_original_text": True}
+    first = client.post("/api/summarize", json=request)
+    second = client.post("/api/summarize", json=request)
+
+    assert first.status_code == 200
+    assert first.json()["cached"] is False
+    assert second.json()["cached"] is True
+    assert second.json()["summary"] == "A summary."
+    assert second.json()["original_text"] == first.json()["original_text"]
+    mock_page_number.assert_awaited_once()
+    mock_summarize.assert_awaited_once()
+
+    assert client.delete("/api/summaries", params={"book_id": 11}).json() == {"deleted": 1}
+    assert client.post("/api/summarize", json={"book_id": 11, "page_number": 4}).json()["cached"] is False
+
+
+@pytest.mark.asyncio
+@patch("app.services.summary_pipeline.BookService.get_book_by_id", new_callable=AsyncMock, return_value=BOOK)
+async def test_summaries_are_keyed_by_text(mock_book):
+    """Test that a custom text_url or a changed text never gets the summaries of another text."""
+    texts = {
+        "http://example.com/11.txt": BOOK_TEXT,
+        "http://elsewhere/11.txt": "PREFACE\n\n" + "A different story altogether. " * 400,
+    }
+
+    def handler(request):
+        return httpx.Response(200, text=texts[str(request.url)], headers={"Content-Type": "text/plain; charset=utf-8"})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    with patch("app.services.book_service.get_gutenberg_client", return_value=client), \
+            patch("app.services.llm_service.get_llm_backend", return_value=FakeBackend("llama2")):
+        first = await SummaryPipeline(11, 4).run()
+        custom = await SummaryPipeline(11, 4, text_url="http://elsewhere/11.txt").run()
+        assert not custom["cached"] and custom["summary"] != first["summary"]
+        again = await SummaryPipeline(11, 4).run()
+        assert again["cached"] and again["summary"] == first["summary"]
+
+        # A new edition downloaded on revalidation is summarized afresh
+        texts["http://example.com/11.txt"] = "PREFACE\n\n" + "It was a bright cold day in April. " * 400
+        get_text_cache().revalidate_after = 0
+        revised = await SummaryPipeline(11, 4).run()
+        assert not revised["cached"] and revised["summary"] != first["summary"]
+    await client.aclose()
@@ -0,0 +1,184 @@
+import os
+import threading
+import httpx
+import pytest
+from app.services import text_cache
+from app.services.book_service import BookService
+from app.services.text_cache import TextCache, cache_key
+
+BOOK_TEXT = b"CHAPTER 1. Loomings\n\nCall me Ishmael. " * 200
+
+
+class FakeGutenberg:
+    """Local HTTP stand-in for the Gutenberg text mirror"""
+
+    def __init__(self, body: bytes = BOOK_TEXT, etag: str = '"v1"'):
+        self.body = body
+        self.etag = etag
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.headers.get("If-None-Match") == self.etag:
+            return httpx.Response(304, headers={"ETag": self.etag})
+        return httpx.Response(
+            200,
+            content=self.body,
+            headers={"ETag": self.etag, "Content-Type": "text/plain; charset=utf-8"},
+        )
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+class TestTextCache:
+    @pytest.mark.asyncio
+    async def test_miss_then_hit(self, tmp_path):
+        """Test that a second fetch is served from disk through mmap."""
+        server = FakeGutenberg()
+        cache = TextCache(str(tmp_path))
+        key = cache_key(1, "text/plain; charset=utf-8", "http://example.com/1.txt")
+
+        async with server.client() as client:
+            with await cache.fetch(key, "http://example.com/1.txt", client) as cached:
+                assert cached.cache_status == "miss"
+                assert cached.decode() == BOOK_TEXT.decode()
+            with await cache.fetch(key, "http://example.com/1.txt", client) as cached:
+                assert cached.cache_status == "hit"
+                assert cached.data[:9] == b"CHAPTER 1"
+
+        assert len(server.requests) == 1
+        assert cache.stats["misses"] == 1
+        assert cache.stats["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_revalidation_with_etag(self, tmp_path):
+        """Test that stale entries are revalidated with If-None-Match."""
+        server = FakeGutenberg()
+        cache = TextCache(str(tmp_path), revalidate_after=0)
+
+        async with server.client() as client:
+            (await cache.fetch("k", "http://example.com/1.txt", client)).close()
+            with await cache.fetch("k", "http://example.com/1.txt", client) as cached:
+                assert cached.cache_status == "revalidated"
+                assert len(cached) == len(BOOK_TEXT)
+
+            server.body, server.etag = b"A new edition.", '"v2"'
+            with await cache.fetch("k", "http://example.com/1.txt", client) as cached:
+                assert cached.cache_status == "miss"
+                assert cached.decode() == "A new edition."
+
+        assert server.requests[1].headers["If-None-Match"] == '"v1"'
+        assert cache.stats["revalidated"] == 1
+
+    @pytest.mark.asyncio
+    async def test_stale_copy_served_when_upstream_fails(self, tmp_path):
+        """Test that a cached text is served when revalidation fails."""
+        cache = TextCache(str(tmp_path), revalidate_after=0)
+        async with FakeGutenberg().client() as client:
+            (await cache.fetch("k", "http://example.com/1.txt", client)).close()
+
+        def unavailable(request):
+            raise httpx.ConnectError("offline", request=request)
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(unavailable)) as client:
+            with await cache.fetch("k", "http://example.com/1.txt", client) as cached:
+                assert cached.cache_status == "stale"
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self, tmp_path):
+        """Test that the least recently used text is evicted when over the size limit."""
+        cache = TextCache(str(tmp_path), max_bytes=len(BOOK_TEXT) * 2 + 10)
+        for book_id in range(3):
+            server = FakeGutenberg(body=BOOK_TEXT + str(book_id).encode())
+            async with server.client() as client:
+                (await cache.fetch(f"book-{book_id}", "http://example.com/t.txt", client)).close()
+                if book_id == 1:
+                    # Touch book 0 so book 1 becomes the least recently used
+                    os.utime(cache._blob_path(cache._load_entry("book-0")["digest"]), (0, 1))
+                    cache.get("book-0").close()
+
+        assert cache.stats["evictions"] == 1
+        assert cache.get("book-0") is not None
+        assert cache.get("book-1") is None
+        assert cache.get("book-2") is not None
+
+    @pytest.mark.asyncio
+    async def test_disk_work_runs_off_the_event_loop(self, tmp_path, monkeypatch):
+        """Test that storing a download and evicting happen in worker threads, not on the event loop."""
+        cache = TextCache(str(tmp_path))
+        threads = []
+        evict = cache.evict
+        write = text_cache._atomic_write
+
+        def record_evict(keep=None):
+            threads.append(threading.get_ident())
+            return evict(keep)
+
+        def record_write(path, data):
+            threads.append(threading.get_ident())
+            write(path, data)
+
+        monkeypatch.setattr(cache, "evict", record_evict)
+        monkeypatch.setattr(text_cache, "_atomic_write", record_write)
+        async with FakeGutenberg().client() as client:
+            (await cache.fetch("k", "http://example.com/1.txt", client)).close()
+        assert len(threads) == 2 and threading.get_ident() not in threads
+
+    def test_derived_files_count_toward_the_limit(self, tmp_path):
+        """Test that a blob's derived files count toward max_bytes and are evicted with it."""
+        cache = TextCache(str(tmp_path), max_bytes=len(BOOK_TEXT) * 2 + 10)
+        for digest, mtime in (("ab" * 32, 1), ("cd" * 32, 2)):
+            path = cache._blob_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(BOOK_TEXT)
+            os.utime(path, (mtime, mtime))
+        assert cache.evict() == 0
+
+        # The compacted text of the newer blob takes the cache over its limit
+        with open(cache._compacted_text_path("cd" * 32, 500), "wb") as f:
+            f.write(BOOK_TEXT)
+        assert cache.evict() == 1
+        assert not os.path.exists(cache._blob_path("ab" * 32))
+        assert os.path.exists(cache._compacted_text_path("cd" * 32, 500))
+        assert cache.evict() == 0
+
+    def test_concurrent_eviction(self, tmp_path, monkeypatch):
+        """Test that a blob another worker evicts first is skipped, not an error."""
+        cache = TextCache(str(tmp_path), max_bytes=len(BOOK_TEXT) + 10)
+        other = TextCache(str(tmp_path), max_bytes=len(BOOK_TEXT) + 10)
+        for digest, mtime in (("ab" * 32, 1), ("cd" * 32, 2)):
+            path = cache._blob_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(BOOK_TEXT)
+            with open(f"{path}.pages-500", "wb") as f:
+                f.write(b"index")
+            os.utime(path, (mtime, mtime))
+
+        listdir = os.listdir
+
+        def race_then_listdir(path):
+            # The other worker evicts after this worker chose its blob, before it unlinks anything
+            monkeypatch.setattr(os, "listdir", listdir)
+            assert other.evict() == 1
+            return listdir(path)
+
+        monkeypatch.setattr(os, "listdir", race_then_listdir)
+        assert cache.evict() == 0
+        assert cache.stats["evictions"] == 0
+        assert not os.path.exists(cache._blob_path("ab" * 32))
+        assert os.path.exists(cache._blob_path("cd" * 32))
+
+    def test_page_index_stored_next_to_text(self, tmp_path, monkeypatch):
+        """Test that page indexes are persisted per text digest."""
+        cache = TextCache(str(tmp_path))
+        monkeypatch.setattr("app.services.book_service.get_text_cache", lambda: cache)
+        text = BOOK_TEXT.decode()
+        os.makedirs(os.path.dirname(cache._blob_path("ab" * 32)), exist_ok=True)
+
+        page_index = BookService.get_page_index(text, 500, digest="ab" * 32)
+
+        assert cache.load_page_index("ab" * 32, 500) is not None
+        assert list(BookService.get_page_index(text, 500, digest="ab" * 32).offsets) == list(page_index.offsets)
@@ -0,0 +1,85 @@
+import pytest
+from app.services.book_service import BookService
+from app.services.llm_backends import FakeBackend
+from app.services.llm_service import SUMMARY_PROMPT, LLMService
+from app.services.page_index import PageIndex
+from app.services.summary_pipeline import SummaryPipeline
+from app.services.tokens import HeuristicTokenizer, context_window, count_page_tokens
+
+SAMPLE_TEXT = ("The rain fell in torrents, and the crew sailed on. " * 40 + "\n\n") * 30
+
+
+class TestTokenEstimates:
+    def test_heuristic_counts_words_and_punctuation(self):
+        tokenizer = HeuristicTokenizer()
+        assert tokenizer.count("") == 0
+        assert tokenizer.count("one two three four") == 6
+        assert tokenizer.count("Hello, world!") == 3 + 2
+
+    def test_context_window_lookup(self):
+        assert context_window("llama2", override=0) == 4096
+        assert context_window("llama3.1:8b-instruct", override=0) == 131072
+        assert context_window("library/mistral:7b", override=0) == 32768
+        assert context_window("unknown-model", override=0) == 4096
+        # Replicas are limited by the smallest window
+        assert context_window("llama3.1,llama2", override=0) == 4096
+        assert context_window("llama2", override=16384) == 16384
+
+    def test_page_tokens_are_range_sums(self):
+        index = BookService.build_page_index(SAMPLE_TEXT, 500)
+        counts = count_page_tokens(SAMPLE_TEXT, index, HeuristicTokenizer())
+        index.set_page_tokens(counts, "heuristic-v1")
+
+        assert index.has_tokens("heuristic-v1") and not index.has_tokens("other")
+        assert index.page_tokens(1, len(index)) == sum(counts)
+        assert index.page_tokens(3, 5) == sum(counts[2:5])
+        assert index.page_tokens(10_000, 10_001) == 0
+        assert index.max_page_tokens() == max(counts)
+
+        last = index.pages_within(3, sum(counts[2:6]))
+        assert last == 6
+        assert index.pages_within(3, sum(counts[2:6]) - 1) == 5
+        assert index.pages_within(3, 0) == 2
+        assert index.pages_within(1, 10 ** 9) == len(index)
+
+    def test_token_estimates_survive_serialisation(self):
+        index = BookService.build_page_index(SAMPLE_TEXT, 500)
+        index.set_page_tokens(count_page_tokens(SAMPLE_TEXT, index, HeuristicTokenizer()), "heuristic-v1")
+
+        loaded = PageIndex.from_bytes(index.to_bytes())
+        assert loaded.tokenizer == "heuristic-v1"
+        assert list(loaded.token_totals) == list(index.token_totals)
+
+        with pytest.raises(ValueError):
+            index.set_page_tokens([1, 2], "heuristic-v1")
+
+
+class TestPromptBudget:
+    def test_budget_reserves_response_and_template(self):
+        service = LLMService(FakeBackend("llama2"))
+        assert service.context_tokens == 4096
+        assert 0 < service.prompt_budget(SUMMARY_PROMPT, max_tokens=500) < 4096 - 500
+
+    @pytest.mark.asyncio
+    async def test_full_mode_switches_to_map_reduce_when_too_long(self):
+        """Test that a page range beyond the context window is chunked instead of sent whole."""
+        pipeline = SummaryPipeline(1, 200)
+        pipeline.llm_service = LLMService(FakeBackend("llama2"))
+        pipeline.book_text = SAMPLE_TEXT * 4
+        pipeline.page_index = BookService.get_page_index(pipeline.book_text, 3000)
+        assert not pipeline.fits_in_prompt()
+
+        summary, _, stages = await pipeline.summarize()
+        assert pipeline.mode == "map_reduce"
+        assert [stage["stage"] for stage in stages][0] == "map"
+        assert stages[0]["calls"] > 1
+        budget = pipeline.llm_service.prompt_budget(SUMMARY_PROMPT)
+        assert all(HeuristicTokenizer().count(prompt) <= budget + 200 for prompt in pipeline.llm_service.backend.prompts)
+
+        # A short range still goes out as one prompt
+        short = SummaryPipeline(1, 2)
+        short.llm_service = pipeline.llm_service
+        short.book_text, short.page_index = pipeline.book_text, pipeline.page_index
+        assert short.fits_in_prompt()
+        await short.summarize()
+        assert short.mode == "full"
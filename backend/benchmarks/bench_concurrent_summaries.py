@@ -0,0 +1,85 @@
+"""
+Measure /api/books latency while summaries are running on the same worker.
+
+Run from the backend directory:
+    python -m benchmarks.bench_concurrent_summaries --summaries 8 --llm-latency 1.0
+
+The app is driven in-process on a single event loop (one uvicorn worker
+equivalent), with gutendex, the text mirror and Ollama replaced by a local
+stub server. If any pipeline stage blocked the event loop, the /api/books
+latency under load would grow with the LLM latency instead of staying flat.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.stubs import StubConfig, StubServer
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+async def _probe_books(client, duration: float, interval: float):
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get("/api/books")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def _run(args) -> None:
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=300.0) as client:
+        idle = await _probe_books(client, duration=1.0, interval=0.05)
+
+        start = time.perf_counter()
+        summaries = [
+            asyncio.create_task(client.post("/api/summarize", json={"book_id": i + 1, "page_number": 5}))
+            for i in range(args.summaries)
+        ]
+        loaded = await _probe_books(client, duration=args.llm_latency * 2, interval=0.05)
+        responses = await asyncio.gather(*summaries)
+        elapsed = time.perf_counter() - start
+
+    failed = [r for r in responses if r.status_code != 200]
+    print(f"summaries: {len(responses)} ({len(failed)} failed) in {elapsed:.2f}s")
+    print(f"serial lower bound for summaries: {args.summaries * 2 * args.llm_latency:.2f}s")
+    for name, values in (("idle", idle), ("under load", loaded)):
+        print(
+            f"/api/books {name:>10}: n={len(values)} "
+            f"p50={_percentile(values, 50) * 1000:.1f}ms "
+            f"p95={_percentile(values, 95) * 1000:.1f}ms "
+            f"mean={statistics.mean(values) * 1000:.1f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--summaries", type=int, default=8, help="Concurrent /api/summarize requests")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Stub Ollama latency per call (s)")
+    parser.add_argument("--book-size", type=int, default=500_000, help="Synthetic book size in characters")
+    args = parser.parse_args()
+
+    config = StubConfig(gutendex_latency=0.02, text_latency=0.05, llm_latency=args.llm_latency, book_size=args.book_size)
+    with StubServer(config) as stub, tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["CACHE_DIR"] = cache_dir
+        os.environ["GUTENBERG_API_URL"] = f"{stub.url}/books/"
+        os.environ["OLLAMA_HOST"] = stub.url
+        asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
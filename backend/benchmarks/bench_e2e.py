@@ -0,0 +1,266 @@
+"""
+End-to-end benchmark of the API against local stand-ins for gutendex and Ollama.
+
+Run from the backend directory:
+    python -m benchmarks.bench_e2e
+    python -m benchmarks.bench_e2e --output benchmarks/baselines/e2e.json
+    python -m benchmarks.bench_e2e --baseline benchmarks/baselines/e2e.json
+
+The stub server (gutendex, the Gutenberg text mirror and Ollama, with the
+configured latencies and token rate) runs in a child process. The app is
+driven in-process, like a single uvicorn worker, at each --concurrency
+level with these scenarios:
+
+    books           GET /api/books over a few pages and searches
+    book            GET /api/books/{id}
+    summarize_cold  POST /api/summarize for book/page pairs not seen before
+                    (downloads, pagination and LLM calls)
+    summarize_warm  the same summaries again (served from the caches)
+
+For every scenario and level it reports p50/p95/p99 latency, throughput
+and the peak RSS of the app process. --output saves the results as JSON.
+--baseline compares against saved results and exits with status 1 when
+p95 latency or throughput is worse than the baseline by more than
+--tolerance. Commit a new baseline with any change that is expected to
+move the numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.stubs import StubConfig, StubProcess
+
+SCENARIOS = ("books", "book", "summarize_cold", "summarize_warm")
+SEARCHES = (None, "voyage", "sea", "captain")
+# Book/page pairs for summaries: every cold request is new to the caches
+PAGES_PER_BOOK = 4
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values"""
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No /proc (macOS): fall back to the lifetime peak
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Samples the resident set size of this process on a background thread"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = _rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def summary_request(index: int) -> Dict[str, int]:
+    return {"book_id": 1 + index // PAGES_PER_BOOK, "page_number": 2 + index % PAGES_PER_BOOK}
+
+
+async def run_level(
+    send: Callable[[int], Any], concurrency: int, requests: int, first: int = 0
+) -> Dict[str, float]:
+    """
+    Send requests numbered first..first+requests with `concurrency` in flight
+
+    Args:
+        send: Coroutine function sending request number i and returning the response
+        concurrency: Requests in flight at once
+        requests: Number of requests
+        first: Number of the first request
+
+    Returns:
+        Latency percentiles (ms), throughput (requests/s), errors and peak RSS (MB)
+    """
+    latencies: List[float] = []
+    errors = 0
+    numbers = iter(range(first, first + requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for number in numbers:
+            start = time.perf_counter()
+            response = await send(number)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "throughput_rps": round(requests / elapsed, 2),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Dict[str, Dict[str, float]]]:
+    import httpx
+    from app.main import app
+
+    results: Dict[str, Dict[str, Dict[str, float]]] = {scenario: {} for scenario in args.scenarios}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=300.0) as client:
+        senders: Dict[str, Callable[[int], Any]] = {
+            "books": lambda i: client.get("/api/books", params={
+                "page": 1 + i % 3, **({"search": SEARCHES[i % len(SEARCHES)]} if SEARCHES[i % len(SEARCHES)] else {})
+            }),
+            "book": lambda i: client.get(f"/api/books/{1 + i % args.books}"),
+            "summarize_cold": lambda i: client.post("/api/summarize", json=summary_request(i)),
+            "summarize_warm": lambda i: client.post("/api/summarize", json=summary_request(i)),
+        }
+        # Cold summaries never repeat a book/page pair; warm ones replay the cold ones
+        cold_sent = 0
+        for concurrency in args.concurrency:
+            for scenario in args.scenarios:
+                first = 0
+                if scenario == "summarize_cold":
+                    first, cold_sent = cold_sent, cold_sent + args.requests
+                elif scenario == "summarize_warm":
+                    if not cold_sent:
+                        await run_level(senders["summarize_cold"], concurrency, args.requests)
+                        cold_sent = args.requests
+                    first = max(cold_sent - args.requests, 0)
+                result = await run_level(senders[scenario], concurrency, args.requests, first)
+                results[scenario][str(concurrency)] = result
+                print(
+                    f"{scenario:<15} c={concurrency:<3} p50={result['p50_ms']:8.1f}ms p95={result['p95_ms']:8.1f}ms "
+                    f"p99={result['p99_ms']:8.1f}ms {result['throughput_rps']:8.1f} req/s "
+                    f"rss={result['peak_rss_mb']:6.1f}MB errors={result['errors']}"
+                )
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float, min_delta_ms: float) -> List[str]:
+    """
+    List the scenario/level pairs that regressed against a baseline
+
+    Sub-millisecond requests vary by more than any sensible tolerance from run
+    to run, so a change only counts when p95 also moved by min_delta_ms, and
+    throughput is only compared for requests that take at least that long.
+
+    Returns:
+        One line per regression (empty when none regressed)
+    """
+    regressions = []
+    for scenario, levels in results.items():
+        for level, result in levels.items():
+            before = baseline.get("results", {}).get(scenario, {}).get(level)
+            if before is None:
+                continue
+            p95_change = result["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+            throughput_change = result["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+            print(f"{scenario:<15} c={level:<3} p95 {p95_change:+7.1%}  throughput {throughput_change:+7.1%}")
+            if p95_change > tolerance and result["p95_ms"] - before["p95_ms"] > min_delta_ms:
+                regressions.append(f"{scenario} c={level}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+            if throughput_change < -tolerance and before["p50_ms"] >= min_delta_ms:
+                regressions.append(
+                    f"{scenario} c={level}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario and level")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--books", type=int, default=8, help="Distinct books for the book scenario")
+    parser.add_argument("--gutendex-latency", type=float, default=0.02, help="Stub gutendex latency (s)")
+    parser.add_argument("--text-latency", type=float, default=0.05, help="Stub text mirror latency (s)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Stub Ollama latency before the first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200, help="Stub Ollama generation rate")
+    parser.add_argument("--book-size", type=int, default=300_000, help="Synthetic book size in characters")
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--baseline", help="Compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed regression against the baseline (0.5 = 50%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore p95 changes smaller than this")
+    args = parser.parse_args(argv)
+
+    settings = {
+        key: getattr(args, key)
+        for key in ("concurrency", "requests", "books", "gutendex_latency", "text_latency",
+                    "llm_latency", "llm_tokens_per_second", "book_size")
+    }
+    config = StubConfig(
+        gutendex_latency=args.gutendex_latency,
+        text_latency=args.text_latency,
+        llm_latency=args.llm_latency,
+        llm_tokens_per_second=args.llm_tokens_per_second,
+        book_size=args.book_size,
+    )
+    with StubProcess(config) as stub, tempfile.TemporaryDirectory() as cache_dir:
+        # The app reads its settings at import time, in run_benchmark
+        os.environ.update({
+            "CACHE_DIR": cache_dir,
+            "GUTENBERG_API_URL": f"{stub.url}/books/",
+            "LLM_BACKEND": "ollama",
+            "OLLAMA_HOST": stub.url,
+            "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+        })
+        results = asyncio.run(run_benchmark(args))
+
+    report = {
+        "settings": settings,
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Saved results to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != settings:
+            print("Warning: the baseline was recorded with different settings")
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
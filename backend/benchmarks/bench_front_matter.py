@@ -0,0 +1,72 @@
+"""
+Compare front-matter detection against the LLM-only path.
+
+Run from the backend directory:
+    python -m benchmarks.bench_front_matter
+    python -m benchmarks.bench_front_matter --ollama-host http://localhost:11434
+
+For each book in the synthetic corpus this reports whether the deterministic
+detector found the right start page, its latency, and the prompt size of the
+LLM-only path (the whole paginated book). With --ollama-host the LLM-only path
+is also run against a real Ollama to compare its accuracy and latency.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app.services.book_service import BookService
+from app.services.front_matter import detect_content_start, parse_page_number
+from app.services.map_reduce import estimate_tokens
+from benchmarks.front_matter_corpus import make_corpus
+
+MAX_CHARS_PER_PAGE = 3000
+
+
+async def _llm_only(pagified_book_text: str):
+    from app.services.llm_service import LLMService
+
+    start = time.perf_counter()
+    response = await LLMService().get_page_number(pagified_book_text)
+    return parse_page_number(response), time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ollama-host", help="Also run the LLM-only path against this Ollama host")
+    parser.add_argument("--chapter-chars", type=int, default=20_000, help="Characters per synthetic chapter")
+    args = parser.parse_args()
+    if args.ollama_host:
+        os.environ["OLLAMA_HOST"] = args.ollama_host
+
+    detector_correct = llm_correct = 0
+    corpus = make_corpus(chapter_chars=args.chapter_chars)
+    for name, text, true_offset in corpus:
+        page_index = BookService.build_page_index(text, MAX_CHARS_PER_PAGE)
+        true_page = page_index.page_for_offset(true_offset)
+
+        start = time.perf_counter()
+        detected = detect_content_start(text)
+        detector_seconds = time.perf_counter() - start
+        detected_page = page_index.page_for_offset(detected.offset)
+        detector_correct += detected_page == true_page
+
+        pagified_book_text = BookService.paginate_text(text, MAX_CHARS_PER_PAGE, page_index)
+        line = (
+            f"{name:<26} true={true_page:<3} detector={detected_page:<3} "
+            f"conf={detected.confidence:.1f} {detector_seconds * 1000:6.2f}ms  "
+            f"llm_prompt~{estimate_tokens(pagified_book_text):>7} tokens"
+        )
+        if args.ollama_host:
+            llm_page, llm_seconds = asyncio.run(_llm_only(pagified_book_text))
+            llm_correct += llm_page == true_page
+            line += f"  llm={llm_page:<3} {llm_seconds:6.2f}s"
+        print(line)
+
+    print(f"detector accuracy: {detector_correct}/{len(corpus)}")
+    if args.ollama_host:
+        print(f"LLM-only accuracy: {llm_correct}/{len(corpus)}")
+
+
+if __name__ == "__main__":
+    main()
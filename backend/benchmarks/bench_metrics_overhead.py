@@ -0,0 +1,112 @@
+"""
+Benchmark the overhead of the request metrics.
+
+Run from the backend directory:
+    python -m benchmarks.bench_metrics_overhead --rounds 40
+
+Serves POST /api/summarize in-process (httpx ASGITransport) from a warm
+summary cache, the fastest path and so the one where instrumentation weighs
+most, with metrics enabled and disabled. It also times the instrumentation a
+request performs (stage timers, size and cache records, the request
+histogram) on its own, and reports that as a share of a cached request and of
+a request waiting --llm-latency seconds on the LLM. The target is under 1%.
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from unittest.mock import patch
+
+import httpx
+
+from app.main import app
+from app.services import metrics, summary_cache
+from app.services.book_service import BookService
+from app.services.llm_backends import FakeBackend
+from benchmarks.stubs import make_book_text
+
+BOOK = {
+    "id": 1,
+    "title": "Benchmark Book",
+    "authors": [{"name": "Bench"}],
+    "formats": {"text/plain": "http://example.com/1.txt"},
+}
+
+
+def instrumentation_seconds(repeat: int) -> float:
+    """Time the metrics calls one summary request makes, without the request"""
+    timings = metrics.RequestTimings()
+    token = metrics._current.set(timings)
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for stage in ("metadata", "download", "pagination", "front_matter", "summary"):
+                with metrics.timed(stage):
+                    pass
+            metrics.record_cache("metadata", "hit", stage="metadata")
+            metrics.record_cache("content_start", "hit", stage="front_matter")
+            metrics.record_cache("summary", "hit", stage="summary")
+            for kind in ("bytes", "book_pages", "pages", "tokens"):
+                metrics.record_size(kind, 1000)
+            metrics.REQUEST_SECONDS.observe(0.001, "POST", "/api/summarize", "200")
+            timings.server_timing(0.001)
+            timings.stages.clear()
+        return (time.perf_counter() - start) / repeat
+    finally:
+        metrics._current.reset(token)
+
+
+async def request_seconds(requests: int, enabled: bool) -> float:
+    """Mean latency of cached summary requests with metrics enabled or disabled"""
+    with patch.object(metrics, "METRICS_ENABLED", enabled):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            payload = {"book_id": 1, "page_number": 2}
+            assert (await client.post("/api/summarize", json=payload)).status_code == 200
+            start = time.perf_counter()
+            for _ in range(requests):
+                await client.post("/api/summarize", json=payload)
+            return (time.perf_counter() - start) / requests
+
+
+async def run(args: argparse.Namespace) -> None:
+    text = make_book_text(200_000, chapters=10)
+
+    async def get_book_by_id(book_id):
+        return BOOK
+
+    async def fetch_book_text(text_url, book_id=None, format_type="text/plain"):
+        return text, None
+
+    with tempfile.TemporaryDirectory() as cache_dir, \
+            patch.object(summary_cache, "_summary_cache", summary_cache.SummaryCache(f"{cache_dir}/summaries.sqlite3")), \
+            patch.object(BookService, "get_book_by_id", get_book_by_id), \
+            patch.object(BookService, "fetch_book_text", fetch_book_text), \
+            patch("app.services.llm_service.get_llm_backend", return_value=FakeBackend("llama2")):
+        # Alternate short rounds so drift (warm-up, CPU frequency) does not favour one side
+        # (and swap which goes first, as the second round of a pair tends to run slower)
+        results = {False: [], True: []}
+        for round_number in range(args.rounds):
+            for enabled in (False, True) if round_number % 2 else (True, False):
+                results[enabled].append(await request_seconds(args.requests, enabled))
+        disabled, enabled = results[False], results[True]
+
+    off, on = statistics.median(disabled), statistics.median(enabled)
+    cost = instrumentation_seconds(10_000)
+    print(f"cached request, metrics off: {off * 1e6:8.1f}us")
+    print(f"cached request, metrics on:  {on * 1e6:8.1f}us  ({(on - off) / off * 100:+.2f}% end to end)")
+    print(f"instrumentation per request: {cost * 1e6:8.1f}us  ({cost / off * 100:.2f}% of a cached request)")
+    print(f"with {args.llm_latency}s of LLM time:    {cost / (off + args.llm_latency) * 100:.4f}% of a request")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per round")
+    parser.add_argument("--rounds", type=int, default=20, help="Rounds per setting (the median is reported)")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="Typical LLM call time, in seconds")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark BookService pagination on large synthetic books.
+
+Run from the backend directory:
+    python -m benchmarks.bench_paginate --sizes 1 10 50
+
+Reports full-book pagination time for each size, plus the cost of lazily
+paginating only up to page 100 with iter_pages.
+"""
+import argparse
+import itertools
+import time
+
+from app.services.book_service import BookService
+from benchmarks.stubs import make_book_text
+
+MAX_CHARS_PER_PAGE = 3000
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50], help="Book sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement (best is reported)")
+    args = parser.parse_args()
+
+    for size_mb in args.sizes:
+        text = make_book_text(size_mb * 1_000_000, chapters=max(size_mb * 20, 20))
+        full = _best_of(lambda: BookService.paginate_text(text, MAX_CHARS_PER_PAGE), args.repeat)
+        bounds = _best_of(lambda: sum(1 for _ in BookService.iter_page_bounds(text, MAX_CHARS_PER_PAGE)), args.repeat)
+        lazy = _best_of(lambda: list(itertools.islice(BookService.iter_pages(text, MAX_CHARS_PER_PAGE), 100)), args.repeat)
+        pages = sum(1 for _ in BookService.iter_page_bounds(text, MAX_CHARS_PER_PAGE))
+        print(
+            f"{size_mb:>4} MB  pages={pages:>6}  "
+            f"paginate_text={full * 1000:8.1f}ms  "
+            f"page_bounds={bounds * 1000:8.1f}ms  "
+            f"first_100_pages={lazy * 1000:6.2f}ms  "
+            f"({len(text) / full / 1e6:.0f} MB/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark the size and serialization time of summary responses.
+
+Run from the backend directory:
+    python -m benchmarks.bench_response_size --pages 20 200 1000
+
+For each requested page, compares a SummaryResponse carrying the summarized
+text inline (include_original_text) with the default response that links to
+GET /api/books/{id}/pages instead: JSON bytes, gzip bytes (as sent by the
+GZip middleware), and the time to validate and serialize the response and
+to compress it.
+"""
+import argparse
+import gzip
+import time
+
+from app.api.routes import SummaryResponse
+from app.core.config import RESPONSE_GZIP_LEVEL
+from app.services.book_service import BookService
+from benchmarks.stubs import make_book_text
+
+MAX_CHARS_PER_PAGE = 3000
+SUMMARY = "Key plot points: the crew sets sail and the captain grows suspicious. " * 8
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 200, 1000], help="Pages summarized up to")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per measurement (best is reported)")
+    args = parser.parse_args()
+
+    text = make_book_text((max(args.pages) + 10) * MAX_CHARS_PER_PAGE, chapters=50)
+    page_index = BookService.build_page_index(text, MAX_CHARS_PER_PAGE)
+    for page in args.pages:
+        base = {
+            "summary": SUMMARY,
+            "book_title": "A Synthetic Voyage",
+            "author": "Benchmark, A.",
+            "page_number": page,
+            "start_page": 1,
+            "original_text_url": f"/api/books/1/pages?from=1&to={page}",
+            "cached": True,
+        }
+        variants = {"inline": {**base, "original_text": page_index.extract(text, 1, page)}, "linked": base}
+        for name, fields in variants.items():
+            body = SummaryResponse(**fields).model_dump_json().encode("utf-8")
+            seconds = _best_of(lambda: SummaryResponse(**fields).model_dump_json(), args.repeat)
+            compressed = len(gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL))
+            compress_seconds = _best_of(lambda: gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL), args.repeat)
+            print(
+                f"page={page:>5}  {name:<6}  json={len(body) / 1024:9.1f}KB  gzip={compressed / 1024:8.1f}KB  "
+                f"serialize={seconds * 1000:7.2f}ms  compress={compress_seconds * 1000:7.2f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark process startup: importing the app and warming up its caches.
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup [--repeat 3] [--budget]
+
+Each measurement runs in a fresh interpreter, so nothing is already imported:
+  - import: wall time of `import app.main`
+  - app modules: self time of the app's own modules under `python -X importtime`
+    (the rest is FastAPI, pydantic, httpx and the standard library), with the
+    slowest of them listed
+  - ready: time from the start of the lifespan until GET /ready would answer
+    200, with empty caches in a temporary CACHE_DIR
+
+With --budget it exits with status 1 when a measurement exceeds its budget
+below. app/tests/test_startup.py enforces the same budgets.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budgets in seconds, generous enough for a loaded CI machine
+IMPORT_BUDGET_SECONDS = 2.0
+APP_IMPORT_BUDGET_SECONDS = 0.25
+READY_BUDGET_SECONDS = 1.0
+
+_IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import app.main
+print(time.perf_counter() - start)
+"""
+
+_READY_SCRIPT = """
+import asyncio, json, time
+from app.main import app
+from app.services.readiness import get_readiness
+
+async def main():
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        readiness = get_readiness()
+        while readiness.status == "starting":
+            await asyncio.sleep(0.001)
+        print(json.dumps({"seconds": time.perf_counter() - start, **readiness.snapshot()}))
+
+asyncio.run(main())
+"""
+
+
+def _run(args: List[str], env: Dict[str, str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+
+
+def _environment(cache_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    env["CACHE_DIR"] = cache_dir
+    env["LLM_BACKEND"] = "fake"
+    env["PREFETCH_ENABLED"] = "false"
+    return env
+
+
+def app_import_times(stderr: str) -> List[Tuple[str, float]]:
+    """
+    Get the self import time of each app module from `python -X importtime` output
+
+    Args:
+        stderr: The interpreter's standard error
+
+    Returns:
+        (module, seconds) pairs, slowest first
+    """
+    times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, module = [part.strip() for part in line[len("import time:"):].split("|")]
+        if module == "app" or module.startswith("app."):
+            times.append((module, int(self_us) / 1e6))
+    return sorted(times, key=lambda item: item[1], reverse=True)
+
+
+def measure_startup(repeat: int = 3) -> Dict[str, object]:
+    """
+    Measure startup in fresh interpreters, keeping the best of repeat runs
+
+    Args:
+        repeat: Runs per measurement
+
+    Returns:
+        import_seconds, app_import_seconds, ready_seconds, the slowest app
+        modules and the readiness checks of the last run
+    """
+    best = {"import_seconds": float("inf"), "app_import_seconds": float("inf"), "ready_seconds": float("inf")}
+    slowest: List[Tuple[str, float]] = []
+    checks: Dict[str, str] = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = _environment(cache_dir)
+            best["import_seconds"] = min(best["import_seconds"], float(_run(["-c", _IMPORT_SCRIPT], env).stdout))
+
+            times = app_import_times(_run(["-X", "importtime", "-c", "import app.main"], env).stderr)
+            app_seconds = sum(seconds for _, seconds in times)
+            if app_seconds < best["app_import_seconds"]:
+                best["app_import_seconds"] = app_seconds
+                slowest = times[:5]
+
+            ready = json.loads(_run(["-c", _READY_SCRIPT], env).stdout)
+            best["ready_seconds"] = min(best["ready_seconds"], ready["seconds"])
+            checks = ready["checks"]
+    return {**best, "slowest_app_modules": slowest, "checks": checks}
+
+
+def over_budget(result: Dict[str, object]) -> List[str]:
+    """
+    Get the measurements of measure_startup that exceed their budgets
+
+    Args:
+        result: The measure_startup result
+
+    Returns:
+        One message per exceeded budget
+    """
+    budgets = {
+        "import_seconds": IMPORT_BUDGET_SECONDS,
+        "app_import_seconds": APP_IMPORT_BUDGET_SECONDS,
+        "ready_seconds": READY_BUDGET_SECONDS,
+    }
+    return [
+        f"{name} = {result[name]:.3f}s is over its {budget:.2f}s budget"
+        for name, budget in budgets.items() if result[name] > budget
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    parser.add_argument("--budget", action="store_true", help="Exit with status 1 when over a budget")
+    args = parser.parse_args()
+
+    result = measure_startup(args.repeat)
+    print(f"import app.main      {result['import_seconds'] * 1000:8.1f}ms  (budget {IMPORT_BUDGET_SECONDS * 1000:.0f}ms)")
+    print(f"  app modules        {result['app_import_seconds'] * 1000:8.1f}ms  (budget {APP_IMPORT_BUDGET_SECONDS * 1000:.0f}ms)")
+    for module, seconds in result["slowest_app_modules"]:
+        print(f"    {module:<32} {seconds * 1000:6.1f}ms")
+    print(f"lifespan to ready    {result['ready_seconds'] * 1000:8.1f}ms  (budget {READY_BUDGET_SECONDS * 1000:.0f}ms)")
+    for name, check in result["checks"].items():
+        print(f"    {name:<32} {check}")
+
+    problems = over_budget(result)
+    for problem in problems:
+        print(problem)
+    if args.budget and problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
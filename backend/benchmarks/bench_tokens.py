@@ -0,0 +1,64 @@
+"""
+Benchmark token estimation on whole synthetic books.
+
+Run from the backend directory:
+    python -m benchmarks.bench_tokens --sizes 1 10 50
+
+For each size this reports the throughput of counting the whole book at once
+and page by page (as BookService.get_page_index does), the cost of budgeting a
+prompt from the stored estimates, and how the heuristic compares with the old
+four-characters-per-token rule. When tiktoken is installed its throughput and
+counts are reported too.
+"""
+import argparse
+import time
+
+from app.services.book_service import BookService
+from app.services.tokens import HeuristicTokenizer, TiktokenTokenizer, count_page_tokens
+from benchmarks.stubs import make_book_text
+
+MAX_CHARS_PER_PAGE = 3000
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50], help="Book sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement (best is reported)")
+    args = parser.parse_args()
+
+    tokenizers = [HeuristicTokenizer()]
+    try:
+        tokenizers.append(TiktokenTokenizer())
+    except ImportError:
+        print("tiktoken is not installed; reporting the heuristic estimator only")
+
+    for size_mb in args.sizes:
+        text = make_book_text(size_mb * 1_000_000, chapters=max(size_mb * 20, 20))
+        page_index = BookService.build_page_index(text, MAX_CHARS_PER_PAGE)
+        for tokenizer in tokenizers:
+            whole = _best_of(lambda: tokenizer.count(text), args.repeat)
+            per_page = _best_of(lambda: count_page_tokens(text, page_index, tokenizer), args.repeat)
+            page_index.set_page_tokens(count_page_tokens(text, page_index, tokenizer), tokenizer.name)
+            budget = _best_of(lambda: page_index.pages_within(1, 3000), args.repeat)
+            tokens = tokenizer.count(text)
+            print(
+                f"{size_mb:>4} MB  {tokenizer.name:<16} tokens={tokens:>10}  "
+                f"chars/token={len(text) / tokens:4.2f}  "
+                f"whole={whole * 1000:8.1f}ms ({len(text) / whole / 1e6:5.0f} MB/s)  "
+                f"per_page={per_page * 1000:8.1f}ms ({len(page_index) / per_page:9.0f} pages/s)  "
+                f"pages_within={budget * 1e6:5.1f}us"
+            )
+        print(f"{size_mb:>4} MB  {'chars/4':<16} tokens={(len(text) + 3) // 4:>10}")
+
+
+if __name__ == "__main__":
+    main()
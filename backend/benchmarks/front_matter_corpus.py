@@ -0,0 +1,86 @@
+"""
+Synthetic Gutenberg-style books with known content start offsets.
+
+Each variant reproduces a front-matter layout seen in real Project Gutenberg
+texts: tables of contents, prefaces, dedications, roman numeral headings,
+BOOK/CHAPTER nesting and books without chapter headings.
+"""
+import random
+from typing import List, Tuple
+
+_WORDS = (
+    "she walked along the quiet lane towards the house where her brother had "
+    "promised to wait for news of the voyage and the letters from abroad"
+).split()
+
+
+def _prose(rng: random.Random, chars: int) -> str:
+    parts, written = [], 0
+    while written < chars:
+        sentence = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(10, 22))).capitalize() + ". "
+        if rng.random() < 0.2:
+            sentence += "\n\n"
+        parts.append(sentence)
+        written += len(sentence)
+    return "".join(parts)
+
+
+def _wrap(text: str, width: int = 70) -> str:
+    lines, line = [], ""
+    for word in text.split(" "):
+        if len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    lines.append(line)
+    return "\n".join(lines)
+
+
+def _book(rng: random.Random, front: str, headings: List[str], chapter_chars: int) -> Tuple[str, int]:
+    header = "The Project Gutenberg eBook of A Test\n\n*** START OF THE PROJECT GUTENBERG EBOOK A TEST ***\n\n\n"
+    parts = [header, front]
+    content_start = len(header) + len(front)
+    for heading in headings:
+        parts.append(f"{heading}\n\n\n")
+        parts.append(_wrap(_prose(rng, chapter_chars)) + "\n\n\n\n")
+    parts.append("*** END OF THE PROJECT GUTENBERG EBOOK A TEST ***\n\nSection 1. General Terms of Use and Redistributing\n")
+    return "".join(parts), content_start
+
+
+def make_corpus(seed: int = 0, chapter_chars: int = 20_000) -> List[Tuple[str, str, int]]:
+    """
+    Build the benchmark corpus
+
+    Returns:
+        List of (variant name, book text, content start offset)
+    """
+    rng = random.Random(seed)
+    numerals = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII"]
+    preface = "PREFACE\n\n\n" + _wrap(_prose(rng, 4000)) + "\n\n\n\n"
+    dedication = "TO MY DEAR SISTER\n\nTHIS BOOK IS DEDICATED\n\n\n\n"
+    corpus = []
+
+    headings = [f"CHAPTER {i}. A Quiet Lane" for i in range(1, 9)]
+    toc = "CONTENTS\n\n" + "\n".join(headings) + "\n\n\n\n"
+    corpus.append(("numbered-toc", *_book(rng, "A TEST\n\nBy A. Author\n\n\n" + toc, headings, chapter_chars)))
+
+    headings = [f"CHAPTER {n}." for n in numerals]
+    toc = "CONTENTS\n\n" + "\n\n".join(f"{h}     The Letters" for h in headings) + "\n\n\n\n"
+    corpus.append(("roman-spaced-toc-preface", *_book(rng, toc + dedication + preface, headings, chapter_chars)))
+
+    headings = numerals
+    corpus.append(("bare-roman", *_book(rng, "A TEST\n\nBy A. Author\n\n\n" + dedication, headings, chapter_chars)))
+
+    headings = ["BOOK ONE\n\nCHAPTER 1"] + [f"CHAPTER {i}" for i in range(2, 8)]
+    corpus.append(("book-and-chapter", *_book(rng, "A TEST\n\n\n" + preface, headings, chapter_chars)))
+
+    headings = [f"Chapter {i}: The Journey" for i in range(1, 8)]
+    toc = "Table of Contents\n\n" + "\n".join(headings) + "\n\n\n"
+    corpus.append(("mixed-case", *_book(rng, toc + "Introduction\n\n" + _wrap(_prose(rng, 3000)) + "\n\n\n", headings, chapter_chars)))
+
+    text, start = _book(rng, "A TEST\n\nBy A. Author\n\n\n", [""], chapter_chars * 4)
+    # No headings: the content starts with the first paragraph of prose
+    start = text.index("\n\n\n", start) + 3 if text[start:start + 3] == "\n\n\n" else start
+    corpus.append(("no-headings", text, start))
+    return corpus
@@ -0,0 +1,260 @@
+"""
+Local stand-ins for gutendex, the Gutenberg text mirror and Ollama.
+
+All three are served by a single threaded stdlib HTTP server so benchmarks
+can run offline without extra dependencies.
+"""
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+_WORDS = (
+    "the ship sailed across a grey and restless sea while the captain watched "
+    "his crew with quiet suspicion and the old harpooner sharpened his iron"
+).split()
+
+
+def make_book_text(size_chars: int, seed: int = 0, chapters: int = 20) -> str:
+    """
+    Build a deterministic synthetic Gutenberg-style book
+
+    Args:
+        size_chars: Approximate size of the book in characters
+        seed: Random seed for the generated prose
+        chapters: Number of chapters to spread the prose over
+
+    Returns:
+        Book text with Gutenberg boilerplate, a table of contents and chapters
+    """
+    rng = random.Random(seed)
+    header = (
+        "The Project Gutenberg eBook of A Synthetic Voyage\n\n"
+        "*** START OF THE PROJECT GUTENBERG EBOOK A SYNTHETIC VOYAGE ***\n\n\n"
+        "A SYNTHETIC VOYAGE\n\nBy A. Benchmark\n\n\nCONTENTS\n\n"
+        + "".join(f"CHAPTER {i}. The Voyage Continues\n" for i in range(1, chapters + 1))
+        + "\n\n\n"
+    )
+    footer = "\n\n*** END OF THE PROJECT GUTENBERG EBOOK A SYNTHETIC VOYAGE ***\n"
+    body_chars = max(size_chars - len(header) - len(footer), 0)
+    per_chapter = max(body_chars // chapters, 1)
+
+    parts = [header]
+    for chapter in range(1, chapters + 1):
+        parts.append(f"CHAPTER {chapter}. The Voyage Continues\n\n")
+        written = 0
+        while written < per_chapter:
+            sentence = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 20)))
+            line = sentence.capitalize() + ". "
+            if rng.random() < 0.15:
+                line += "\n\n"
+            parts.append(line)
+            written += len(line)
+        parts.append("\n\n\n")
+    parts.append(footer)
+    return "".join(parts)
+
+
+class StubConfig:
+    """Latency and content settings for the stub server"""
+
+    def __init__(
+        self,
+        gutendex_latency: float = 0.05,
+        text_latency: float = 0.1,
+        llm_latency: float = 1.0,
+        llm_tokens_per_second: Optional[float] = None,
+        book_size: int = 500_000,
+        content_start_page: int = 2,
+    ):
+        self.gutendex_latency = gutendex_latency
+        self.text_latency = text_latency
+        self.llm_latency = llm_latency
+        self.llm_tokens_per_second = llm_tokens_per_second
+        self.book_size = book_size
+        self.content_start_page = content_start_page
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._texts: Dict[int, bytes] = {}
+
+    def __getstate__(self) -> Dict:
+        # Sent to a StubProcess without the lock and the generated texts
+        state = dict(self.__dict__)
+        del state["_lock"]
+        state["_texts"] = {}
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def book_text(self, book_id: int) -> bytes:
+        with self._lock:
+            if book_id not in self._texts:
+                self._texts[book_id] = make_book_text(self.book_size, seed=book_id).encode("utf-8")
+            return self._texts[book_id]
+
+
+def _book_metadata(base_url: str, book_id: int) -> Dict:
+    return {
+        "id": book_id,
+        "title": f"Synthetic Book {book_id}",
+        "authors": [{"name": "A. Benchmark"}],
+        "formats": {"text/plain; charset=us-ascii": f"{base_url}/texts/{book_id}.txt"},
+    }
+
+
+def _make_handler(config: StubConfig):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Optional[Dict] = None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        @property
+        def base_url(self) -> str:
+            host, port = self.server.server_address[:2]
+            return f"http://{host}:{port}"
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            detail = re.fullmatch(r"/books/(\d+)/?", path)
+            text = re.fullmatch(r"/texts/(\d+)\.txt", path)
+            if path.rstrip("/") == "/books":
+                config.count("gutendex")
+                time.sleep(config.gutendex_latency)
+                results = [_book_metadata(self.base_url, i) for i in range(1, 33)]
+                self._send(200, json.dumps({"count": len(results), "results": results}).encode())
+            elif detail:
+                config.count("gutendex")
+                time.sleep(config.gutendex_latency)
+                self._send(200, json.dumps(_book_metadata(self.base_url, int(detail.group(1)))).encode())
+            elif text:
+                config.count("text")
+                time.sleep(config.text_latency)
+                body = config.book_text(int(text.group(1)))
+                etag = f'"{text.group(1)}-{len(body)}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", headers={"ETag": etag})
+                else:
+                    self._send(200, body, "text/plain; charset=utf-8", headers={"ETag": etag})
+            else:
+                self._send(404, b'{"detail": "Not found"}')
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if path != "/api/generate":
+                self._send(404, b'{"detail": "Not found"}')
+                return
+            config.count("llm")
+            prompt = payload.get("prompt", "")
+            if "first page of important text" in prompt:
+                answer = f"Page {config.content_start_page}"
+            else:
+                answer = "Key plot points: the voyage continues. " * 10
+            tokens = [word + " " for word in answer.split()]
+            token_delay = 1 / config.llm_tokens_per_second if config.llm_tokens_per_second else 0.0
+            if payload.get("stream"):
+                self._stream(payload.get("model"), tokens, config.llm_latency, token_delay)
+                return
+            time.sleep(config.llm_latency + token_delay * len(tokens))
+            self._send(200, json.dumps({
+                "model": payload.get("model"),
+                "response": answer,
+                "done": True,
+                "prompt_eval_count": len(prompt) // 4,
+                "eval_count": len(tokens),
+            }).encode())
+
+        def _stream(self, model: str, tokens, first_token_delay: float, token_delay: float):
+            """Send Ollama-style newline-delimited JSON chunks with chunked transfer encoding"""
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(first_token_delay)
+            chunks = [{"model": model, "response": token, "done": False} for token in tokens]
+            chunks.append({"model": model, "response": "", "done": True, "eval_count": len(tokens)})
+            for chunk in chunks:
+                data = (json.dumps(chunk) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+                time.sleep(token_delay)
+            self.wfile.write(b"0\r\n\r\n")
+
+    return StubHandler
+
+
+class StubServer:
+    """Context manager running the stub server on a background thread"""
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubConfig()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self.config))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _serve_stub(config: StubConfig, host: str, conn) -> None:
+    server = StubServer(config, host)
+    conn.send(server.url)
+    server._server.serve_forever()
+
+
+class StubProcess:
+    """
+    Context manager running the stub server in a child process
+
+    Keeps the stubs' request handling (and the generated book texts) out of the
+    process being measured, so they do not compete for its GIL or add to its RSS.
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1"):
+        self.config = config or StubConfig()
+        self.host = host
+        self.url = ""
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self._conn = parent_conn
+        self._process = multiprocessing.Process(target=_serve_stub, args=(self.config, host, child_conn), daemon=True)
+
+    def __enter__(self) -> "StubProcess":
+        self._process.start()
+        self.url = self._conn.recv()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._process.terminate()
+        self._process.join()
@@ -36,6 +36,21 @@ const bookApi = {
     }
   },
 
+  /**
+   * Get the text of the pages a summary was generated from
+   * @param {string} pagesUrl - The original_text_url of a summary response
+   * @returns {Promise} Promise object with the page text
+   */
+  getPageText: async (pagesUrl) => {
+    try {
+      const response = await axios.get(`${API_URL}${pagesUrl}`, { responseType: 'text' });
+      return response.data;
+    } catch (error) {
+      console.error('Error fetching pages:', error);
+      throw error;
+    }
+  },
+
   /**
    * Request a summary of a book up to a specific page
    * @param {number} bookId - The ID of the book
@@ -55,6 +70,71 @@ const bookApi = {
       console.error('Error summarizing book:', error);
       throw error;
     }
+  },
+
+  /**
+   * Stream a summary of a book up to a specific page (Server-Sent Events)
+   * @param {number} bookId - The ID of the book
+   * @param {number} pageNumber - The page number to summarize up to
+   * @param {string} textUrl - Optional URL to the plain text version of the book
+   * @param {Object} handlers - onProgress(stage), onToken(text) and onDone(summary) callbacks
+   * @returns {Promise} Promise object with the final summary response
+   */
+  streamSummary: async (bookId, pageNumber, textUrl = null, handlers = {}) => {
+    const { onProgress, onToken, onDone } = handlers;
+    const response = await fetch(`${API_URL}/api/summarize/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        book_id: bookId,
+        page_number: pageNumber,
+        text_url: textUrl
+      })
+    });
+    if (!response.ok) {
+      throw new Error(`Error streaming summary: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result = null;
+
+    // Each event is "event: <name>\ndata: <json>" terminated by a blank line
+    const handleEvent = (rawEvent) => {
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+          data += line.slice(5).trim();
+        }
+      }
+      const payload = data ? JSON.parse(data) : {};
+      if (event === 'progress' && onProgress) {
+        onProgress(payload);
+      } else if (event === 'token' && onToken) {
+        onToken(payload.text);
+      } else if (event === 'done') {
+        result = payload;
+        if (onDone) onDone(payload);
+      } else if (event === 'error') {
+        throw new Error(payload.detail);
+      }
+    };
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        handleEvent(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+      }
+    }
+    return result;
   }
 };
 
@@ -2,6 +2,15 @@ import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import bookApi from '../api/bookApi';
 
+// Progress events arrive as each stage finishes, so label the work that follows it
+const STAGE_LABELS = {
+  metadata: 'Downloading book text...',
+  download: 'Splitting the book into pages...',
+  pagination: 'Finding where the story starts...',
+  front_matter: 'Writing the summary...',
+  summary: 'Writing the summary...'
+};
+
 const BookDetailPage = () => {
   const { bookId } = useParams();
   const navigate = useNavigate();
@@ -12,6 +21,7 @@ const BookDetailPage = () => {
   const [summarizing, setSummarizing] = useState(false);
   const [summary, setSummary] = useState(null);
   const [originalText, setOriginalText] = useState(null);
+  const [progressStage, setProgressStage] = useState(null);
 
   useEffect(() => {
     const loadBookDetails = async () => {
@@ -39,6 +49,7 @@ const BookDetailPage = () => {
       setSummarizing(true);
       setSummary(null);
       setOriginalText(null);
+      setProgressStage(null);
       
       // Find text URL if available
       let textUrl = null;
@@ -51,18 +62,34 @@ const BookDetailPage = () => {
         }
       }
       
-      const summaryData = await bookApi.summarizeBook(bookId, pageNumber, textUrl);
+      // Show each pipeline stage and the summary as it is generated
+      const summaryData = await bookApi.streamSummary(bookId, pageNumber, textUrl, {
+        onProgress: ({ stage }) => setProgressStage(stage),
+        onToken: (text) => setSummary((current) => ({
+          book_title: book.title,
+          author: book.authors && book.authors.length > 0 ? book.authors[0].name : 'Unknown',
+          page_number: pageNumber,
+          ...current,
+          summary: ((current && current.summary) || '') + text
+        }))
+      });
       setSummary(summaryData);
+      setProgressStage(null);
       
-      // Store the original text if it's provided in the response
+      // The summarized text is not inlined in the response; fetch it from its pages URL
       if (summaryData.original_text) {
         setOriginalText(summaryData.original_text);
+      } else if (summaryData.original_text_url) {
+        bookApi.getPageText(summaryData.original_text_url)
+          .then(setOriginalText)
+          .catch((err) => console.error('Error loading original text:', err));
       }
       
       setSummarizing(false);
     } catch (err) {
       setError('Failed to generate summary. Please try again later.');
       setSummarizing(false);
+      setProgressStage(null);
       console.error('Error generating summary:', err);
     }
   };
@@ -200,6 +227,9 @@ const BookDetailPage = () => {
                 )}
                 </button>
               </div>
+              {summarizing && progressStage && (
+                <p className="mt-2 text-sm text-gray-500">{STAGE_LABELS[progressStage] || progressStage}</p>
+              )}
             </div>
           </div>
         </div>